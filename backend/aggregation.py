@@ -0,0 +1,221 @@
+"""Grouped aggregates over a form's submissions or a view's rows, in one SQL query.
+
+A request names group-by fields (field keys for forms, column ids for views) and
+metrics, and only the aggregated rows come back:
+
+    {"groupBy": ["status"], "metrics": [{"op": "count"}, {"op": "sum", "field": "amount"}]}
+    -> [{"group": {"status": "open"}, "values": {"count": 3, "sum_amount": {"amount": 42.5, "currency": "USD"}}}]
+
+Metrics are count (rows, or non-empty values when a field is given), count_distinct,
+sum, avg, min and max. Values are read the way filters read them: numbers, numeric
+strings and currency `amount`s count as numbers, and empty values are skipped.
+
+Currency fields group by their currency code, and sum/avg/min/max over one return
+`{"amount", "currency"}`; when a group mixes currencies both are null, so group by
+the field to get one row per currency. Form fields listed in
+`settings.projectedFields` are read from their typed `SubmissionProjection` columns
+(see projections.py), except while a background refresh of the form may still be
+filling them in (form_refresh.refresh_pending). View aggregates run over the view's relation joins and cover
+every row, not just the `maxRows` the data endpoint returns.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import sqlalchemy as sa
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+from sqlmodel import Session
+
+from form_refresh import refresh_pending
+from form_schema import column_storage_keys, schema_field
+from jsonb_filters import is_empty, json_get, json_text, json_value, numeric_value, parse_filters
+from models import Form, Submission, SubmissionProjection
+from projections import PROJECTION_KINDS, projected_fields
+from view_engine import CompiledView
+
+AGGREGATE_OPS = ("count", "count_distinct", "sum", "avg", "min", "max")
+MAX_GROUPS = 5000
+
+submission_table = Submission.__table__
+projection_table = SubmissionProjection.__table__
+
+
+class Metric(BaseModel):
+    op: str
+    field: Optional[str] = None
+    # Key of the metric in each result row's "values"; defaults to "count" or "<op>_<field>".
+    alias: Optional[str] = None
+
+
+class AggregateRequest(BaseModel):
+    groupBy: List[str] = Field(default_factory=list)
+    metrics: List[Metric] = Field(default_factory=lambda: [Metric(op="count")])
+    # Same `key:operator[:value]` strings as the `filter` query parameter of the list endpoints.
+    filter: List[str] = Field(default_factory=list)
+    limit: int = Field(MAX_GROUPS, ge=1, le=MAX_GROUPS)
+
+
+class _Source:
+    """One field or column to aggregate: its JSONB value, schema field and typed projection row."""
+
+    def __init__(self, value: Any, field: Optional[dict], projection: Any = None):
+        self.value = value
+        self.field = field
+        self.projection = projection
+
+    @property
+    def type(self) -> Optional[str]:
+        return (self.field or {}).get("type")
+
+    @property
+    def is_currency(self) -> bool:
+        return self.type == "currency"
+
+    @property
+    def is_number(self) -> bool:
+        return PROJECTION_KINDS.get(self.type) == "number"
+
+    def number(self) -> Any:
+        if self.projection is not None:
+            return self.projection.c.number_value
+        return numeric_value(self.value)
+
+    def currency(self) -> Any:
+        if self.projection is not None:
+            return self.projection.c.currency
+        code = json_get(self.value, "currency")
+        return sa.case(
+            (sa.and_(sa.func.jsonb_typeof(self.value) == "object", sa.func.jsonb_typeof(code) == "string"), json_text(code)),
+            else_=sa.null(),
+        )
+
+    def group(self) -> Any:
+        return self.currency() if self.is_currency else self.value
+
+    def ordered(self) -> Any:
+        """Value for min/max: numeric for number-like fields, the date for projected dates, else text."""
+        if self.is_number:
+            return self.number()
+        if self.projection is not None and PROJECTION_KINDS.get(self.type) == "date":
+            return self.projection.c.date_value
+        return sa.case((sa.not_(is_empty(self.value)), json_text(self.value)), else_=sa.null())
+
+
+def _metric_name(metric: Metric) -> str:
+    if metric.alias:
+        return metric.alias
+    return f"{metric.op}_{metric.field}" if metric.field else metric.op
+
+
+def _metric_columns(metric: Metric, source: Optional[_Source], label: str) -> List[Any]:
+    if metric.op == "count":
+        if source is None:
+            return [sa.func.count().label(label)]
+        return [sa.func.count().filter(sa.not_(is_empty(source.value))).label(label)]
+    if source is None:
+        raise HTTPException(status_code=400, detail=f"Metric '{metric.op}' requires a field")
+    if metric.op == "count_distinct":
+        return [sa.func.count(sa.distinct(source.value)).filter(sa.not_(is_empty(source.value))).label(label)]
+    if metric.op in ("sum", "avg"):
+        value = getattr(sa.func, metric.op)(source.number())
+    else:
+        value = getattr(sa.func, metric.op)(source.ordered())
+    columns = [value.label(label)]
+    if source.is_currency:
+        columns.append(sa.func.count(sa.distinct(source.currency())).label(f"{label}_n"))
+        columns.append(sa.func.min(source.currency()).label(f"{label}_c"))
+    return columns
+
+
+def _aggregate(
+    session: Session,
+    from_clause: Any,
+    conditions: List[Any],
+    groups: List[Tuple[str, _Source]],
+    metrics: List[Tuple[Metric, Optional[_Source]]],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    group_exprs = [source.group().label(f"g{i}") for i, (_, source) in enumerate(groups)]
+    columns: List[Any] = list(group_exprs)
+    names: List[str] = []
+    for i, (metric, source) in enumerate(metrics):
+        name = _metric_name(metric)
+        if name in names:
+            raise HTTPException(status_code=400, detail=f"Duplicate metric name '{name}'")
+        names.append(name)
+        columns.extend(_metric_columns(metric, source, f"m{i}"))
+
+    statement = sa.select(*columns).select_from(from_clause).where(*conditions)
+    if group_exprs:
+        positions = [sa.literal_column(str(i + 1)) for i in range(len(group_exprs))]
+        statement = statement.group_by(*positions).order_by(*positions)
+    statement = statement.limit(limit)
+
+    rows = []
+    for record in session.connection().execute(statement).mappings():
+        values: Dict[str, Any] = {}
+        for i, (metric, source) in enumerate(metrics):
+            value = record[f"m{i}"]
+            if source is not None and source.is_currency and metric.op not in ("count", "count_distinct"):
+                mixed = record[f"m{i}_n"] > 1
+                value = {"amount": None if mixed else value, "currency": None if mixed else record[f"m{i}_c"]}
+            values[names[i]] = value
+        rows.append({"group": {name: record[f"g{i}"] for i, (name, _) in enumerate(groups)}, "values": values})
+    return rows
+
+
+def _check(request: AggregateRequest) -> None:
+    for metric in request.metrics:
+        if metric.op not in AGGREGATE_OPS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported metric '{metric.op}'; expected one of {', '.join(AGGREGATE_OPS)}",
+            )
+
+
+def aggregate_form(session: Session, form: Form, request: AggregateRequest, conditions: Sequence[Any]) -> List[Dict[str, Any]]:
+    """Aggregate the submissions of `form` matching `conditions` (see forms_router._filter_conditions)."""
+    _check(request)
+    schema = form.schema_ or []
+    # Until a refresh completes, newly projected fields have no projection rows yet.
+    projected = {} if refresh_pending(form.id) else {p["field_key"]: p for p in projected_fields(schema, form.settings)}
+    sources: Dict[str, _Source] = {}
+    joins: List[Tuple[Any, str]] = []
+
+    def source(key: str) -> _Source:
+        if key not in sources:
+            projection = None
+            if key in projected:
+                projection = projection_table.alias(f"p{len(joins)}")
+                joins.append((projection, key))
+            value = json_value(submission_table.c.data, column_storage_keys(schema, key))
+            sources[key] = _Source(value, schema_field(schema, key), projection)
+        return sources[key]
+
+    groups = [(key, source(key)) for key in request.groupBy]
+    metrics = [(metric, source(metric.field) if metric.field else None) for metric in request.metrics]
+    from_clause: Any = submission_table
+    for projection, key in joins:
+        from_clause = from_clause.outerjoin(
+            projection,
+            sa.and_(projection.c.submission_id == submission_table.c.id, projection.c.field_key == key),
+        )
+    where = [submission_table.c.form_id == form.id, *conditions]
+    return _aggregate(session, from_clause, where, groups, metrics, request.limit)
+
+
+def aggregate_view(session: Session, compiled: Optional[CompiledView], request: AggregateRequest) -> List[Dict[str, Any]]:
+    """Aggregate every row of a compiled view (relation joins included) matching the request's filters."""
+    _check(request)
+    if compiled is None:
+        return []
+
+    def source(col_id: str) -> _Source:
+        if col_id not in compiled.column_exprs:
+            raise HTTPException(status_code=400, detail=f"Unknown view column '{col_id}'")
+        return _Source(compiled.column_exprs[col_id], compiled.column_fields.get(col_id))
+
+    groups = [(col_id, source(col_id)) for col_id in request.groupBy]
+    metrics = [(metric, source(metric.field) if metric.field else None) for metric in request.metrics]
+    conditions = compiled.conditions(parse_filters(request.filter))
+    return _aggregate(session, compiled.from_clause, conditions, groups, metrics, request.limit)
@@ -0,0 +1,28 @@
+"""Add (form_id, created_at, id) index on submission for keyset pagination
+
+Revision ID: 0006_submission_form_created
+Revises: 0005_add_form_description
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_submission_form_created"
+down_revision: Union[str, None] = "0005_add_form_description"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_submission_form_id_created_at_id",
+        "submission",
+        ["form_id", "created_at", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_submission_form_id_created_at_id", table_name="submission")
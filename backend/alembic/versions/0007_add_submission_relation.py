@@ -0,0 +1,68 @@
+"""Add submissionrelation edge index for view joins, backfilled from submission data
+
+Revision ID: 0007_submission_relation
+Revises: 0006_submission_form_created
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_submission_relation"
+down_revision: Union[str, None] = "0006_submission_form_created"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "submissionrelation",
+        sa.Column("child_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("submission.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("field_id", sa.Text(), nullable=False),
+        sa.Column("parent_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("child_form_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.PrimaryKeyConstraint("child_id", "field_id", "parent_id"),
+    )
+    op.create_index(
+        "ix_submissionrelation_parent",
+        "submissionrelation",
+        ["parent_id", "child_form_id", "field_id", "child_id"],
+    )
+    # Same edge rules as relation_index.py, inlined so the migration stays fixed.
+    op.execute(
+        """
+        INSERT INTO submissionrelation (child_id, field_id, parent_id, child_form_id)
+        SELECT DISTINCT s.id, f.field_id, ref.parent_id::uuid, s.form_id
+        FROM form
+        CROSS JOIN LATERAL (
+            SELECT coalesce(nullif(fld->>'id', ''), fld->>'key') AS field_id,
+                   nullif(fld->>'id', '') AS id_key,
+                   fld->>'key' AS legacy_key
+            FROM jsonb_array_elements(CASE WHEN jsonb_typeof(form.schema_) = 'array' THEN form.schema_ ELSE '[]'::jsonb END) AS fld
+            WHERE (fld->>'type' = 'reference' OR fld->'dataSource'->>'type' = 'form_lookup')
+              AND coalesce(nullif(fld->>'id', ''), fld->>'key') IS NOT NULL
+        ) AS f
+        JOIN submission s ON s.form_id = form.id
+        CROSS JOIN LATERAL (
+            SELECT coalesce(nullif(s.data -> f.id_key, 'null'::jsonb), s.data -> f.legacy_key) AS value
+        ) AS raw
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(raw.value) = 'array' THEN raw.value ELSE jsonb_build_array(raw.value) END
+        ) AS element
+        CROSS JOIN LATERAL (
+            SELECT btrim(CASE WHEN jsonb_typeof(element.value) = 'object' THEN element.value->>'id'
+                              ELSE jsonb_build_array(element.value)->>0 END) AS parent_id
+        ) AS ref
+        WHERE ref.parent_id ~ '^[{]?[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}[}]?$'
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_submissionrelation_parent", table_name="submissionrelation")
+    op.drop_table("submissionrelation")
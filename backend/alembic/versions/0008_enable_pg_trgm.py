@@ -0,0 +1,39 @@
+"""Enable pg_trgm where available, for typeahead lookups
+
+Revision ID: 0008_pg_trgm
+Revises: 0007_submission_relation
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_pg_trgm"
+down_revision: Union[str, None] = "0007_submission_relation"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Optional: typeahead falls back to prefix matching when the extension is missing
+    # or the migration role may not create it.
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            END IF;
+        EXCEPTION WHEN insufficient_privilege THEN
+            RAISE NOTICE 'pg_trgm not enabled: insufficient privilege';
+        END
+        $$;
+        """
+    )
+
+
+def downgrade() -> None:
+    # Leave the extension in place: other objects may depend on it.
+    pass
@@ -0,0 +1,50 @@
+"""Add submissionprojection typed side table for projected form fields
+
+Revision ID: 0009_submission_projection
+Revises: 0008_pg_trgm
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_submission_projection"
+down_revision: Union[str, None] = "0008_pg_trgm"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # No backfill: projection is opt-in per form (settings.projectedFields), and
+    # setting it through the API rebuilds that form's rows.
+    op.create_table(
+        "submissionprojection",
+        sa.Column("submission_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("submission.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("field_key", sa.Text(), nullable=False),
+        sa.Column("form_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("number_value", sa.Numeric(), nullable=True),
+        sa.Column("date_value", sa.Date(), nullable=True),
+        sa.Column("bool_value", sa.Boolean(), nullable=True),
+        sa.Column("currency", sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint("submission_id", "field_key"),
+    )
+    op.create_index(
+        "ix_submissionprojection_number",
+        "submissionprojection",
+        ["form_id", "field_key", "number_value"],
+    )
+    op.create_index(
+        "ix_submissionprojection_date",
+        "submissionprojection",
+        ["form_id", "field_key", "date_value"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_submissionprojection_date", table_name="submissionprojection")
+    op.drop_index("ix_submissionprojection_number", table_name="submissionprojection")
+    op.drop_table("submissionprojection")
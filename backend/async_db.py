@@ -0,0 +1,93 @@
+"""Serve the routers from the async engine when `DB_ASYNC` is set.
+
+The route handlers are written against a sync `Session`. In async mode each handler,
+and each sync dependency that needs a session, runs on the event loop inside
+SQLAlchemy's `greenlet_spawn` with the `sync_session` of an `AsyncSession`. Every
+database call then awaits the async driver instead of blocking a threadpool thread,
+so a worker can keep many more requests in flight than it has threads. Handler code
+is the same in both modes; only async handlers that hand database work to a thread
+need `run_db` instead of `run_in_threadpool`.
+
+Streaming exports are unaffected: their bodies read through `exports.stream_rows`,
+which keeps using the sync engine from the threadpool.
+"""
+
+import functools
+import inspect
+from typing import Any, AsyncGenerator, Callable, Set
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.dependencies.models import Dependant
+from fastapi.dependencies.utils import get_dependant
+from fastapi.routing import APIRoute
+from sqlalchemy.util import greenlet_spawn
+from sqlmodel import Session
+
+from database import DB_ASYNC, get_async_session, get_session
+
+
+async def run_db(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run sync database code from an async handler: in a greenlet in async mode, else in the threadpool."""
+    if DB_ASYNC:
+        return await greenlet_spawn(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, *args, **kwargs)
+
+
+def in_greenlet(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Async wrapper running `fn` under `greenlet_spawn`; keeps `fn`'s signature for FastAPI."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await greenlet_spawn(fn, *args, **kwargs)
+
+    return wrapper
+
+
+async def get_greenlet_session() -> AsyncGenerator[Session, None]:
+    """Stand-in for `get_session` in async mode: the sync facade of a request's AsyncSession."""
+    async for session in get_async_session():
+        yield session.sync_session
+
+
+def _is_sync(call: Any) -> bool:
+    return not (inspect.iscoroutinefunction(call) or inspect.isasyncgenfunction(call))
+
+
+def _uses_session(dependant: Dependant) -> bool:
+    return any(d.call is get_session or _uses_session(d) for d in dependant.dependencies)
+
+
+def _collect_sync_dependencies(dependant: Dependant, found: Set[Callable[..., Any]]) -> None:
+    for sub in dependant.dependencies:
+        if sub.call is not None and sub.call is not get_session and _is_sync(sub.call) and _uses_session(sub):
+            found.add(sub.call)
+        _collect_sync_dependencies(sub, found)
+
+
+# Sync dependencies (other than get_session itself) that use a session, collected as
+# AsyncDBRoute instances are created; install_async_db overrides them.
+_session_dependencies: Set[Callable[..., Any]] = set()
+
+
+class AsyncDBRoute(APIRoute):
+    """Route class for routers whose handlers use `get_session`.
+
+    In async mode a sync endpoint that takes a session is wrapped with `in_greenlet`
+    before FastAPI builds the route from it, so the route keeps every setting it was
+    declared with. Outside async mode it is a plain APIRoute.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        if DB_ASYNC and _is_sync(endpoint) and _uses_session(get_dependant(path=path, call=endpoint)):
+            endpoint = in_greenlet(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+        if DB_ASYNC:
+            _collect_sync_dependencies(self.dependant, _session_dependencies)
+
+
+def install_async_db(app: FastAPI) -> None:
+    """Serve `get_session` from the async engine; routers must use `route_class=AsyncDBRoute`."""
+    app.dependency_overrides[get_session] = get_greenlet_session
+    for call in _session_dependencies:
+        app.dependency_overrides[call] = in_greenlet(call)
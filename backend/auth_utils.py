@@ -1,13 +1,19 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 import os
-from typing import Optional
+from typing import Any, Dict, Optional
+from uuid import UUID
+import sqlalchemy as sa
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from sqlmodel import Session, select
-from database import get_session
+from database import engine, get_session
 from models import User
+from cache import CacheBackend, TTLCache
+import metrics
+from password_hashing import hash_password, pwd_context
 
 # SECRET_KEY should be in env vars in production
 # Prefer env var, fall back to a development key for local runs
@@ -16,9 +22,17 @@ SECRET_KEY: str = cast(str, os.getenv("SECRET_KEY") or "development_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
+# Authenticated requests resolve `sub` -> CurrentUser through this cache instead of querying the
+# user table every time. Entries never outlive the token they were loaded for.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+
+_user_cache: CacheBackend = TTLCache(max_size=USER_CACHE_MAX_SIZE)
+_user_cache_requests = metrics.counter("user_cache_requests_total", "get_current_user cache lookups by result (hit/miss)")
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# Synchronous hashing for scripts; request handlers use password_hashing's async helpers.
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -37,7 +51,103 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(request: Request, session: Session = Depends(get_session)):
+def set_user_cache_backend(backend: CacheBackend) -> None:
+    """Swap the user cache, e.g. for a backend shared between worker processes."""
+    global _user_cache
+    _user_cache = backend
+
+
+def _user_cache_key(email: str) -> str:
+    return f"user:{email}"
+
+
+def invalidate_user(email: Optional[str]) -> None:
+    if email:
+        _user_cache.delete(_user_cache_key(email))
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """The authenticated user as handlers see it: read-only and not attached to any session.
+
+    It is deliberately not a `User` table model, so it can never be added or merged into
+    a session and write back over the stored row (e.g. its password hash). Load the
+    `User` row explicitly to change an account.
+    """
+
+    id: UUID
+    email: str
+    name: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+def _current_user(user: User) -> CurrentUser:
+    return CurrentUser(id=user.id, email=user.email, name=user.name, created_at=user.created_at)
+
+
+def _cached_user_fields(user: CurrentUser) -> Dict[str, Any]:
+    # The password hash is never part of a CurrentUser, so it stays out of the cache.
+    return {
+        "id": str(user.id),
+        "email": user.email,
+        "name": user.name,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+    }
+
+
+def _user_from_cache(fields: Dict[str, Any]) -> CurrentUser:
+    created_at = fields.get("created_at")
+    return CurrentUser(
+        id=UUID(fields["id"]),
+        email=fields["email"],
+        name=fields.get("name"),
+        created_at=datetime.fromisoformat(created_at) if created_at else None,
+    )
+
+
+def user_cache_hit_rate() -> Optional[float]:
+    hits = _user_cache_requests.value(result="hit")
+    total = hits + _user_cache_requests.value(result="miss")
+    return hits / total if total else None
+
+
+@sa.event.listens_for(User, "after_update")
+@sa.event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: User) -> None:
+    invalidate_user(target.email)
+    # An email change leaves the entry under the old address behind.
+    history = sa.inspect(target).attrs.email.history
+    for old_email in history.deleted or ():
+        invalidate_user(old_email)
+
+
+async def rehash_password(email: str, password: str, old_hash: str) -> None:
+    """Replace a stale hash after a successful login (run as a background task).
+
+    The new hash is only written if the stored one is still `old_hash`, so a password
+    changed in the meantime is not overwritten.
+    """
+    try:
+        new_hash = await hash_password(password)
+    except HTTPException:
+        return  # pool saturated; the next login tries again
+
+    def store() -> int:
+        with engine.begin() as conn:
+            table = User.__table__
+            result = conn.execute(
+                sa.update(table)
+                .where(table.c.email == email, table.c.hashed_password == old_hash)
+                .values(hashed_password=new_hash)
+            )
+            return result.rowcount
+
+    # Core UPDATE skips the ORM after_update hook, so invalidate explicitly.
+    if await run_in_threadpool(store):
+        invalidate_user(email)
+
+
+def get_current_user(request: Request, session: Session = Depends(get_session)) -> CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -64,8 +174,22 @@ async def get_current_user(request: Request, session: Session = Depends(get_sess
     except JWTError:
         raise credentials_exception
 
+    cache_key = _user_cache_key(email)
+    cached = _user_cache.get(cache_key)
+    if cached is not None:
+        _user_cache_requests.inc(result="hit")
+        return _user_from_cache(cached)
+    _user_cache_requests.inc(result="miss")
+
     statement = select(User).where(User.email == email)
     user = session.exec(statement).first()
     if user is None:
         raise credentials_exception
-    return user
+
+    ttl = USER_CACHE_TTL_SECONDS
+    expires = payload.get("exp")
+    if isinstance(expires, (int, float)):
+        ttl = min(ttl, expires - datetime.now(timezone.utc).timestamp())
+    current_user = _current_user(user)
+    _user_cache.set(cache_key, _cached_user_fields(current_user), ttl)
+    return current_user
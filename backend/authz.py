@@ -0,0 +1,158 @@
+"""Ownership checks for projects, forms, views and submissions.
+
+A resource is resolved to its project owner with one joined query, and the
+(resource id -> project id, owner id) result is cached, so checking a request
+usually needs no round-trip. Projects never change owner and forms/views never change
+project, so entries only have to be dropped when rows are deleted, which the mapper
+events at the bottom of this module take care of (ORM cascades included).
+
+Use the `require_*_owner` dependencies in place of `get_current_user` on routes whose
+path carries the resource id; they return the current user once the check passes.
+"""
+
+import os
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+from fastapi import Depends, HTTPException
+from sqlmodel import Session, select
+
+from auth_utils import CurrentUser, get_current_user
+from cache import CacheBackend, TTLCache
+from database import get_session
+from models import Form, Project, Submission, View
+
+OWNER_CACHE_TTL_SECONDS = float(os.getenv("AUTHZ_CACHE_TTL_SECONDS", "300"))
+OWNER_CACHE_MAX_SIZE = int(os.getenv("AUTHZ_CACHE_MAX_SIZE", "50000"))
+
+_owner_cache: CacheBackend = TTLCache(max_size=OWNER_CACHE_MAX_SIZE)
+
+
+def set_owner_cache_backend(backend: CacheBackend) -> None:
+    global _owner_cache
+    _owner_cache = backend
+
+
+def _cache_key(kind: str, resource_id: Any) -> str:
+    return f"owner:{kind}:{resource_id}"
+
+
+def invalidate(kind: str, resource_id: Any) -> None:
+    _owner_cache.delete(_cache_key(kind, resource_id))
+
+
+def _resolve(kind: str, resource_id: UUID, statement: Any, session: Session) -> Optional[Dict[str, Optional[str]]]:
+    """Cached {project_id, owner_id[, form_id]} for a resource, or None if it does not exist.
+
+    A missing project (owner_id None) is not cached.
+    """
+    key = _cache_key(kind, resource_id)
+    cached = _owner_cache.get(key)
+    if cached is not None:
+        return cached
+
+    row = session.exec(statement).first()
+    if row is None:
+        return None
+    resolved = {name: (str(value) if value is not None else None) for name, value in row._mapping.items()}
+    if resolved.get("owner_id") is not None:
+        _owner_cache.set(key, resolved, OWNER_CACHE_TTL_SECONDS)
+    return resolved
+
+
+def _check_owner(resolved: Optional[Dict[str, Optional[str]]], user: CurrentUser, not_found: str) -> Dict[str, Optional[str]]:
+    if resolved is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    if resolved.get("owner_id") is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if resolved["owner_id"] != str(user.id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return resolved
+
+
+def authorize_project(session: Session, user: CurrentUser, project_id: UUID) -> None:
+    statement = select(Project.id.label("project_id"), Project.owner_id).where(Project.id == project_id)
+    _check_owner(_resolve("project", project_id, statement, session), user, "Project not found")
+
+
+def authorize_form(session: Session, user: CurrentUser, form_id: UUID) -> None:
+    statement = (
+        select(Form.project_id, Project.owner_id)
+        .select_from(Form)
+        .outerjoin(Project, Project.id == Form.project_id)
+        .where(Form.id == form_id)
+    )
+    _check_owner(_resolve("form", form_id, statement, session), user, "Form not found")
+
+
+def authorize_view(session: Session, user: CurrentUser, view_id: UUID) -> None:
+    statement = (
+        select(View.project_id, Project.owner_id)
+        .select_from(View)
+        .outerjoin(Project, Project.id == View.project_id)
+        .where(View.id == view_id)
+    )
+    _check_owner(_resolve("view", view_id, statement, session), user, "View not found")
+
+
+def authorize_submission(session: Session, user: CurrentUser, submission_id: UUID, form_id: Optional[UUID] = None) -> None:
+    """Check the submission exists, belongs to `form_id` (when given) and is owned by `user`."""
+    statement = (
+        select(Submission.form_id, Form.project_id, Project.owner_id)
+        .select_from(Submission)
+        .join(Form, Form.id == Submission.form_id)
+        .outerjoin(Project, Project.id == Form.project_id)
+        .where(Submission.id == submission_id)
+    )
+    resolved = _resolve("submission", submission_id, statement, session)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    if form_id is not None and resolved["form_id"] != str(form_id):
+        raise HTTPException(status_code=400, detail="Submission does not belong to the specified form")
+    _check_owner(resolved, user, "Submission not found")
+
+
+def require_project_owner(project_id: UUID, session: Session = Depends(get_session), current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    authorize_project(session, current_user, project_id)
+    return current_user
+
+
+def require_form_owner(form_id: UUID, session: Session = Depends(get_session), current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    authorize_form(session, current_user, form_id)
+    return current_user
+
+
+def require_view_owner(view_id: UUID, session: Session = Depends(get_session), current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    authorize_view(session, current_user, view_id)
+    return current_user
+
+
+def require_submission_owner(
+    form_id: UUID,
+    submission_id: UUID,
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+) -> CurrentUser:
+    authorize_submission(session, current_user, submission_id, form_id)
+    return current_user
+
+
+@sa.event.listens_for(Project, "after_delete")
+def _invalidate_project(mapper, connection, target: Project) -> None:
+    invalidate("project", target.id)
+
+
+@sa.event.listens_for(Form, "after_delete")
+def _invalidate_form(mapper, connection, target: Form) -> None:
+    invalidate("form", target.id)
+
+
+@sa.event.listens_for(View, "after_delete")
+def _invalidate_view(mapper, connection, target: View) -> None:
+    invalidate("view", target.id)
+
+
+@sa.event.listens_for(Submission, "after_delete")
+def _invalidate_submission(mapper, connection, target: Submission) -> None:
+    invalidate("submission", target.id)
@@ -0,0 +1,92 @@
+"""Streaming CSV / NDJSON exports.
+
+Rows are read through a server-side cursor (`yield_per`) in a session owned by the
+response body, so an export holds at most one batch in memory and the first bytes go
+out before the query has finished.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from typing import Any, Callable, Iterable, Iterator, List
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from database import apply_statement_timeout, engine
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# Rows fetched per round-trip from the server-side cursor.
+EXPORT_BATCH_SIZE = 1000
+
+# Exports are expected to run long, so they are not limited unless configured.
+EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_EXPORT_MS") or 0)
+
+
+def csv_cell(value: Any) -> str:
+    """Format a JSON value like the dashboard's client-side CSV export did."""
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "; ".join("" if v is None else str(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def stream_rows(statement: Any, convert: Callable[[Any], Any]) -> Iterator[Any]:
+    """Yield `convert(record)` for every row of a Core SELECT, batch by batch."""
+    with Session(engine) as session:
+        if EXPORT_STATEMENT_TIMEOUT_MS > 0:
+            apply_statement_timeout(session, EXPORT_STATEMENT_TIMEOUT_MS)
+        result = session.exec(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for record in result.mappings():
+            yield convert(record)
+
+
+def iter_csv(header: List[str], rows: Iterable[List[Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([csv_cell(v) for v in row])
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(rows: Iterable[dict]) -> Iterator[bytes]:
+    lines: List[str] = []
+    for row in rows:
+        lines.append(json.dumps(row, default=str))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def check_export_format(export_format: str) -> str:
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format '{export_format}'; use csv or ndjson")
+    return export_format
+
+
+def export_filename(title: str, suffix: str, export_format: str) -> str:
+    slug = re.sub(r"[^a-z0-9-]+", "", re.sub(r"\s+", "-", (title or "export").strip().lower())) or "export"
+    return f"{slug}-{suffix}.{export_format}"
+
+
+def export_response(chunks: Iterator[bytes], export_format: str, filename: str) -> StreamingResponse:
+    media_type = "text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,278 @@
+"""Distinct field values and lookup options for dropdowns, computed in SQL and cached.
+
+Both lists used to be built by loading every submission of the form. They now come
+from one query each that returns only the distinct values / (id, label) pairs,
+optionally narrowed by a case-insensitive prefix (`q`) and a `limit`. Text rendering
+follows the Python rules the endpoints always used (`str()` of each value, list items
+one by one, currency objects as "CUR amount"), and results are ordered the same way.
+
+Results are cached per form write version (see view_cache.bump_form_version), so any
+submission write to the form makes its cached lists unreachable. With FIELD_INDEXES
+set, a prefix search also schedules a partial expression index on the field (see
+form_indexes.py) that the prefix filter can use.
+
+`typeahead_options` serves reference / form_lookup pickers: it returns only the best
+few options for what has been typed so far, ranked so the order is stable.
+`submission_labels` renders the same labels for given submission ids (see
+relation_labels.py).
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from sqlmodel import Session
+
+import metrics
+from cache import CacheBackend, TTLCache
+from form_indexes import ensure_field_index, prefix_search_text, trigram_available
+from view_cache import form_version
+
+FIELD_VALUES_CACHE_TTL_SECONDS = float(os.getenv("FIELD_VALUES_CACHE_TTL_SECONDS", "60"))
+FIELD_VALUES_CACHE_MAX_SIZE = int(os.getenv("FIELD_VALUES_CACHE_MAX_SIZE", "1024"))
+
+# Typeahead: default result count, and the pg_trgm word similarity a label needs to match.
+TYPEAHEAD_LIMIT = int(os.getenv("TYPEAHEAD_LIMIT", "20"))
+TYPEAHEAD_MIN_SIMILARITY = float(os.getenv("TYPEAHEAD_MIN_SIMILARITY", "0.4"))
+
+_cache: CacheBackend = TTLCache(max_size=FIELD_VALUES_CACHE_MAX_SIZE)
+
+requests_counter = metrics.counter("field_values_cache_requests_total", "Field value / option list requests by endpoint and cache result")
+
+def set_field_values_cache_backend(backend: CacheBackend) -> None:
+    global _cache
+    _cache = backend
+
+
+def _py_str(value: str) -> str:
+    """SQL text of a JSONB value as Python's str() renders the decoded value."""
+    return (
+        f"CASE jsonb_typeof(({value})) WHEN 'string' THEN ({value}) #>> '{{}}' "
+        f"WHEN 'boolean' THEN CASE WHEN ({value}) = 'true'::jsonb THEN 'True' ELSE 'False' END "
+        f"WHEN 'null' THEN 'None' ELSE ({value})::text END"
+    )
+
+
+def _array(value: str) -> str:
+    return f"CASE WHEN jsonb_typeof({value}) = 'array' THEN {value} ELSE '[]'::jsonb END"
+
+
+_VALUES_SQL = f"""
+SELECT DISTINCT v.value COLLATE "C" AS value
+FROM submission s
+CROSS JOIN LATERAL (SELECT s.data -> :key AS raw) r
+CROSS JOIN LATERAL (
+    SELECT {_py_str("e.item")} AS value
+    FROM jsonb_array_elements({_array("r.raw")}) AS e(item)
+    UNION ALL
+    SELECT CASE
+        WHEN jsonb_typeof(r.raw) = 'object' AND r.raw ? 'amount' THEN
+            CASE
+                WHEN coalesce(jsonb_typeof(r.raw -> 'amount'), 'null') = 'null' THEN NULL
+                WHEN coalesce(jsonb_typeof(r.raw -> 'currency'), 'null') = 'null' THEN {_py_str("r.raw -> 'amount'")}
+                ELSE {_py_str("r.raw -> 'currency'")} || ' ' || {_py_str("r.raw -> 'amount'")}
+            END
+        WHEN jsonb_typeof(r.raw) = 'object' AND r.raw ? 'id' THEN {_py_str("r.raw -> 'id'")}
+        ELSE {_py_str("r.raw")}
+    END
+    WHERE jsonb_typeof(r.raw) NOT IN ('array', 'null')
+) AS v
+WHERE s.form_id = :form_id AND v.value IS NOT NULL
+"""
+
+_WHITESPACE = "' ' || chr(9) || chr(10) || chr(11) || chr(12) || chr(13)"
+
+
+def _label(value: str) -> str:
+    """Option label of a JSONB value: its str(), list items joined with ", ", outer whitespace trimmed."""
+    return f"""btrim(
+        CASE WHEN jsonb_typeof({value}) = 'array' THEN
+            coalesce((
+                SELECT string_agg({_py_str("e.item")}, ', ' ORDER BY e.ord)
+                FROM jsonb_array_elements({_array(value)}) WITH ORDINALITY AS e(item, ord)
+                WHERE jsonb_typeof(e.item) <> 'null'
+            ), '')
+        ELSE {_py_str(value)} END,
+        {_WHITESPACE}
+    )"""
+
+
+_OPTIONS_SQL = f"""
+SELECT o.id, o.label
+FROM (
+    SELECT s.id, {_label("s.data -> :key")} AS label
+    FROM submission s
+    WHERE s.form_id = :form_id AND jsonb_typeof(s.data -> :key) <> 'null' /*prefilter*/
+) AS o
+WHERE o.label <> ''
+"""
+
+# One row per (submission, label key); a NULL key picks the fallback label.
+_LABELS_SQL = f"""
+SELECT s.id, k.key, coalesce(
+    CASE WHEN coalesce(jsonb_typeof(s.data -> k.key), 'null') <> 'null' THEN nullif({_label("s.data -> k.key")}, '') END,
+    (
+        SELECT f.value #>> '{{}}'
+        FROM jsonb_each(s.data) WITH ORDINALITY AS f(key, value, ord)
+        WHERE jsonb_typeof(f.value) = 'string' AND f.value #>> '{{}}' <> ''
+        ORDER BY f.ord LIMIT 1
+    )
+) AS label
+FROM submission s
+CROSS JOIN unnest(CAST(:keys AS text[])) AS k(key)
+WHERE s.form_id = :form_id AND s.id = ANY(:ids)
+"""
+
+_IDS = sa.bindparam("ids", type_=ARRAY(PG_UUID(as_uuid=True)))
+_KEYS = sa.bindparam("keys", type_=ARRAY(sa.Text))
+
+
+def _like_prefix(q: str) -> str:
+    escaped = q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def _prefilter(storage_key: str, q: str) -> Optional[str]:
+    """Index-friendly superset filter for a prefix search (see form_indexes.prefix_search_text)."""
+    if q != q.strip():
+        return None
+    text = prefix_search_text(":key", "s.data")
+    return f"({text} LIKE :prefix ESCAPE '\\' OR {text} = chr(1))"
+
+
+def _cached(endpoint: str, form_id: UUID, storage_key: str, q: Optional[str], limit: Optional[int], compute: Any) -> Any:
+    key = f"{endpoint}:{form_id}:{form_version(form_id)}:{storage_key}:{limit}:{q or ''}"
+    cached = _cache.get(key)
+    if cached is not None:
+        requests_counter.inc(endpoint=endpoint, result="hit")
+        return cached
+    requests_counter.inc(endpoint=endpoint, result="miss")
+    result = compute()
+    _cache.set(key, result, FIELD_VALUES_CACHE_TTL_SECONDS)
+    return result
+
+
+def distinct_values(
+    session: Session,
+    form_id: UUID,
+    storage_key: str,
+    q: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> List[str]:
+    """Sorted distinct text values of `data[storage_key]` across a form's submissions."""
+
+    def compute() -> List[str]:
+        sql = _VALUES_SQL
+        params: dict = {"form_id": form_id, "key": storage_key, "limit": limit}
+        if q:
+            params["prefix"] = _like_prefix(q)
+            prefilter = _prefilter(storage_key, q)
+            if prefilter:
+                sql += f" AND {prefilter}"
+                ensure_field_index(form_id, storage_key)
+            sql += " AND lower(v.value) LIKE :prefix ESCAPE '\\'"
+        sql += " ORDER BY 1 LIMIT :limit"
+        return [row[0] for row in session.connection().execute(sa.text(sql), params)]
+
+    return _cached("values", form_id, storage_key, q, limit, compute)
+
+
+def submission_options(
+    session: Session,
+    form_id: UUID,
+    storage_key: str,
+    q: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    """[{id, label}] for every submission with a non-empty `data[storage_key]`, sorted by label."""
+
+    def compute() -> List[dict]:
+        sql = _OPTIONS_SQL
+        params: dict = {"form_id": form_id, "key": storage_key, "limit": limit}
+        if q:
+            params["prefix"] = _like_prefix(q)
+            prefilter = _prefilter(storage_key, q)
+            if prefilter:
+                sql = sql.replace("/*prefilter*/", f"AND {prefilter}")
+                ensure_field_index(form_id, storage_key)
+            sql += " AND lower(o.label) LIKE :prefix ESCAPE '\\'"
+        sql += ' ORDER BY lower(o.label) COLLATE "C", o.label COLLATE "C", o.id LIMIT :limit'
+        rows = session.connection().execute(sa.text(sql), params)
+        return [{"id": str(row.id), "label": row.label} for row in rows]
+
+    return _cached("options", form_id, storage_key, q, limit, compute)
+
+
+def submission_labels(
+    session: Session,
+    form_id: UUID,
+    label_keys: Sequence[Optional[str]],
+    ids: Sequence[UUID],
+) -> Dict[Tuple[UUID, Optional[str]], Optional[str]]:
+    """Label of each of `ids` (submissions of `form_id`) under each label key, in one query.
+
+    A label is the option label of `data[label_key]`, as the options endpoints render
+    it; when that is empty, or the key is None, it is the first non-empty string value
+    of the submission, like the UI's fallback. Ids of other forms are not labelled.
+    """
+    if not ids or not label_keys:
+        return {}
+    rows = session.connection().execute(
+        sa.text(_LABELS_SQL).bindparams(_IDS, _KEYS),
+        {"form_id": form_id, "keys": list(label_keys), "ids": list(ids)},
+    )
+    return {(row.id, row.key): row.label for row in rows}
+
+
+def typeahead_options(
+    session: Session,
+    form_id: UUID,
+    storage_key: str,
+    q: Optional[str],
+    limit: Optional[int] = None,
+) -> List[dict]:
+    """Best `limit` options for a picker search box, best match first.
+
+    Labels starting with `q` rank first. With pg_trgm installed, labels with a word
+    starting with `q` come next, then labels with a word similar to `q` (typos
+    included) by descending similarity; without it only prefix matches are returned.
+    Ties are broken by label and id.
+    """
+    q = (q or "").strip()
+    limit = limit or TYPEAHEAD_LIMIT
+    if not q:
+        return submission_options(session, form_id, storage_key, limit=limit)
+
+    def compute() -> List[dict]:
+        connection = session.connection()
+        text = prefix_search_text(":key", "s.data")
+        label = "lower(o.label)"
+        params: dict = {"form_id": form_id, "key": storage_key, "limit": limit, "q": q.lower(), "prefix": _like_prefix(q)}
+        if trigram_available(connection):
+            # `<%` (word similarity) compares against this threshold; local to the transaction.
+            connection.execute(
+                sa.text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+                {"threshold": str(TYPEAHEAD_MIN_SIMILARITY)},
+            )
+            params["contains"] = "%" + params["prefix"]
+            params["word"] = "% " + params["prefix"]
+            prefilter = f"({text} LIKE :contains ESCAPE '\\' OR :q <% {text} OR {text} = chr(1))"
+            match = f"({label} LIKE :prefix ESCAPE '\\' OR {label} LIKE :word ESCAPE '\\' OR :q <% {label})"
+            rank = (
+                f"CASE WHEN {label} LIKE :prefix ESCAPE '\\' THEN 0 WHEN {label} LIKE :word ESCAPE '\\' THEN 1 ELSE 2 END, "
+                f"word_similarity(:q, {label}) DESC, "
+            )
+            ensure_field_index(form_id, storage_key, "trigram")
+        else:
+            prefilter = f"({text} LIKE :prefix ESCAPE '\\' OR {text} = chr(1))"
+            match = f"{label} LIKE :prefix ESCAPE '\\'"
+            rank = ""
+            ensure_field_index(form_id, storage_key, "prefix")
+        sql = _OPTIONS_SQL.replace("/*prefilter*/", f"AND {prefilter}") + f" AND {match}"
+        sql += f' ORDER BY {rank}{label} COLLATE "C", o.label COLLATE "C", o.id LIMIT :limit'
+        rows = connection.execute(sa.text(sql), params)
+        return [{"id": str(row.id), "label": row.label} for row in rows]
+
+    return _cached("typeahead", form_id, storage_key, q.lower(), limit, compute)
@@ -0,0 +1,312 @@
+"""On-demand expression indexes over one form's field in `submission.data`.
+
+Each index is partial (`WHERE form_id = ...`) so it only covers the form it serves,
+and is built with CREATE INDEX CONCURRENTLY on a background thread, so neither the
+request that asked for it nor concurrent writers wait on the build. Requests are
+idempotent: an index is only scheduled once per process and the DDL uses IF NOT
+EXISTS, so several workers asking for the same index is harmless.
+
+Two kinds are requested implicitly, and only when FIELD_INDEXES is set: "prefix"
+(btree, text_pattern_ops) for `q` prefix searches and "trigram" (GIN, pg_trgm) for
+typeahead similarity matching; both index the same expression, `prefix_search_text`.
+
+Form owners can also list field keys under `Form.settings["indexedFields"]`. Number-like
+fields among them get a managed "number" B-tree index on the field's numeric value,
+which range filters on the field can use. Other fields get none, as no query would
+use it, and `form_index_status` lists them as unsupported next to the build state of
+the managed indexes. `sync_form_indexes` creates and drops those to match the settings.
+"""
+
+import functools
+import hashlib
+import os
+import queue
+import threading
+import uuid
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+import metrics
+from database import engine
+from form_schema import canonical_storage_key, is_relation_field, relation_label_key, relation_target_form_id
+
+FIELD_INDEXES_ENABLED = os.getenv("FIELD_INDEXES", "").strip().lower() in ("1", "true", "yes", "on")
+
+# Builds run one at a time on a daemon thread, so a build waiting on long transactions never blocks shutdown.
+_queue: "queue.Queue[Callable[[], None]]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_status: Dict[str, str] = {}
+_status_lock = threading.Lock()
+
+builds_counter = metrics.counter("field_index_builds_total", "Background field index builds by result (created/failed)")
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def prefix_search_text(key_sql: str, data: str = "data") -> str:
+    """Trimmed, lower-cased text of `data ->> key`, with lists and objects mapped to chr(1).
+
+    `expr LIKE 'abc%' OR expr = chr(1)` on it is a superset of every row whose value
+    could render with that prefix and can be answered by a "prefix" index. Queries must
+    spell the expression exactly like this to match the index.
+    """
+    return (
+        f"lower(btrim(CASE WHEN jsonb_typeof({data} -> {key_sql}) IN ('array', 'object') THEN chr(1) "
+        f"ELSE {data} ->> {key_sql} END, E' \\t\\n\\r\\x0b\\x0c'))"
+    )
+
+
+def number_value(key_sql: str, data: str = "data") -> str:
+    """Numeric value of a JSON number or of a currency object's `amount`, else NULL."""
+    value = f"({data} -> {key_sql})"
+    return (
+        f"(CASE WHEN jsonb_typeof({value}) = 'number' THEN ({value} #>> '{{}}')::numeric "
+        f"WHEN jsonb_typeof({value} -> 'amount') = 'number' THEN ({value} ->> 'amount')::numeric END)"
+    )
+
+
+# Index kinds: name -> index method and expression for a storage key.
+INDEX_KINDS: Dict[str, Callable[[str], str]] = {
+    "prefix": lambda key: f"({prefix_search_text(_literal(key))} text_pattern_ops)",
+    # Needs the pg_trgm extension (migration 0008 installs it where available).
+    "trigram": lambda key: f"USING gin ({prefix_search_text(_literal(key))} gin_trgm_ops)",
+    "number": lambda key: f"({number_value(_literal(key))})",
+}
+
+# Kinds created and dropped from Form.settings["indexedFields"].
+MANAGED_KINDS = ("number",)
+# Kinds no longer created; the next sync of the form drops any left behind.
+RETIRED_KINDS = ("value",)
+NUMERIC_FIELD_TYPES = {"number", "currency", "slider", "rating", "calculated"}
+
+_trigram: Optional[bool] = None
+
+
+def trigram_available(connection: Any) -> bool:
+    """Whether pg_trgm is installed in the database (checked once per process)."""
+    global _trigram
+    if _trigram is None:
+        _trigram = bool(connection.execute(sa.text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")).scalar())
+    return _trigram
+
+
+def index_name(form_id: Any, key: str, kind: str) -> str:
+    digest = hashlib.sha1(f"{uuid.UUID(str(form_id))}:{key}".encode()).hexdigest()[:16]
+    return f"ix_submission_{kind}_{digest}"
+
+
+def index_ddl(form_id: Any, key: str, kind: str) -> str:
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(form_id, key, kind)} "
+        f"ON submission {INDEX_KINDS[kind](key)} WHERE form_id = {_literal(str(uuid.UUID(str(form_id))))}"
+    )
+
+
+def _build(name: str, kind: str, ddl: str) -> None:
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if kind == "trigram" and not trigram_available(connection):
+                with _status_lock:
+                    _status[name] = "unavailable: pg_trgm is not installed"
+                return
+            connection.execute(sa.text(ddl))
+    except Exception as exc:
+        # A failed concurrent build leaves an INVALID index behind that IF NOT EXISTS would skip.
+        try:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                connection.execute(sa.text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        except Exception:
+            pass
+        with _status_lock:
+            _status[name] = f"failed: {exc.__class__.__name__}"
+        builds_counter.inc(result="failed")
+        return
+    with _status_lock:
+        _status[name] = "ready"
+    builds_counter.inc(result="created")
+
+
+def _work() -> None:
+    while True:
+        job = _queue.get()
+        job()
+
+
+def _start_worker() -> None:
+    global _worker
+    with _status_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name="field-index", daemon=True)
+            _worker.start()
+
+
+def ensure_field_index(form_id: Any, key: str, kind: str = "prefix") -> None:
+    """Schedule a background build of the `kind` index on `key` for one form (once per process)."""
+    if not FIELD_INDEXES_ENABLED or not key:
+        return
+    name = index_name(form_id, key, kind)
+    with _status_lock:
+        if name in _status:
+            return
+        _status[name] = "building"
+    _queue.put(functools.partial(_build, name, kind, index_ddl(form_id, key, kind)))
+    _start_worker()
+
+
+def ensure_lookup_label_indexes(schema: Optional[list]) -> None:
+    """Request typeahead indexes on the label fields that the relation fields of `schema` pick from."""
+    for field in schema or []:
+        if not isinstance(field, dict) or not is_relation_field(field):
+            continue
+        target, label_key = relation_target_form_id(field), relation_label_key(field)
+        if not target or not label_key:
+            continue
+        try:
+            uuid.UUID(str(target))
+        except ValueError:
+            continue
+        ensure_field_index(target, str(label_key), "prefix")
+        ensure_field_index(target, str(label_key), "trigram")
+
+
+def index_status(form_id: Any, key: str, kind: str = "prefix") -> Optional[str]:
+    """'building', 'ready', 'unavailable: ...' or 'failed: ...' for indexes requested by this process, else None."""
+    with _status_lock:
+        return _status.get(index_name(form_id, key, kind))
+
+
+def managed_indexes(schema: Optional[list], settings: Optional[dict]) -> List[Tuple[str, str, str]]:
+    """(field key, storage key, kind) of every index that `settings["indexedFields"]` asks for."""
+    wanted = (settings or {}).get("indexedFields") or []
+    fields = {f.get("key"): f for f in schema or [] if isinstance(f, dict) and f.get("key")}
+    indexes: List[Tuple[str, str, str]] = []
+    for field_key in wanted:
+        field = fields.get(field_key)
+        storage_key = canonical_storage_key(field) if field else None
+        if storage_key and field.get("type") in NUMERIC_FIELD_TYPES:
+            indexes.append((field_key, storage_key, "number"))
+    return indexes
+
+
+def _existing_managed(connection: Any, form_id: uuid.UUID) -> List[str]:
+    rows = connection.execute(
+        sa.text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'submission' "
+            "AND indexname ~ :pattern AND indexdef LIKE :scope"
+        ),
+        {"pattern": f"^ix_submission_({'|'.join(MANAGED_KINDS + RETIRED_KINDS)})_", "scope": f"%(form_id = '{form_id}'::uuid)"},
+    )
+    return [row[0] for row in rows]
+
+
+def _sync(form_id: uuid.UUID, wanted: Dict[str, Tuple[str, str]]) -> None:
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for name in _existing_managed(connection, form_id):
+                if name not in wanted:
+                    connection.execute(sa.text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                    with _status_lock:
+                        _status.pop(name, None)
+                    builds_counter.inc(result="dropped")
+    except Exception:
+        builds_counter.inc(result="failed")
+    for name, (kind, ddl) in wanted.items():
+        _build(name, kind, ddl)
+
+
+def sync_form_indexes(form_id: Any, schema: Optional[list], settings: Optional[dict]) -> None:
+    """Create the managed indexes the form's settings ask for and drop the others, in the background."""
+    form_id = uuid.UUID(str(form_id))
+    wanted = {
+        index_name(form_id, storage_key, kind): (kind, index_ddl(form_id, storage_key, kind))
+        for _, storage_key, kind in managed_indexes(schema, settings)
+    }
+    with _status_lock:
+        for name in wanted:
+            if _status.get(name) != "ready":
+                _status[name] = "building"
+    _queue.put(functools.partial(_sync, form_id, wanted))
+    _start_worker()
+
+
+def form_index_status(connection: Any, form_id: Any, schema: Optional[list], settings: Optional[dict]) -> List[dict]:
+    """Build state of each managed index of a form: ready, building, pending or failed: ...
+
+    Listed fields that get no index are reported with status "unsupported: <reason>".
+    """
+    indexes = [
+        (field_key, kind, index_name(form_id, storage_key, kind))
+        for field_key, storage_key, kind in managed_indexes(schema, settings)
+    ]
+    found: Dict[str, bool] = {}
+    if indexes:
+        rows = connection.execute(
+            sa.text(
+                "SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = ANY(:names)"
+            ),
+            {"names": [name for _, _, name in indexes]},
+        )
+        found = {row[0]: bool(row[1]) for row in rows}
+    result = []
+    for field_key, kind, name in indexes:
+        with _status_lock:
+            local = _status.get(name)
+        if found.get(name):
+            status = "ready"
+        elif local and local.startswith("failed"):
+            status = local
+        elif name in found or local == "building":
+            status = "building"
+        else:
+            status = "pending"
+        result.append({"fieldKey": field_key, "kind": kind, "name": name, "status": status})
+    covered = {field_key for field_key, _, _ in indexes}
+    fields = {f.get("key"): f for f in schema or [] if isinstance(f, dict) and f.get("key")}
+    for field_key in (settings or {}).get("indexedFields") or []:
+        if field_key in covered:
+            continue
+        field = fields.get(field_key)
+        if field is None:
+            reason = "no such field"
+        else:
+            reason = f"only number-like fields are indexed, not {field.get('type')}"
+        result.append({"fieldKey": field_key, "kind": None, "name": None, "status": f"unsupported: {reason}"})
+    return result
+
+
+def number_value_expression(data: Any, key: str) -> Any:
+    """`number_value` over the JSONB column `data`, with the key and constants inlined so it matches a "number" index."""
+    value = data.op("->")(sa.literal_column(_literal(key)))
+    amount = value.op("->")(sa.literal_column(_literal("amount")))
+    number = sa.literal_column(_literal("number"))
+    return sa.case(
+        (sa.func.jsonb_typeof(value) == number, sa.cast(value.op("#>>")(sa.literal_column("'{}'")), sa.Numeric)),
+        (sa.func.jsonb_typeof(amount) == number, sa.cast(value.op("->>")(sa.literal_column(_literal("amount"))), sa.Numeric)),
+    )
+
+
+def indexed_range_condition(data: Any, settings: Optional[dict], schema: Optional[list], field_key: str, operator: str, operand: Optional[str]) -> Optional[Any]:
+    """Redundant, index-matching condition for a greater_than / less_than filter on a "number" indexed field.
+
+    `data` is the submission data column of the query (e.g. `col(Submission.data)`).
+    Rows the exact filter can match have a numeric value past `bound` or no JSON
+    number at all (strings, empty values), so this never drops a match.
+    """
+    if operator not in ("greater_than", "less_than"):
+        return None
+    try:
+        bound = float(operand or 0)
+    except ValueError:
+        return None
+    for indexed_key, storage_key, kind in managed_indexes(schema, settings):
+        if indexed_key == field_key and kind == "number":
+            value = number_value_expression(data, storage_key)
+            limit = sa.literal(Decimal(repr(bound)), sa.Numeric)
+            reached = value >= limit if operator == "greater_than" else value <= limit
+            return sa.or_(reached, value.is_(None))
+    return None
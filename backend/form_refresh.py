@@ -0,0 +1,133 @@
+"""Background refresh of the data derived from a form's schema.
+
+When a form's formulas, relation fields or projected fields change, every stored
+submission has to follow: calculated values are re-evaluated, and the relation index
+(relation_index.py) and typed projection (projections.py) of each row are rebuilt.
+`update_form` commits the schema change on its own and hands that work to
+`schedule_form_refresh`, so the request neither holds a transaction open nor waits
+on it.
+
+Refreshes run one at a time on a daemon thread as a `migration_runner.run_job` over
+the form: id-ordered batches of FORM_REFRESH_BATCH_SIZE rows, each locked, rewritten
+and committed in its own short transaction. Rows written through the API meanwhile
+already follow the new schema; until the job reaches the older rows, views see their
+previous relation edges. Aggregates ask `refresh_pending` and read the JSONB values
+instead of the projection while a refresh of the form is queued, running or has failed
+in this process. The job reads the form when it starts, so several changes queued for
+the same form collapse into one run. When it finishes, the form's version is bumped so
+cached view results built from half-refreshed rows are dropped.
+
+A refresh cut short by a restart is not resumed; the scripts
+recompute_calculated_fields.py, backfill_submission_relations.py and
+rebuild_submission_projections.py repair the form.
+"""
+
+import logging
+import os
+import queue
+import threading
+import uuid
+from datetime import date
+from typing import Any, Dict, Optional, Set
+
+from sqlmodel import Session
+
+import metrics
+from database import engine
+from form_validator import CompiledForm
+from migration_runner import DEFAULT_BATCH_SIZE, run_job
+from models import Form
+from projections import projected_fields, rebuild_form
+from view_cache import bump_form_version
+
+FORM_REFRESH_BATCH_SIZE = int(os.getenv("FORM_REFRESH_BATCH_SIZE", str(DEFAULT_BATCH_SIZE)))
+
+_queue: "queue.Queue[uuid.UUID]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+# Form id -> whether the queued refresh recomputes calculated fields.
+_pending: Dict[uuid.UUID, bool] = {}
+# Forms being refreshed, and forms whose last refresh failed (until one succeeds).
+_running: Set[uuid.UUID] = set()
+_failed: Set[uuid.UUID] = set()
+_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+refresh_counter = metrics.counter("form_refresh_jobs_total", "Background form refreshes by result (done/failed)")
+
+
+def _refresh(form_id: uuid.UUID, recompute: bool) -> None:
+    with Session(engine) as session:
+        form = session.get(Form, form_id)
+        if form is None:
+            return
+        compiled = CompiledForm(form.schema_)
+        if not projected_fields(form.schema_, form.settings):
+            # Nothing is projected any more: drop the form's rows in one statement.
+            rebuild_form(session.connection(), form_id, [])
+            session.commit()
+    today = date.today()
+
+    def calculate(form: Form, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return compiled.calculate(data, today) if recompute else None
+
+    run_job(
+        f"refresh-form-{form_id}",
+        calculate,
+        [form_id],
+        batch_size=FORM_REFRESH_BATCH_SIZE,
+        refresh=True,
+    )
+
+
+def _work() -> None:
+    while True:
+        form_id = _queue.get()
+        with _lock:
+            recompute = _pending.pop(form_id, False)
+            _running.add(form_id)
+        try:
+            _refresh(form_id, recompute)
+        except Exception:
+            logger.exception("Refresh of form %s failed", form_id)
+            refresh_counter.inc(result="failed")
+            with _lock:
+                _failed.add(form_id)
+        else:
+            refresh_counter.inc(result="done")
+            with _lock:
+                _failed.discard(form_id)
+        finally:
+            with _lock:
+                _running.discard(form_id)
+        # Also after a failure: the batches committed before it changed rows.
+        bump_form_version(form_id)
+
+
+def _start_worker() -> None:
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name="form-refresh", daemon=True)
+            _worker.start()
+
+
+def refresh_pending(form_id: Any) -> bool:
+    """Whether the form's derived rows may be stale: a refresh is queued, running or failed in this process."""
+    form_id = uuid.UUID(str(form_id))
+    with _lock:
+        return form_id in _pending or form_id in _running or form_id in _failed
+
+
+def schedule_form_refresh(form_id: Any, recompute: bool) -> None:
+    """Rebuild the relation index and projection of every submission of a form in the background.
+
+    `recompute=True` also re-evaluates its calculated fields first.
+    """
+    form_id = uuid.UUID(str(form_id))
+    with _lock:
+        queued = form_id in _pending
+        _pending[form_id] = _pending.get(form_id, False) or recompute
+    if not queued:
+        _queue.put(form_id)
+    _start_worker()
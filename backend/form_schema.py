@@ -0,0 +1,102 @@
+"""Helpers for reading the JSON form schema stored in `Form.schema_`."""
+
+from typing import List, Optional
+
+
+def is_relation_field(field: dict) -> bool:
+    """True for reference fields and form_lookup data sources (submission id values)."""
+    if field.get("type") == "reference":
+        return True
+    data_source = field.get("dataSource") or {}
+    return isinstance(data_source, dict) and data_source.get("type") == "form_lookup"
+
+
+def relation_target_form_id(field: dict) -> Optional[str]:
+    if field.get("type") == "reference":
+        return field.get("targetFormId")
+    data_source = field.get("dataSource") or {}
+    if isinstance(data_source, dict):
+        return data_source.get("formId")
+    return None
+
+
+def relation_label_key(field: dict) -> Optional[str]:
+    """Key of the target form's field whose value labels the picked submissions."""
+    if field.get("type") == "reference":
+        return field.get("displayFieldKey")
+    data_source = field.get("dataSource") or {}
+    if isinstance(data_source, dict):
+        return data_source.get("fieldKey")
+    return None
+
+
+def schema_field(schema: Optional[list], field_key: Optional[str]) -> Optional[dict]:
+    """The field of `schema` whose `key` is `field_key`, if any."""
+    if not field_key:
+        return None
+    for f in schema or []:
+        if isinstance(f, dict) and f.get("key") == field_key:
+            return f
+    return None
+
+
+def column_storage_keys(schema: Optional[list], field_key: Optional[str]) -> List[str]:
+    """Return the data keys to read for a column addressed by `field.key`, in priority order.
+
+    Relation fields are stored canonically under `field.id`, but older submissions may
+    still carry the value under `field.key`.
+    """
+    if not field_key:
+        return []
+    for f in schema or []:
+        if f.get("key") != field_key:
+            continue
+        if is_relation_field(f) and f.get("id"):
+            return [str(f.get("id")), str(field_key)]
+        break
+    return [str(field_key)]
+
+
+def canonical_storage_key(field: dict) -> Optional[str]:
+    """Return the canonical storage key for a field.
+
+    For relation fields (reference + form_lookup) we store under field.id.
+    Everything else remains under field.key.
+    """
+    if is_relation_field(field) and field.get("id"):
+        return str(field.get("id"))
+    if field.get("key"):
+        return str(field.get("key"))
+    return None
+
+
+def normalize_reference_value(raw):
+    """Normalize reference field values.
+
+    Accepts legacy object shapes like {id: "..."} and returns either:
+    - a single ID string
+    - a list of ID strings
+    - None
+    """
+    if raw is None:
+        return None
+
+    if isinstance(raw, list):
+        ids: List[str] = []
+        for v in raw:
+            if isinstance(v, dict) and v.get("id") is not None:
+                s = str(v.get("id")).strip()
+            else:
+                s = str(v).strip() if v is not None else ""
+            if s:
+                ids.append(s)
+        return ids or None
+
+    if isinstance(raw, dict):
+        if raw.get("id") is None:
+            return None
+        s = str(raw.get("id")).strip()
+        return s or None
+
+    s = str(raw).strip()
+    return s or None
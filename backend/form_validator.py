@@ -0,0 +1,266 @@
+"""Form schemas compiled once into a reusable submission validator.
+
+Validating a submission used to re-walk `form.schema_` for every relation field, every
+required field and every visibility condition. `CompiledForm` does that walk once per
+schema version: storage keys, the relation-field list, the condition key -> storage key
+map and one closure per condition are precomputed, so validating a payload is linear in
+the payload. Calculated-field formulas are compiled here too (see formulas.py). Compiled
+forms are kept in a small LRU keyed by (form id, schema hash).
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from form_schema import canonical_storage_key, is_relation_field, normalize_reference_value, relation_target_form_id
+from formulas import calculated_fields, compile_formula
+
+# Compiled schemas kept per process.
+CACHE_SIZE = 512
+
+Reference = Tuple[str, List[str], Optional[str]]
+
+
+def is_empty_value(val) -> bool:
+    if val is None:
+        return True
+    if isinstance(val, str):
+        return val.strip() == ''
+    if isinstance(val, list):
+        return len(val) == 0
+    if isinstance(val, dict):
+        # currency: { amount, currency }
+        if 'amount' in val:
+            return is_empty_value(val.get('amount'))
+        # reference/lookup: { id, ... }
+        if 'id' in val:
+            return is_empty_value(val.get('id'))
+        return len(val) == 0
+    return False
+
+
+def coerce_numeric(val) -> float:
+    # Support currency-like objects: { amount, currency }
+    raw = val
+    if isinstance(raw, dict) and 'amount' in raw:
+        raw = raw.get('amount')
+    # If it's still a dict (unexpected), treat as empty/0 for comparisons
+    if isinstance(raw, dict):
+        raw = None
+    return float(raw or 0)
+
+
+def condition_key_map(schema: Optional[list]) -> Dict[str, str]:
+    """Map condition `fieldKey`s of relation fields to their canonical `field.id` storage key.
+
+    Conditions store keys using `field.key`, but relation fields are stored under `field.id`.
+    """
+    out: Dict[str, str] = {}
+    for f in schema or []:
+        key = f.get("key")
+        if key and key not in out and is_relation_field(f) and f.get("id"):
+            out[key] = str(f.get("id"))
+    return out
+
+
+def _compile_condition(cond: dict, key_map: Dict[str, str]) -> Callable[[dict], bool]:
+    """Return a closure telling whether one condition is met for submission data."""
+    field_key = cond['fieldKey']
+    fallback_key = key_map.get(field_key, field_key)
+    operator = cond['operator']
+    value = cond.get('value')
+
+    def lookup(data: dict) -> Any:
+        if field_key in data:
+            return data.get(field_key)
+        return data.get(fallback_key)
+
+    if operator == 'equals':
+        expected = str(value)
+        return lambda data: str(lookup(data)) == expected
+    if operator == 'not_equals':
+        expected = str(value)
+        return lambda data: str(lookup(data)) != expected
+    if operator == 'contains':
+        needle = str(value or '').lower()
+        return lambda data: str(lookup(data) or '').lower().find(needle) != -1
+    if operator in ('greater_than', 'less_than'):
+        # Coerce the operand once; a bad operand still fails only when the condition is evaluated.
+        threshold_error: Optional[Exception] = None
+        try:
+            threshold = coerce_numeric(value)
+        except (TypeError, ValueError) as exc:
+            threshold_error = exc
+
+        def compare(data: dict) -> bool:
+            try:
+                actual = coerce_numeric(lookup(data))
+                if threshold_error is not None:
+                    raise threshold_error
+            except ValueError:
+                return False
+            return actual > threshold if operator == 'greater_than' else actual < threshold
+
+        return compare
+    if operator == 'is_empty':
+        return lambda data: is_empty_value(lookup(data))
+    if operator == 'is_not_empty':
+        return lambda data: not is_empty_value(lookup(data))
+    return lambda data: False
+
+
+def compile_visibility(field: dict, key_map: Dict[str, str]) -> Callable[[dict], bool]:
+    """Return a closure evaluating a field's show/hide conditions against submission data."""
+    rules = []
+    for cond in field.get('conditions', []) or []:
+        rules.append((_compile_condition(cond, key_map), cond['action']))
+    if not rules:
+        return lambda data: True
+
+    def visible(data: dict) -> bool:
+        for condition, action in rules:
+            condition_met = condition(data)
+            if action == 'show':
+                if not condition_met:
+                    return False
+            elif action == 'hide':
+                if condition_met:
+                    return False
+        return True
+
+    return visible
+
+
+class CompiledForm:
+    """Everything submission validation needs from one version of a form schema."""
+
+    def __init__(self, schema: Optional[list]):
+        self.schema = list(schema or [])
+        key_map = condition_key_map(self.schema)
+
+        # (canonical key, legacy key, normalized target form id) per relation field with an id.
+        self.relation_fields: List[Tuple[str, Optional[str], Optional[str]]] = []
+        # (storage key, legacy key, required, visibility closure) per storable field.
+        self.fields: List[Tuple[str, Optional[str], bool, Callable[[dict], bool]]] = []
+
+        for field in self.schema:
+            relation = is_relation_field(field)
+            if relation and field.get("id"):
+                target = relation_target_form_id(field)
+                parsed_target: Optional[str] = None
+                if target:
+                    try:
+                        parsed_target = str(UUID(str(target)))
+                    except ValueError:
+                        parsed_target = None
+                self.relation_fields.append(
+                    (str(field["id"]), str(field["key"]) if field.get("key") else None, parsed_target)
+                )
+
+            storage_key = canonical_storage_key(field)
+            if not storage_key:
+                continue
+            legacy_key = str(field["key"]) if relation and field.get("key") else None
+            self.fields.append((storage_key, legacy_key, bool(field.get('required')), compile_visibility(field, key_map)))
+
+        # (key, evaluator) per calculated field, in schema order.
+        self.calculated: List[Tuple[str, Callable[[dict, date], Any]]] = [
+            (key, compile_formula(formula)) for key, formula in calculated_fields(self.schema)
+        ]
+
+    def normalize_relations(self, data: dict) -> Tuple[dict, List[Reference]]:
+        """Move relation field values to `data[field.id]` without touching the database.
+
+        Relation fields include:
+        - type == "reference" (submission -> submission)
+        - dataSource.type == "form_lookup" (submission id(s) pointing to another form)
+
+        Returns the normalized data and, per relation field with a value, the
+        (canonical_key, referenced ids, target form id) triple still to be validated.
+        """
+        out = dict(data or {})
+        references: List[Reference] = []
+
+        for canonical_key, legacy_key, target_form_id in self.relation_fields:
+            raw = out.get(canonical_key)
+            if raw is None and legacy_key:
+                raw = out.get(legacy_key)
+
+            normalized = normalize_reference_value(raw)
+
+            # Remove legacy key (we will store canonically).
+            if legacy_key and legacy_key in out:
+                del out[legacy_key]
+
+            if normalized is None:
+                if canonical_key in out:
+                    del out[canonical_key]
+                continue
+
+            out[canonical_key] = normalized
+            references.append((canonical_key, normalized if isinstance(normalized, list) else [normalized], target_form_id))
+
+        return out, references
+
+    def calculate(self, data: dict, today: Optional[date] = None) -> dict:
+        """Submission data with every calculated field (re)computed from `data` as given.
+
+        Like the renderer, each formula reads the submitted values, not the results of
+        other formulas evaluated in this call.
+        """
+        if not self.calculated:
+            return data
+        today = today or date.today()
+        return {**data, **{key: evaluate(data, today) for key, evaluate in self.calculated}}
+
+    def required_errors(self, data: dict) -> Dict[str, str]:
+        """Required-field errors for visible fields of already-normalized submission data."""
+        errors: Dict[str, str] = {}
+        for storage_key, legacy_key, required, visible in self.fields:
+            if not required or not visible(data):
+                continue
+            val = data.get(storage_key)
+            # Back-compat: if relation field and caller still sent under field.key
+            if val is None and legacy_key:
+                val = data.get(legacy_key)
+            if is_empty_value(val):
+                errors[storage_key] = 'This field is required'
+        return errors
+
+
+def schema_hash(schema: Optional[list]) -> str:
+    return hashlib.sha1(json.dumps(schema or [], sort_keys=True, default=str).encode()).hexdigest()
+
+
+_cache: "OrderedDict[Tuple[str, str], CompiledForm]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_compiled_form(form: Any) -> CompiledForm:
+    """Compiled validator for `form`, reused while its schema is unchanged."""
+    key = (str(form.id), schema_hash(form.schema_))
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+            return compiled
+
+    compiled = CompiledForm(form.schema_)
+    with _cache_lock:
+        _cache[key] = compiled
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+def invalidate_form(form_id: Any) -> None:
+    """Drop every compiled version of a form (call after its schema changes or it is deleted)."""
+    form_key = str(form_id)
+    with _cache_lock:
+        for key in [k for k in _cache if k[0] == form_key]:
+            del _cache[key]
@@ -0,0 +1,221 @@
+"""Calculated fields: formulas parsed once and evaluated per submission.
+
+A calculated field (`type: "calculated"`) carries a `formula` such as
+`{price} * {quantity}` or `AGE({birth_date})`. The grammar is the one the form
+renderer evaluates (useCalculatedValues.ts): numbers, `{field_key}` references, `+ - * /`,
+parentheses, and the date functions AGE / YEARS_SINCE, MONTHS_SINCE, DAYS_SINCE, YEAR,
+MONTH and DAY applied to a `{field_key}`. References read numbers as the renderer does
+(numbers as-is, strings by their leading number, anything else as 0) and an unparseable
+date counts as 0.
+
+`parse_formula` turns a formula into a small AST (cached by formula text).
+`compile_formula` turns the AST into a closure over submission data, which
+`CompiledForm` keeps per schema version so writes evaluate formulas without parsing
+them. Stored submissions are recomputed with the same `CompiledForm.calculate`, row by
+row in migration_runner batches: by form_refresh.py when formulas change and by
+scripts/recompute_calculated_fields.py when date-based values go stale. Nothing is
+compiled to SQL, since float8 overflow would raise there and abort the whole batch.
+
+Results are stored under the field's key as a number; invalid formulas, division by
+zero and non-finite results store null. Every formula reads the data it is evaluated
+against, as the renderer does: a reference to another calculated field sees that
+field's stored value, not one computed in the same pass.
+"""
+
+import functools
+import math
+import re
+from datetime import date
+from typing import Any, Callable, List, Optional, Tuple
+
+DATE_FUNCTIONS = ("AGE", "YEARS_SINCE", "MONTHS_SINCE", "DAYS_SINCE", "YEAR", "MONTH", "DAY")
+
+# Leading number of a string, as JavaScript's parseFloat reads it.
+_LEADING_NUMBER = re.compile(r"^\s*([-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?)")
+_DATE_PREFIX = re.compile(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}")
+_TOKEN = re.compile(r"\s*(?:(\{[^}]+\})|([0-9]+\.?[0-9]*|\.[0-9]+)|([A-Za-z_]+)|(.))")
+
+Node = Tuple[Any, ...]
+
+
+class FormulaError(ValueError):
+    pass
+
+
+def _tokens(formula: str) -> List[Tuple[str, str]]:
+    tokens = []
+    for ref, number, name, symbol in _TOKEN.findall(formula.rstrip()):
+        if ref:
+            tokens.append(("ref", ref[1:-1]))
+        elif number:
+            tokens.append(("num", number))
+        elif name:
+            tokens.append(("name", name.upper()))
+        elif symbol in "+-*/()":
+            tokens.append((symbol, symbol))
+        else:
+            raise FormulaError(f"Unexpected character '{symbol}'")
+    return tokens
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_formula(formula: str) -> Node:
+    """AST of a formula: ("num", x), ("ref", key), ("date", FUNC, key), ("neg", n) or ("op", op, a, b)."""
+    tokens = _tokens(formula)
+    position = 0
+
+    def peek() -> Optional[str]:
+        return tokens[position][0] if position < len(tokens) else None
+
+    def take(kind: str) -> str:
+        nonlocal position
+        if peek() != kind:
+            raise FormulaError(f"Expected '{kind}'")
+        position += 1
+        return tokens[position - 1][1]
+
+    def expression() -> Node:
+        node = term()
+        while peek() in ("+", "-"):
+            op = take(peek())
+            node = ("op", op, node, term())
+        return node
+
+    def term() -> Node:
+        node = unary()
+        while peek() in ("*", "/"):
+            op = take(peek())
+            node = ("op", op, node, unary())
+        return node
+
+    def unary() -> Node:
+        if peek() == "-":
+            take("-")
+            return ("neg", unary())
+        if peek() == "+":
+            take("+")
+            return unary()
+        return atom()
+
+    def atom() -> Node:
+        kind = peek()
+        if kind == "num":
+            return ("num", float(take("num")))
+        if kind == "ref":
+            return ("ref", take("ref"))
+        if kind == "name":
+            name = take("name")
+            if name not in DATE_FUNCTIONS:
+                raise FormulaError(f"Unknown function '{name}'")
+            take("(")
+            key = take("ref")
+            take(")")
+            return ("date", name, key)
+        if kind == "(":
+            take("(")
+            node = expression()
+            take(")")
+            return node
+        raise FormulaError("Unexpected end of formula" if kind is None else f"Unexpected '{kind}'")
+
+    node = expression()
+    if position != len(tokens):
+        raise FormulaError(f"Unexpected '{tokens[position][1]}'")
+    return node
+
+
+def number_value(value: Any) -> float:
+    if isinstance(value, bool):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _LEADING_NUMBER.match(value)
+        return float(match.group(1)) if match else 0.0
+    return 0.0
+
+
+def date_value(value: Any) -> Optional[date]:
+    if not isinstance(value, str) or not _DATE_PREFIX.match(value):
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+
+def _date_part(name: str, d: date, today: date) -> int:
+    if name in ("AGE", "YEARS_SINCE"):
+        return today.year - d.year - (1 if (today.month, today.day) < (d.month, d.day) else 0)
+    if name == "MONTHS_SINCE":
+        return (today.year - d.year) * 12 + today.month - d.month - (1 if today.day < d.day else 0)
+    if name == "DAYS_SINCE":
+        return (today - d).days
+    if name == "YEAR":
+        return d.year
+    if name == "MONTH":
+        return d.month
+    return d.day
+
+
+def _compile(node: Node) -> Callable[[dict, date], float]:
+    kind = node[0]
+    if kind == "num":
+        number = node[1]
+        return lambda data, today: number
+    if kind == "ref":
+        key = node[1]
+        return lambda data, today: number_value(data.get(key))
+    if kind == "date":
+        _, name, key = node
+
+        def date_function(data: dict, today: date) -> float:
+            d = date_value(data.get(key))
+            return float(_date_part(name, d, today)) if d else 0.0
+
+        return date_function
+    if kind == "neg":
+        operand = _compile(node[1])
+        return lambda data, today: -operand(data, today)
+    _, op, left_node, right_node = node
+    left, right = _compile(left_node), _compile(right_node)
+    if op == "+":
+        return lambda data, today: left(data, today) + right(data, today)
+    if op == "-":
+        return lambda data, today: left(data, today) - right(data, today)
+    if op == "*":
+        return lambda data, today: left(data, today) * right(data, today)
+    return lambda data, today: left(data, today) / right(data, today)
+
+
+def compile_formula(formula: Any) -> Callable[[dict, date], Any]:
+    """Closure computing the stored value of `formula` for submission data (null when it cannot)."""
+    try:
+        evaluate = _compile(parse_formula(str(formula or "")))
+    except FormulaError:
+        return lambda data, today: None
+
+    def calculate(data: dict, today: date) -> Any:
+        try:
+            result = evaluate(data, today)
+        except (ZeroDivisionError, OverflowError):
+            return None
+        return _stored(result)
+
+    return calculate
+
+
+def _stored(result: float) -> Any:
+    if not math.isfinite(result):
+        return None
+    # Whole numbers are stored as JSON integers, like the renderer shows them.
+    return int(result) if result.is_integer() and abs(result) < 2 ** 53 else result
+
+
+def calculated_fields(schema: Optional[list]) -> List[Tuple[str, str]]:
+    """(key, formula) of every calculated field, in schema order."""
+    return [
+        (str(f["key"]), str(f.get("formula") or ""))
+        for f in schema or []
+        if isinstance(f, dict) and f.get("type") == "calculated" and f.get("key")
+    ]
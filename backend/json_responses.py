@@ -0,0 +1,103 @@
+"""Fast JSON bodies for large list responses.
+
+Returning ORM rows with a `response_model` makes every row go through SQLAlchemy
+hydration, a `json.loads` of each JSONB column, Pydantic validation and serialization;
+plain dicts returned without one go through `jsonable_encoder`, which walks every
+value. For lists of tens of thousands of rows that dominates the request. The
+helpers here build the body directly:
+
+- `ModelJSON(model)` selects a table model's columns with JSON columns cast to text,
+  and splices Postgres' JSONB output into the body without decoding it; the other
+  columns are encoded the way Pydantic writes them (UUIDs as strings, UTC timestamps
+  ending in `Z`).
+- `json_body(content)` encodes JSON-native content (view rows) with one `json.dumps`
+  call using FastAPI's JSONResponse settings, so the bytes are identical.
+
+`ModelJSON` bodies carry the same members and values as the `response_model` output.
+Keys follow the model's field order, and text inside JSON columns is Postgres' jsonb
+rendering: a space after `:` and `,`, and some numbers spelled differently (`1e+300`
+as digits). Both decode to the same JSON.
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+from uuid import UUID
+
+import sqlalchemy as sa
+from fastapi import Response
+from sqlmodel import SQLModel
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def json_body(content: Any) -> bytes:
+    """`content` (JSON-native values only) encoded exactly as FastAPI's JSONResponse renders it."""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(body: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=body, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+def _string(value: str) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _datetime(value: datetime) -> str:
+    text = value.isoformat()
+    return '"' + (text[:-6] + "Z" if text.endswith("+00:00") else text) + '"'
+
+
+_ENCODERS: Dict[type, Callable[[Any], str]] = {
+    str: _string,
+    UUID: lambda value: '"' + str(value) + '"',
+    datetime: _datetime,
+    date: lambda value: '"' + value.isoformat() + '"',
+    bool: lambda value: "true" if value else "false",
+    int: str,
+    float: lambda value: json.dumps(value, allow_nan=False),
+}
+
+
+def _scalar(value: Any) -> str:
+    if value is None:
+        return "null"
+    encode = _ENCODERS.get(type(value))
+    if encode is None:
+        return _string(str(value))
+    return encode(value)
+
+
+def _raw(value: Optional[str]) -> str:
+    return "null" if value is None else value
+
+
+class ModelJSON:
+    """Renders rows of a table model as the JSON list a `response_model=List[model]` endpoint sends."""
+
+    def __init__(self, model: Type[SQLModel]):
+        table = model.__table__
+        self.columns: List[Any] = []
+        self._fields: List[Tuple[str, Callable[[Any], str]]] = []
+        for name in model.model_fields:
+            if name not in table.c:
+                continue
+            column = table.c[name]
+            if isinstance(column.type, sa.JSON):
+                self.columns.append(sa.cast(column, sa.Text).label(name))
+                encode = _raw
+            else:
+                self.columns.append(column)
+                encode = _scalar
+            self._fields.append((_string(name) + ":", encode))
+
+    def select(self) -> Any:
+        """SELECT of the model's columns (JSON ones as text); add WHERE / ORDER BY / LIMIT as usual."""
+        return sa.select(*self.columns)
+
+    def row(self, row: Any) -> str:
+        return "{" + ",".join(key + encode(value) for (key, encode), value in zip(self._fields, row)) + "}"
+
+    def body(self, rows: Iterable[Any]) -> bytes:
+        return ("[" + ",".join(map(self.row, rows)) + "]").encode("utf-8")
@@ -0,0 +1,232 @@
+"""SQL predicates over JSONB values, plus the keyset cursor encoding used by paged endpoints.
+
+Filter operators mirror the condition operators evaluated by `is_field_visible`, so a
+filter means the same thing in the API as it does in a form condition.
+"""
+
+import ast
+import base64
+import json
+import math
+import re
+from typing import Any, List, Optional, Tuple
+
+import sqlalchemy as sa
+from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import JSONB
+
+FILTER_OPERATORS = (
+    "equals",
+    "not_equals",
+    "contains",
+    "greater_than",
+    "less_than",
+    "is_empty",
+    "is_not_empty",
+)
+_VALUELESS_OPERATORS = ("is_empty", "is_not_empty")
+
+_NUMERIC_TEXT = r"^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$"
+# str() of a Python int.
+_INTEGER_TEXT = re.compile(r"-?(0|[1-9][0-9]*)")
+
+
+def parse_filters(raw_filters: Optional[List[str]]) -> List[Tuple[str, str, Optional[str]]]:
+    """Parse `key:operator[:value]` query strings into (key, operator, value) triples."""
+    parsed: List[Tuple[str, str, Optional[str]]] = []
+    for raw in raw_filters or []:
+        parts = raw.split(":", 2)
+        if len(parts) < 2 or not parts[0] or parts[1] not in FILTER_OPERATORS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid filter '{raw}'; expected key:operator[:value] with operator in {', '.join(FILTER_OPERATORS)}",
+            )
+        key, operator = parts[0], parts[1]
+        value = parts[2] if len(parts) > 2 else None
+        if value is None and operator not in _VALUELESS_OPERATORS:
+            raise HTTPException(status_code=400, detail=f"Filter '{raw}' requires a value")
+        parsed.append((key, operator, value))
+    return parsed
+
+
+def json_get(value: Any, key: str) -> Any:
+    """`value -> key`; unlike `value[key]` this is safe on any expression, not just columns."""
+    return value.op("->", return_type=JSONB)(sa.literal(key))
+
+
+def json_text(value: Any) -> Any:
+    """Text of a JSONB value: unquoted for strings, JSON text for everything else."""
+    return sa.func.jsonb_build_array(value, type_=JSONB)[0].astext
+
+
+def _numeric(value: Any) -> Any:
+    """Numeric coercion matching `coerce_numeric`: currency objects use `amount`, empty counts as 0."""
+    raw = sa.case(
+        (sa.func.jsonb_typeof(value) == "object", json_get(value, "amount")),
+        else_=value,
+    )
+    text = json_text(raw)
+    return sa.case(
+        (sa.func.jsonb_typeof(raw) == "number", sa.cast(text, sa.Numeric)),
+        (sa.or_(raw.is_(None), sa.func.jsonb_typeof(raw) == "null", text == ""), sa.cast(0, sa.Numeric)),
+        (sa.and_(sa.func.jsonb_typeof(raw) == "string", text.regexp_match(_NUMERIC_TEXT)), sa.cast(text, sa.Numeric)),
+        (sa.and_(sa.func.jsonb_typeof(raw) == "boolean", text == "true"), sa.cast(1, sa.Numeric)),
+        (sa.func.jsonb_typeof(raw) == "boolean", sa.cast(0, sa.Numeric)),
+        else_=sa.null(),
+    )
+
+
+def numeric_value(value: Any) -> Any:
+    """Numeric value of a JSON number, a numeric string or a currency object's `amount`; NULL otherwise.
+
+    Unlike the filter coercion, empty values stay NULL so aggregates skip them.
+    """
+    raw = sa.case(
+        (sa.func.jsonb_typeof(value) == "object", json_get(value, "amount")),
+        else_=value,
+    )
+    text = json_text(raw)
+    return sa.case(
+        (sa.func.jsonb_typeof(raw) == "number", sa.cast(text, sa.Numeric)),
+        (sa.and_(sa.func.jsonb_typeof(raw) == "string", text.regexp_match(_NUMERIC_TEXT)), sa.cast(text, sa.Numeric)),
+        else_=sa.null(),
+    )
+
+
+def _is_empty_scalar(value: Any) -> Any:
+    return sa.or_(
+        value.is_(None),
+        sa.func.jsonb_typeof(value) == "null",
+        sa.and_(sa.func.jsonb_typeof(value) == "string", sa.func.btrim(json_text(value)) == ""),
+        sa.and_(sa.func.jsonb_typeof(value) == "array", sa.func.jsonb_array_length(value) == 0),
+    )
+
+
+def is_empty(value: Any) -> Any:
+    """SQL version of `is_empty_value`: None, blank strings, [] and {} plus empty currency/reference objects."""
+    is_object = sa.func.jsonb_typeof(value) == "object"
+    return sa.or_(
+        _is_empty_scalar(value),
+        sa.and_(is_object, value.has_key("amount"), _is_empty_scalar(json_get(value, "amount"))),
+        sa.and_(is_object, sa.not_(value.has_key("amount")), value.has_key("id"), _is_empty_scalar(json_get(value, "id"))),
+        sa.and_(is_object, value == sa.cast(sa.literal("{}"), JSONB)),
+    )
+
+
+def _parse_number(value: Optional[str]) -> float:
+    try:
+        return float(value or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Filter value '{value}' is not a number")
+
+
+def value_predicate(value: Any, operator: str, operand: Optional[str]) -> Any:
+    """Predicate for one filter against an arbitrary JSONB expression."""
+    if operator == "equals":
+        return sa.func.coalesce(json_text(value), "None") == str(operand)
+    if operator == "not_equals":
+        return sa.func.coalesce(json_text(value), "None") != str(operand)
+    if operator == "contains":
+        return sa.func.strpos(sa.func.lower(sa.func.coalesce(json_text(value), "")), str(operand or "").lower()) > 0
+    if operator == "greater_than":
+        return _numeric(value) > _parse_number(operand)
+    if operator == "less_than":
+        return _numeric(value) < _parse_number(operand)
+    if operator == "is_empty":
+        return is_empty(value)
+    if operator == "is_not_empty":
+        return sa.not_(is_empty(value))
+    raise HTTPException(status_code=400, detail=f"Unsupported filter operator '{operator}'")
+
+
+def _containment_candidates(operand: Optional[str]) -> Tuple[List[Any], List[Any], List[Any]]:
+    """JSON values `v` with `str(v) == operand`, as (exact, numeric, container) candidates.
+
+    Python's spelling decides: "True" matches JSON true but "true" does not, and "1"
+    matches the integer 1 but not 1.0. JSONB containment compares numbers by value, so
+    whole-number candidates also need the stored text to equal `operand`; lists and
+    objects (spelled as Python prints them) must equal the stored value, not just be
+    contained in it.
+    """
+    text = str(operand)
+    exact: List[Any] = [text]
+    numeric: List[Any] = []
+    containers: List[Any] = []
+    if text in ("True", "False"):
+        exact.append(text == "True")
+    if _INTEGER_TEXT.fullmatch(text):
+        numeric.append(int(text))
+    else:
+        try:
+            number = float(text)
+        except ValueError:
+            number = None
+        if number is not None and math.isfinite(number) and repr(number) == text:
+            # Only whole numbers can be stored both as int and as float (1 vs 1.0).
+            (numeric if number.is_integer() else exact).append(number)
+    if text[:1] in ("[", "{"):
+        try:
+            container = ast.literal_eval(text)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            container = None
+        if isinstance(container, (list, dict)) and str(container) == text:
+            containers.append(container)
+    return exact, numeric, containers
+
+
+def data_predicate(data: Any, keys: List[str], operator: str, operand: Optional[str]) -> Any:
+    """Predicate for one filter against `submission.data`, read through `keys` (see column_storage_keys).
+
+    Equality compiles to `data @> {key: value}` containment and emptiness checks to
+    `data ? key`, both of which the GIN index on submission.data can answer. Equality
+    keeps the meaning of `str(data.get(key)) == operand` (see `_containment_candidates`;
+    "None" matches a missing key or JSON null). Like `json_value`, the first key present
+    wins: a later (legacy) key only matches when none of the keys before it is in `data`.
+    """
+    if operator in ("equals", "not_equals"):
+        exact, numeric, containers = _containment_candidates(operand)
+        matches = sa.or_(*(
+            sa.and_(
+                sa.or_(
+                    *(data.contains({key: candidate}) for candidate in exact),
+                    *(sa.and_(data.contains({key: candidate}), data[key].astext == str(operand)) for candidate in numeric),
+                    *(sa.and_(data.contains({key: candidate}), data[key] == sa.cast(candidate, JSONB)) for candidate in containers),
+                ),
+                *(sa.not_(data.has_key(earlier)) for earlier in keys[:index]),
+            )
+            for index, key in enumerate(keys)
+        ))
+        if str(operand) == "None":
+            value = json_value(data, keys)
+            matches = sa.or_(matches, value.is_(None), sa.func.jsonb_typeof(value) == "null")
+        return matches if operator == "equals" else sa.not_(matches)
+    if operator == "is_not_empty":
+        present = sa.or_(*(data.has_key(key) for key in keys))
+        return sa.and_(present, sa.not_(is_empty(json_value(data, keys))))
+    return value_predicate(json_value(data, keys), operator, operand)
+
+
+def json_value(data: Any, keys: List[str]) -> Any:
+    """`data -> key` for the first key present (JSON null counts as present, like dict.get)."""
+    if not keys:
+        return sa.cast(sa.null(), JSONB)
+    expr = data[keys[0]]
+    for key in keys[1:]:
+        expr = sa.func.coalesce(expr, data[key])
+    return expr
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, expected_length: int) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != expected_length:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
@@ -1,5 +1,6 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
@@ -7,7 +8,13 @@ import os
 # Load .env BEFORE importing modules that read environment variables
 load_dotenv()
 
-from database import create_db_and_tables
+from sqlalchemy import exc as sa_exc
+from database import DB_ASYNC, create_db_and_tables, current_async_engine, dispose_async_engine, engine
+from db_pool import pool_stats
+from async_db import install_async_db
+from response_compression import CompressionMiddleware
+from password_hashing import shutdown_pool as shutdown_password_pool
+from request_metrics import METRICS_ENABLED, install_metrics, require_metrics_token
 from routers import auth
 from routers import forms
 from routers import projects
@@ -17,6 +24,8 @@ from routers import views
 async def lifespan(app: FastAPI):
     create_db_and_tables()
     yield
+    shutdown_password_pool()
+    await dispose_async_engine()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -35,14 +44,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Compress JSON/CSV/NDJSON responses (zstd, brotli or gzip, per Accept-Encoding)
+app.add_middleware(CompressionMiddleware)
+
+# Latency / payload / SQL-per-request metrics and GET /metrics (outermost middleware)
+if METRICS_ENABLED:
+    install_metrics(app)
+
+if DB_ASYNC:
+    install_async_db(app)
+
 app.include_router(auth.router, prefix="/api")
 app.include_router(forms.router, prefix="/api")
 app.include_router(forms.forms_router, prefix="/api")
 app.include_router(projects.router, prefix="/api")
 app.include_router(views.router, prefix="/api")
 
+# Postgres cancels statements that run past statement_timeout with SQLSTATE 57014.
+QUERY_CANCELED = "57014"
+
+
+@app.exception_handler(sa_exc.OperationalError)
+async def handle_operational_error(request: Request, exc: sa_exc.OperationalError):
+    if getattr(exc.orig, "sqlstate", None) == QUERY_CANCELED:
+        return JSONResponse(status_code=503, content={"detail": "Query exceeded the statement timeout"})
+    raise exc
+
+
+@app.exception_handler(sa_exc.TimeoutError)
+async def handle_pool_timeout(request: Request, exc: sa_exc.TimeoutError):
+    return JSONResponse(status_code=503, content={"detail": "No database connection available"})
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
+
+
+@app.get("/health/pool", dependencies=[Depends(require_metrics_token)])
+def read_pool_health():
+    stats = {"sync": pool_stats(engine)}
+    async_engine = current_async_engine()
+    if async_engine is not None:
+        stats["async"] = pool_stats(async_engine.sync_engine)
+    return stats
@@ -0,0 +1,184 @@
+"""In-process metric registry.
+
+Counters, gauges and histograms are process-local and thread-safe; `snapshot()` returns
+their current values so they can be logged, and `exposition()` renders them in the
+Prometheus text format for `GET /metrics` (see request_metrics.py). Values that are
+cheaper to read on demand than to track (e.g. pool occupancy) are filled in by
+collectors registered with `register_collector`, which run on each exposition.
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def expose(self) -> Iterable[str]:
+        for labels, value in sorted(self.samples().items()):
+            yield f"{self.name}{_labels(labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    """A value that goes up and down (e.g. work currently queued)."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Observations counted into cumulative `le` buckets, with their count and sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: one count per bucket, one for +Inf, then the sum.
+        self._values: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def value(self, **labels: str) -> float:
+        """Number of observations."""
+        with self._lock:
+            series = self._values.get(tuple(sorted(labels.items())))
+            return sum(series[:-1]) if series else 0
+
+    def samples(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return {labels: sum(series[:-1]) for labels, series in self._values.items()}
+
+    def expose(self) -> Iterable[str]:
+        with self._lock:
+            values = {labels: list(series) for labels, series in self._values.items()}
+        for labels, series in sorted(values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(labels + (('le', _number(bound)),))} {_number(cumulative)}"
+            yield f"{self.name}_count{_labels(labels)} {_number(cumulative)}"
+            yield f"{self.name}_sum{_labels(labels)} {_number(series[-1])}"
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+_registry: Dict[str, Metric] = {}
+_registry_lock = threading.Lock()
+_collectors: List[Callable[[], None]] = []
+
+
+def _register(cls: type, name: str, documentation: str, **options: object) -> Metric:
+    with _registry_lock:
+        existing = _registry.get(name)
+        if existing is None:
+            existing = _registry[name] = cls(name, documentation, **options)
+        return existing
+
+
+def counter(name: str, documentation: str) -> Counter:
+    """Return the counter registered under `name`, creating it on first use."""
+    return _register(Counter, name, documentation)
+
+
+def gauge(name: str, documentation: str) -> Gauge:
+    """Return the gauge registered under `name`, creating it on first use."""
+    return _register(Gauge, name, documentation)
+
+
+def histogram(name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Return the histogram registered under `name`, creating it on first use."""
+    return _register(Histogram, name, documentation, buckets=buckets)
+
+
+def register_collector(collect: Callable[[], None]) -> None:
+    """Run `collect` (which sets gauges) before each exposition."""
+    with _registry_lock:
+        if collect not in _collectors:
+            _collectors.append(collect)
+
+
+def snapshot() -> Dict[str, Dict[LabelValues, float]]:
+    """Current values; histograms report their observation counts."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {m.name: m.samples() for m in metrics}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(labels: LabelValues) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def exposition() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        collectors = list(_collectors)
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    for collect in collectors:
+        collect()
+    lines: List[str] = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,488 @@
+"""Chunked runner for data migrations over `submission.data`.
+
+Scripts describe a migration as a `transform(form, data)` function that returns the
+new data for one submission (or None to leave it alone); the runner does the rest:
+
+- keyset iteration over each form's submissions in id order, `batch_size` rows at a
+  time, so memory stays flat however big the form is;
+- one short transaction per batch: rows are locked (FOR UPDATE), changed rows are
+  written back with a single UPDATE, and the relation index and typed projection of
+  those rows (of every row with `refresh=True`) are refreshed like any API write;
+- an optional JSON checkpoint file recording the last committed id per form, so an
+  interrupted run resumes where it stopped (finished forms are skipped);
+- several forms migrated in parallel (`workers`), a shared rows-per-second throttle,
+  and, for command-line runs, periodic progress / throughput lines on stdout.
+
+Migrations that can be written as SQL can also run set-based (`run_sql_job`): a
+`sql_transform(form)` returns `SqlUpdate`s, and each batch becomes one
+`UPDATE ... SET data = ... WHERE <needs change> RETURNING id` per update over an id
+range, so no row travels to Python; a dry run only counts the matching rows.
+`normalized_reference_sql` is the SQL counterpart of `normalize_reference_value`.
+
+Scripts can expose the same options with `add_runner_arguments` and `run_from_args`.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from sqlmodel import Session, select
+
+from database import engine
+from models import Form
+from projections import project_submissions, projected_fields
+from relation_index import index_submissions
+
+Transform = Callable[[Form, Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class SqlUpdate(NamedTuple):
+    """One set-based rewrite: `SET data = <set_sql>` for the rows matching `where_sql`.
+
+    Both are SQL over the `data` column; `where_sql` must only match rows the update
+    changes. Bind parameter names must be unique among the updates of one form.
+    `reindex=False` skips the relation index / projection refresh of the updated
+    rows, for rewrites that cannot change what those read from `data`.
+    """
+
+    set_sql: str
+    where_sql: str
+    params: Dict[str, Any]
+    reindex: bool = True
+
+
+SqlTransform = Callable[[Form], List[SqlUpdate]]
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_SQL_BATCH_SIZE = 10000
+
+_BATCH = """
+SELECT id, data FROM submission
+WHERE form_id = :form_id AND (CAST(:after AS uuid) IS NULL OR id > CAST(:after AS uuid))
+ORDER BY id LIMIT :limit
+FOR UPDATE
+"""
+
+_UPDATE = """
+UPDATE submission AS s SET data = p.data
+FROM unnest(:ids, CAST(:datas AS jsonb[])) AS p(id, data)
+WHERE s.id = p.id
+"""
+
+_SQL_RANGE = """
+SELECT count(*), (array_agg(id ORDER BY id DESC))[1] FROM (
+    SELECT id FROM submission
+    WHERE form_id = :form_id AND (CAST(:after AS uuid) IS NULL OR id > CAST(:after AS uuid))
+    ORDER BY id LIMIT :limit
+) AS batch
+"""
+
+_SQL_UPDATE = """
+UPDATE submission SET data = /*set*/
+WHERE form_id = :form_id AND (CAST(:after AS uuid) IS NULL OR id > CAST(:after AS uuid)) AND id <= :upper
+  AND (/*where*/)
+RETURNING id
+"""
+
+_SQL_COUNT = """
+SELECT count(*), count(*) FILTER (WHERE /*where*/) FROM submission
+WHERE form_id = :form_id AND (CAST(:after AS uuid) IS NULL OR id > CAST(:after AS uuid))
+"""
+
+_IDS = sa.bindparam("ids", type_=ARRAY(PG_UUID(as_uuid=True)))
+_DATAS = sa.bindparam("datas", type_=ARRAY(sa.Text))
+
+_DONE = "done"
+
+
+class Checkpoint:
+    """Last committed submission id per form of one job, persisted to a JSON file."""
+
+    def __init__(self, path: Optional[str], job: str):
+        self.path = path
+        self.job = job
+        self._lock = threading.Lock()
+        self._all: Dict[str, Dict[str, str]] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._all = json.load(f)
+
+    def position(self, form_id: UUID) -> Optional[str]:
+        with self._lock:
+            return self._all.get(self.job, {}).get(str(form_id))
+
+    def save(self, form_id: UUID, position: str) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            self._all.setdefault(self.job, {})[str(form_id)] = position
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._all, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+class Throttle:
+    """Caps the combined row rate of all workers (None = unlimited)."""
+
+    def __init__(self, rows_per_second: Optional[float]):
+        self.rows_per_second = rows_per_second
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self, rows: int) -> None:
+        if not self.rows_per_second or rows <= 0:
+            return
+        with self._lock:
+            start = max(self._next, time.monotonic())
+            self._next = start + rows / self.rows_per_second
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class JobStats:
+    """Counters of one run, updated by every worker, plus the progress reporter."""
+
+    def __init__(self, job: str, total_forms: int, progress_interval: Optional[float]):
+        self.job = job
+        self.total_forms = total_forms
+        self.progress_interval = progress_interval
+        self.forms_done = 0
+        self.batches = 0
+        self.scanned = 0
+        self.updated = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.scanned / self.elapsed if self.elapsed > 0 else 0.0
+
+    def add_batch(self, scanned: int, updated: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.scanned += scanned
+            self.updated += updated
+            now = time.monotonic()
+            due = bool(self.progress_interval) and now - self._last_report >= self.progress_interval
+            if due:
+                self._last_report = now
+        if due:
+            print(self.line(), flush=True)
+
+    def form_done(self) -> None:
+        with self._lock:
+            self.forms_done += 1
+
+    def line(self) -> str:
+        return (
+            f"[{self.job}] forms {self.forms_done}/{self.total_forms}, batches {self.batches}, "
+            f"scanned {self.scanned}, updated {self.updated}, {self.rate:.0f} rows/s, {self.elapsed:.1f}s"
+        )
+
+
+def _migrate_form(
+    form_id: UUID,
+    transform: Transform,
+    *,
+    batch_size: int,
+    dry_run: bool,
+    checkpoint: Checkpoint,
+    throttle: Throttle,
+    stats: JobStats,
+    refresh: bool = False,
+) -> None:
+    after = checkpoint.position(form_id)
+    if after == _DONE:
+        stats.form_done()
+        return
+    with Session(engine) as session:
+        form = session.get(Form, form_id)
+        if form is None:
+            stats.form_done()
+            return
+        projection = projected_fields(form.schema_, form.settings)
+        while True:
+            connection = session.connection()
+            rows = connection.execute(
+                sa.text(_BATCH), {"form_id": form_id, "after": after, "limit": batch_size}
+            ).all()
+            if not rows:
+                break
+            ids: List[UUID] = []
+            datas: List[str] = []
+            for submission_id, data in rows:
+                new_data = transform(form, dict(data or {}))
+                if new_data is not None and new_data != data:
+                    ids.append(submission_id)
+                    datas.append(json.dumps(new_data))
+            if ids and not dry_run:
+                connection.execute(sa.text(_UPDATE).bindparams(_IDS, _DATAS), {"ids": ids, "datas": datas})
+            stale = [row[0] for row in rows] if refresh else ids
+            if stale and not dry_run:
+                index_submissions(connection, stale)
+                project_submissions(connection, form_id, projection, stale)
+            if dry_run:
+                session.rollback()
+            else:
+                session.commit()
+            after = str(rows[-1][0])
+            if not dry_run:
+                checkpoint.save(form_id, after)
+            stats.add_batch(len(rows), len(ids))
+            throttle.wait(len(rows))
+    if not dry_run:
+        checkpoint.save(form_id, _DONE)
+    stats.form_done()
+
+
+def _migrate_form_sql(
+    form_id: UUID,
+    sql_transform: SqlTransform,
+    *,
+    batch_size: int,
+    dry_run: bool,
+    checkpoint: Checkpoint,
+    throttle: Throttle,
+    stats: JobStats,
+) -> None:
+    after = checkpoint.position(form_id)
+    if after == _DONE:
+        stats.form_done()
+        return
+    with Session(engine) as session:
+        form = session.get(Form, form_id)
+        updates = sql_transform(form) if form is not None else []
+        if not updates:
+            stats.form_done()
+            return
+        connection = session.connection()
+        if dry_run:
+            where = " OR ".join(f"({update.where_sql})" for update in updates)
+            params: Dict[str, Any] = {"form_id": form_id, "after": after}
+            for update in updates:
+                params.update(update.params)
+            scanned, matched = connection.execute(sa.text(_SQL_COUNT.replace("/*where*/", where)), params).one()
+            stats.add_batch(scanned, matched)
+            stats.form_done()
+            return
+        projection = projected_fields(form.schema_, form.settings)
+        while True:
+            connection = session.connection()
+            scanned, upper = connection.execute(
+                sa.text(_SQL_RANGE), {"form_id": form_id, "after": after, "limit": batch_size}
+            ).one()
+            if not scanned:
+                break
+            changed, stale = set(), set()
+            for update in updates:
+                statement = _SQL_UPDATE.replace("/*set*/", update.set_sql).replace("/*where*/", update.where_sql)
+                result = connection.execute(
+                    sa.text(statement), {"form_id": form_id, "after": after, "upper": upper, **update.params}
+                )
+                updated = result.scalars().all()
+                changed.update(updated)
+                if update.reindex:
+                    stale.update(updated)
+            if stale:
+                ids = sorted(stale)
+                index_submissions(connection, ids)
+                project_submissions(connection, form_id, projection, ids)
+            session.commit()
+            after = str(upper)
+            checkpoint.save(form_id, after)
+            stats.add_batch(scanned, len(changed))
+            throttle.wait(scanned)
+    checkpoint.save(form_id, _DONE)
+    stats.form_done()
+
+
+def _run(
+    job: str,
+    migrate_form: Callable[..., None],
+    transform: Any,
+    form_ids: Optional[Iterable[Any]],
+    *,
+    batch_size: int,
+    workers: int,
+    checkpoint_path: Optional[str],
+    max_rows_per_second: Optional[float],
+    dry_run: bool,
+    progress_interval: Optional[float],
+    **extra: Any,
+) -> JobStats:
+    if form_ids is None:
+        with Session(engine) as session:
+            ids = list(session.exec(select(Form.id).order_by(Form.id)).all())
+    else:
+        ids = [UUID(str(form_id)) for form_id in form_ids]
+
+    checkpoint = Checkpoint(checkpoint_path, job)
+    throttle = Throttle(max_rows_per_second)
+    stats = JobStats(job, len(ids), progress_interval)
+    options = dict(batch_size=batch_size, dry_run=dry_run, checkpoint=checkpoint, throttle=throttle, stats=stats, **extra)
+
+    if workers <= 1:
+        for form_id in ids:
+            migrate_form(form_id, transform, **options)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="migrate") as pool:
+            for future in [pool.submit(migrate_form, form_id, transform, **options) for form_id in ids]:
+                future.result()
+    if progress_interval is not None:
+        print(stats.line(), flush=True)
+    return stats
+
+
+def run_job(
+    job: str,
+    transform: Transform,
+    form_ids: Optional[Iterable[Any]] = None,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = 1,
+    checkpoint_path: Optional[str] = None,
+    max_rows_per_second: Optional[float] = None,
+    dry_run: bool = False,
+    progress_interval: Optional[float] = None,
+    refresh: bool = False,
+) -> JobStats:
+    """Apply `transform` to every submission of the given forms (default: all forms).
+
+    `job` names the run in progress lines and in the checkpoint file, so one file can
+    hold several jobs; use a name that changes when the job's parameters do.
+    Progress is printed every `progress_interval` seconds (0: only a final line) and
+    not at all with the default None, e.g. when the job runs inside the API server.
+    `refresh=True` rebuilds the relation index and projection of every row scanned,
+    changed or not, e.g. after the form's relation or projected fields changed.
+    """
+    return _run(
+        job,
+        _migrate_form,
+        transform,
+        form_ids,
+        batch_size=batch_size,
+        workers=workers,
+        checkpoint_path=checkpoint_path,
+        max_rows_per_second=max_rows_per_second,
+        dry_run=dry_run,
+        progress_interval=progress_interval,
+        refresh=refresh,
+    )
+
+
+def run_sql_job(
+    job: str,
+    sql_transform: SqlTransform,
+    form_ids: Optional[Iterable[Any]] = None,
+    *,
+    batch_size: int = DEFAULT_SQL_BATCH_SIZE,
+    workers: int = 1,
+    checkpoint_path: Optional[str] = None,
+    max_rows_per_second: Optional[float] = None,
+    dry_run: bool = False,
+    progress_interval: Optional[float] = None,
+) -> JobStats:
+    """Set-based `run_job`: run the `SqlUpdate`s of `sql_transform(form)` over each form in id-range batches.
+
+    A dry run counts each form's submissions and those matching any update's
+    `where_sql` in one query, without writing anything.
+    """
+    return _run(
+        job,
+        _migrate_form_sql,
+        sql_transform,
+        form_ids,
+        batch_size=batch_size,
+        workers=workers,
+        checkpoint_path=checkpoint_path,
+        max_rows_per_second=max_rows_per_second,
+        dry_run=dry_run,
+        progress_interval=progress_interval,
+    )
+
+
+def add_runner_arguments(parser: argparse.ArgumentParser, sql: bool = False) -> None:
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help=f"Submissions per batch / transaction (default {DEFAULT_BATCH_SIZE}, {DEFAULT_SQL_BATCH_SIZE} with --sql)",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Forms migrated in parallel")
+    parser.add_argument("--checkpoint", help="JSON file to record progress in and resume from")
+    parser.add_argument("--max-rows-per-second", type=float, help="Throttle across all workers")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress lines (0 = only the final line)")
+    parser.add_argument("--dry-run", action="store_true", help="Count changes without writing")
+    if sql:
+        parser.add_argument("--sql", action="store_true", help="Run as set-based UPDATE statements")
+
+
+def run_from_args(
+    job: str,
+    transform: Transform,
+    args: argparse.Namespace,
+    form_ids: Optional[Iterable[Any]] = None,
+    sql_transform: Optional[SqlTransform] = None,
+) -> JobStats:
+    set_based = sql_transform is not None and getattr(args, "sql", False)
+    run = run_sql_job if set_based else run_job
+    return run(
+        job,
+        sql_transform if set_based else transform,
+        form_ids,
+        batch_size=args.batch_size or (DEFAULT_SQL_BATCH_SIZE if set_based else DEFAULT_BATCH_SIZE),
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        max_rows_per_second=args.max_rows_per_second,
+        dry_run=args.dry_run,
+        progress_interval=args.progress_interval,
+    )
+
+
+def _python_text(value: str) -> str:
+    # str() of a JSON scalar as Python prints it: strings unquoted, booleans as True/False.
+    return (
+        "CASE WHEN jsonb_typeof(" + value + ") = 'boolean' THEN initcap(" + value + " #>> '{}') "
+        "ELSE " + value + " #>> '{}' END"
+    )
+
+
+# Whitespace as str.strip() sees it (Postgres' \s is ASCII only).
+_SPACE = r"[\s\u001c-\u001f\u0085\u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]"
+
+
+def _stripped(text: str) -> str:
+    return "regexp_replace(" + text + ", '^" + _SPACE + "+|" + _SPACE + "+$', '', 'g')"
+
+
+def normalized_reference_sql(value: str) -> str:
+    """SQL counterpart of `form_schema.normalize_reference_value` for the JSONB expression `value`.
+
+    Evaluates to a JSON string id, a JSON array of string ids, or SQL NULL where the
+    Python version returns None. (List elements that are objects without an id, or
+    nested lists, keep their JSON text where Python would use its repr.)
+    """
+    value = "(" + value + ")"
+    element = "(CASE WHEN jsonb_typeof(e) = 'object' AND jsonb_typeof(e -> 'id') <> 'null' THEN e -> 'id' ELSE e END)"
+    return (
+        "(CASE WHEN coalesce(jsonb_typeof(" + value + "), 'null') = 'null' THEN NULL"
+        " WHEN jsonb_typeof(" + value + ") = 'array' THEN (SELECT jsonb_agg(t ORDER BY n) FROM"
+        " (SELECT n, " + _stripped("coalesce(" + _python_text(element) + ", '')") + " AS t"
+        " FROM jsonb_array_elements(" + value + ") WITH ORDINALITY AS a(e, n)) AS ids WHERE t <> '')"
+        " WHEN jsonb_typeof(" + value + ") = 'object'"
+        " THEN to_jsonb(NULLIF(" + _stripped(_python_text("(" + value + " -> 'id')")) + ", ''))"
+        " ELSE to_jsonb(NULLIF(" + _stripped(_python_text(value)) + ", '')) END)"
+    )
@@ -1,4 +1,5 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
+from decimal import Decimal
 from typing import Optional, List, Dict, Any
 from uuid import UUID, uuid4
 from sqlmodel import Field, SQLModel, Relationship, Column
@@ -79,6 +80,9 @@ class Form(SQLModel, table=True):
 
 
 class Submission(SQLModel, table=True):
+    # Serves per-form listing in (created_at, id) order and keyset pagination over it.
+    __table_args__ = (sa.Index("ix_submission_form_id_created_at_id", "form_id", "created_at", "id"),)
+
     id: Optional[UUID] = Field(default_factory=uuid4, sa_column=uuid_pk_column())
     form_id: UUID = Field(sa_column=uuid_fk_column("form.id"))
     data: Dict[str, Any] = Field(default_factory=dict, sa_column=json_column(dict))
@@ -87,6 +91,48 @@ class Submission(SQLModel, table=True):
     form: Form = Relationship(back_populates="submissions")
 
 
+class SubmissionRelation(SQLModel, table=True):
+    """One edge per submission id referenced by a relation field of a (child) submission.
+
+    Derived from `Submission.data` and maintained by relation_index.py on every
+    submission write; rows go away with the child submission (ON DELETE CASCADE).
+    """
+    # Serves "children of this parent in that form" lookups from the view engine.
+    __table_args__ = (sa.Index("ix_submissionrelation_parent", "parent_id", "child_form_id", "field_id", "child_id"),)
+
+    child_id: UUID = Field(
+        sa_column=Column(UUID_SQLA_TYPE, sa.ForeignKey("submission.id", ondelete="CASCADE"), primary_key=True)  # type: ignore[arg-type]
+    )
+    field_id: str = Field(sa_column=Column(sa.Text, primary_key=True))
+    parent_id: UUID = Field(sa_column=Column(UUID_SQLA_TYPE, primary_key=True))  # type: ignore[arg-type]
+    child_form_id: UUID = Field(sa_column=Column(UUID_SQLA_TYPE, nullable=False))  # type: ignore[arg-type]
+
+
+class SubmissionProjection(SQLModel, table=True):
+    """Typed copy of one projected field of a submission (see projections.py).
+
+    Only forms that opt in through `settings.projectedFields` have rows; each row
+    holds the field's value in the column matching its kind, and empty or
+    unparseable values have no row.
+    """
+    # (form, field, value) lets aggregates and range scans over one field run index-only.
+    __table_args__ = (
+        sa.Index("ix_submissionprojection_number", "form_id", "field_key", "number_value"),
+        sa.Index("ix_submissionprojection_date", "form_id", "field_key", "date_value"),
+    )
+
+    submission_id: UUID = Field(
+        sa_column=Column(UUID_SQLA_TYPE, sa.ForeignKey("submission.id", ondelete="CASCADE"), primary_key=True)  # type: ignore[arg-type]
+    )
+    field_key: str = Field(sa_column=Column(sa.Text, primary_key=True))
+    form_id: UUID = Field(sa_column=Column(UUID_SQLA_TYPE, nullable=False))  # type: ignore[arg-type]
+    number_value: Optional[Decimal] = Field(default=None, sa_column=Column(sa.Numeric, nullable=True))
+    date_value: Optional[date] = Field(default=None, sa_column=Column(sa.Date, nullable=True))
+    bool_value: Optional[bool] = Field(default=None, sa_column=Column(sa.Boolean, nullable=True))
+    # Currency code of currency fields, next to the amount in number_value.
+    currency: Optional[str] = Field(default=None, sa_column=Column(sa.Text, nullable=True))
+
+
 class View(SQLModel, table=True):
     id: Optional[UUID] = Field(default_factory=uuid4, sa_column=uuid_pk_column())
     project_id: UUID = Field(sa_column=uuid_fk_column("project.id"))
@@ -0,0 +1,123 @@
+"""Password hashing in a process pool, off the request threadpool and the event loop.
+
+Argon2 is deliberately expensive (hundreds of milliseconds of CPU and 64 MiB of memory
+per call with the defaults). Run inline, a burst of logins occupies every threadpool
+slot and starves the other sync routes; run in threads, it still serializes on the
+GIL-holding parts of passlib. `hash_password` and `check_password` hand the work to a
+pool of PASSWORD_HASH_WORKERS processes. 0 runs it in the threadpool instead, e.g. for
+local debugging, or for scripts that drive the app in-process without an
+`if __name__ == "__main__"` guard (pool workers import the main module). At most
+PASSWORD_HASH_MAX_QUEUE calls may be waiting or running; past that callers get 503
+with Retry-After rather than an ever-growing queue.
+
+Argon2 cost is set with PASSWORD_ARGON2_TIME_COST, PASSWORD_ARGON2_MEMORY_COST (KiB) and
+PASSWORD_ARGON2_PARALLELISM; the defaults are passlib's, so existing hashes stay
+current. Hashes made with bcrypt or with different argon2 parameters are reported by
+`needs_rehash` and replaced after the next successful login (auth_utils.rehash_password).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+import metrics
+
+PASSWORD_ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", "3"))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", "65536"))
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", "4"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or min(4, os.cpu_count() or 1))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "256"))
+
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=PASSWORD_ARGON2_TIME_COST,
+    argon2__memory_cost=PASSWORD_ARGON2_MEMORY_COST,
+    argon2__parallelism=PASSWORD_ARGON2_PARALLELISM,
+)
+
+queue_depth = metrics.gauge("password_hash_queue_depth", "Password hash/verify calls waiting for or running in the pool")
+duration_histogram = metrics.histogram("password_hash_duration_seconds", "Password hash/verify latency by operation, queueing included")
+rejected_counter = metrics.counter("password_hash_rejected_total", "Password hash/verify calls refused because the queue was full")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+def _executor() -> Optional[Executor]:
+    global _pool
+    if PASSWORD_HASH_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Workers start from a clean interpreter rather than a fork of the (threaded) server.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _submit(fn: Callable[..., Any], *args: Any) -> Any:
+    global _pool
+    pool = _executor()
+    if pool is None:
+        return await run_in_threadpool(fn, *args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); start a fresh pool and retry once.
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        return await asyncio.get_running_loop().run_in_executor(_executor(), fn, *args)
+
+
+async def _run(operation: str, fn: Callable[..., Any], *args: Any) -> Any:
+    if queue_depth.value() >= PASSWORD_HASH_MAX_QUEUE:
+        rejected_counter.inc(operation=operation)
+        raise HTTPException(status_code=503, detail="Too many sign-ins in progress; try again shortly", headers={"Retry-After": "1"})
+    queue_depth.inc()
+    started = time.perf_counter()
+    try:
+        return await _submit(fn, *args)
+    finally:
+        queue_depth.dec()
+        duration_histogram.observe(time.perf_counter() - started, operation=operation)
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _hash, password)
+
+
+async def check_password(password: str, hashed_password: str) -> bool:
+    return await _run("verify", _verify, password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a (verified) hash uses a deprecated scheme or other argon2 parameters than configured."""
+    return pwd_context.needs_update(hashed_password)
@@ -0,0 +1,108 @@
+"""Typed projection of selected form fields into `SubmissionProjection`.
+
+Submission values live in JSONB, so every numeric or date comparison casts at query
+time. A form can opt in by listing field keys under `settings.projectedFields`; each
+listed field of a projectable type is then mirrored, per submission, into a typed
+column: `number_value` (number, slider, rating, calculated, and currency amounts with the
+code in `currency`), `date_value` (date) or `bool_value` (toggle). Analytic queries read
+those columns instead of the JSON.
+
+Rows are derived in SQL, in the transaction that writes the submissions. When a
+form's projected fields or their types change, form_refresh.py re-derives all of them
+in the background; `rebuild_form` does it in one statement, for scripts.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+
+from form_schema import canonical_storage_key
+
+PROJECTION_TABLE = "submissionprojection"
+
+# Field type -> projection kind.
+PROJECTION_KINDS: Dict[str, str] = {
+    "number": "number",
+    "slider": "number",
+    "rating": "number",
+    "currency": "number",
+    "calculated": "number",
+    "date": "date",
+    "toggle": "bool",
+}
+
+_INSERT = f"""
+INSERT INTO {PROJECTION_TABLE} (submission_id, field_key, form_id, number_value, date_value, bool_value, currency)
+SELECT * FROM (
+    SELECT s.id, f.field_key, s.form_id,
+           CASE WHEN f.kind = 'number' THEN
+               CASE
+                   WHEN jsonb_typeof(v.value) = 'number' THEN (v.value #>> '{{}}')::numeric
+                   WHEN jsonb_typeof(v.value -> 'amount') = 'number' THEN (v.value ->> 'amount')::numeric
+                   WHEN jsonb_typeof(v.value) = 'string' AND pg_input_is_valid(btrim(v.value #>> '{{}}'), 'numeric')
+                       THEN btrim(v.value #>> '{{}}')::numeric
+                   WHEN jsonb_typeof(v.value -> 'amount') = 'string' AND pg_input_is_valid(btrim(v.value ->> 'amount'), 'numeric')
+                       THEN btrim(v.value ->> 'amount')::numeric
+               END
+           END AS number_value,
+           CASE WHEN f.kind = 'date' AND jsonb_typeof(v.value) = 'string' AND pg_input_is_valid(v.value #>> '{{}}', 'date')
+               THEN (v.value #>> '{{}}')::date
+           END AS date_value,
+           CASE WHEN f.kind = 'bool' THEN
+               CASE
+                   WHEN jsonb_typeof(v.value) = 'boolean' THEN (v.value #>> '{{}}')::boolean
+                   WHEN lower(v.value #>> '{{}}') IN ('true', 'false') THEN lower(v.value #>> '{{}}')::boolean
+               END
+           END AS bool_value,
+           CASE WHEN f.kind = 'number' AND jsonb_typeof(v.value -> 'currency') = 'string' THEN v.value ->> 'currency' END AS currency
+    FROM submission s
+    CROSS JOIN jsonb_to_recordset(CAST(:fields AS jsonb)) AS f(field_key text, storage_key text, kind text)
+    CROSS JOIN LATERAL (SELECT s.data -> f.storage_key AS value) AS v
+    WHERE s.form_id = :form_id /*scope*/
+) AS p
+WHERE p.number_value IS NOT NULL OR p.date_value IS NOT NULL OR p.bool_value IS NOT NULL
+"""
+
+_IDS = sa.bindparam("ids", type_=ARRAY(PG_UUID(as_uuid=True)))
+
+
+def projected_fields(schema: Optional[list], settings: Optional[dict]) -> List[Dict[str, str]]:
+    """{field_key, storage_key, kind} of each field `settings.projectedFields` lists, when its type projects."""
+    wanted = (settings or {}).get("projectedFields") or []
+    fields = {f.get("key"): f for f in schema or [] if isinstance(f, dict) and f.get("key")}
+    projected = []
+    for field_key in wanted:
+        field = fields.get(field_key)
+        kind = PROJECTION_KINDS.get(field.get("type")) if field else None
+        storage_key = canonical_storage_key(field) if field else None
+        if kind and storage_key:
+            projected.append({"field_key": str(field_key), "storage_key": storage_key, "kind": kind})
+    return projected
+
+
+def project_submissions(connection: Any, form_id: Any, fields: List[Dict[str, str]], submission_ids: Iterable[Any], replace: bool = True) -> None:
+    """(Re)derive the projection rows of the given submissions of one form.
+
+    `replace=False` skips the delete for submissions that are known to be new.
+    """
+    ids = [UUID(str(i)) for i in submission_ids]
+    if not fields or not ids:
+        return
+    if replace:
+        connection.execute(sa.text(f"DELETE FROM {PROJECTION_TABLE} WHERE submission_id = ANY(:ids)").bindparams(_IDS), {"ids": ids})
+    connection.execute(
+        sa.text(_INSERT.replace("/*scope*/", "AND s.id = ANY(:ids)")).bindparams(_IDS),
+        {"fields": json.dumps(fields), "form_id": UUID(str(form_id)), "ids": ids},
+    )
+
+
+def rebuild_form(connection: Any, form_id: Any, fields: List[Dict[str, str]]) -> int:
+    """Replace every projection row of a form; returns the number of rows written."""
+    params = {"form_id": UUID(str(form_id))}
+    connection.execute(sa.text(f"DELETE FROM {PROJECTION_TABLE} WHERE form_id = :form_id"), params)
+    if not fields:
+        return 0
+    return connection.execute(sa.text(_INSERT), {**params, "fields": json.dumps(fields)}).rowcount
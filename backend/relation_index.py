@@ -0,0 +1,83 @@
+"""Maintain `SubmissionRelation`, the edge index behind view joins.
+
+An edge (child_id, field_id, parent_id, child_form_id) exists for every submission id
+held by a relation field (reference or form_lookup) of a submission. Edges are derived
+in SQL from `submission.data` and the form schema, with the same rules the view
+engine used to apply on every query: the canonical `field.id` value, else the legacy
+`field.key` value; a single id or a list of ids; plain ids or legacy `{"id": ...}`
+objects. Values that are not submission ids are skipped.
+
+Callers maintain the index inside the transaction that writes the submissions.
+"""
+
+from typing import Any, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+
+from form_schema import is_relation_field
+
+RELATION_TABLE = "submissionrelation"
+
+_EDGES = """
+SELECT DISTINCT s.id AS child_id, f.field_id, ref.parent_id::uuid AS parent_id, s.form_id AS child_form_id
+FROM form
+CROSS JOIN LATERAL (
+    SELECT coalesce(nullif(fld->>'id', ''), fld->>'key') AS field_id,
+           nullif(fld->>'id', '') AS id_key,
+           fld->>'key' AS legacy_key
+    FROM jsonb_array_elements(CASE WHEN jsonb_typeof(form.schema_) = 'array' THEN form.schema_ ELSE '[]'::jsonb END) AS fld
+    WHERE (fld->>'type' = 'reference' OR fld->'dataSource'->>'type' = 'form_lookup')
+      AND coalesce(nullif(fld->>'id', ''), fld->>'key') IS NOT NULL
+) AS f
+JOIN submission s ON s.form_id = form.id
+CROSS JOIN LATERAL (
+    SELECT coalesce(nullif(s.data -> f.id_key, 'null'::jsonb), s.data -> f.legacy_key) AS value
+) AS raw
+CROSS JOIN LATERAL jsonb_array_elements(
+    CASE WHEN jsonb_typeof(raw.value) = 'array' THEN raw.value ELSE jsonb_build_array(raw.value) END
+) AS element
+CROSS JOIN LATERAL (
+    SELECT btrim(CASE WHEN jsonb_typeof(element.value) = 'object' THEN element.value->>'id'
+                      ELSE jsonb_build_array(element.value)->>0 END) AS parent_id
+) AS ref
+WHERE ref.parent_id ~ '^[{]?[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}[}]?$'
+  AND """
+
+_INSERT = f"INSERT INTO {RELATION_TABLE} (child_id, field_id, parent_id, child_form_id) "
+
+_IDS = sa.bindparam("ids", type_=ARRAY(PG_UUID(as_uuid=True)))
+
+
+def _insert(scope: str) -> str:
+    return _INSERT + _EDGES + scope + " ON CONFLICT DO NOTHING"
+
+
+def index_submissions(connection: Any, submission_ids: Iterable[Any], replace: bool = True) -> None:
+    """(Re)build the edges of the given child submissions.
+
+    `replace=False` skips the delete for submissions that are known to be new.
+    """
+    ids = [UUID(str(i)) for i in submission_ids]
+    if not ids:
+        return
+    if replace:
+        connection.execute(sa.text(f"DELETE FROM {RELATION_TABLE} WHERE child_id = ANY(:ids)").bindparams(_IDS), {"ids": ids})
+    connection.execute(sa.text(_insert("s.id = ANY(:ids)")).bindparams(_IDS), {"ids": ids})
+
+
+def reindex_form(connection: Any, form_id: Any) -> int:
+    """Rebuild every edge of one form's submissions; returns the number of edges."""
+    params = {"form_id": UUID(str(form_id))}
+    connection.execute(sa.text(f"DELETE FROM {RELATION_TABLE} WHERE child_form_id = :form_id"), params)
+    return connection.execute(sa.text(_insert("form.id = :form_id")), params).rowcount
+
+
+def relation_signature(schema: Optional[list]) -> List[Tuple[Any, Any, Any]]:
+    """What the edges of a form depend on; reindex when it changes."""
+    return sorted(
+        (str(f.get("id") or ""), str(f.get("key") or ""), f.get("type"))
+        for f in schema or []
+        if isinstance(f, dict) and is_relation_field(f)
+    )
@@ -0,0 +1,102 @@
+"""`expand=labels`: relation values returned as `{id, label}` instead of bare submission ids.
+
+Reference and form_lookup values hold ids of submissions in a target form. With
+`expand=labels`, `list_submissions` and the view data endpoint replace each id with
+`{"id": ..., "label": ...}` (lists stay lists), labelled by the field's
+`displayFieldKey` / `dataSource.fieldKey` (see form_schema.relation_label_key and
+field_values.submission_labels). All ids of a response are collected first and
+resolved with one query per target form, so a page costs at most one extra query per
+form it references. Ids that do not resolve get a null label.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlmodel import Session
+
+from field_values import submission_labels
+from form_schema import is_relation_field, normalize_reference_value, relation_label_key, relation_target_form_id
+
+EXPAND_OPTIONS = ("labels",)
+
+
+def parse_expand(expand: Optional[str]) -> bool:
+    """Whether the comma-separated `expand` query parameter asks for labels."""
+    parts = {part.strip() for part in (expand or "").split(",") if part.strip()}
+    unknown = sorted(parts - set(EXPAND_OPTIONS))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported expand '{', '.join(unknown)}'; expected one of {', '.join(EXPAND_OPTIONS)}",
+        )
+    return "labels" in parts
+
+
+def _uuid(value: Any) -> Optional[UUID]:
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _target(field: Optional[dict]) -> Optional[UUID]:
+    if not isinstance(field, dict) or not is_relation_field(field):
+        return None
+    return _uuid(relation_target_form_id(field))
+
+
+def _ids(value: Any) -> List[str]:
+    normalized = normalize_reference_value(value)
+    if normalized is None:
+        return []
+    return normalized if isinstance(normalized, list) else [normalized]
+
+
+def label_source_form_ids(fields: Iterable[Optional[dict]]) -> List[str]:
+    """Target forms whose submissions the labels of these fields are read from."""
+    return sorted({str(target) for target in map(_target, fields) if target is not None})
+
+
+def expand_labels(session: Session, records: List[Dict[str, Any]], fields: Dict[str, Optional[dict]]) -> List[Dict[str, Any]]:
+    """Copies of `records` with the value under each key of `fields` expanded when that field is a relation."""
+    relations = {key: field for key, field in fields.items() if _target(field) is not None}
+    if not relations:
+        return records
+
+    # target form -> (label keys, ids)
+    wanted: Dict[UUID, Tuple[Set[Optional[str]], Set[UUID]]] = {}
+    for record in records:
+        for key, field in relations.items():
+            ids = [u for u in map(_uuid, _ids(record.get(key))) if u is not None]
+            if not ids:
+                continue
+            label_keys, target_ids = wanted.setdefault(_target(field), (set(), set()))
+            label_keys.add(relation_label_key(field))
+            target_ids.update(ids)
+
+    labels: Dict[Tuple[UUID, Optional[str], UUID], Optional[str]] = {}
+    for target, (label_keys, target_ids) in wanted.items():
+        found = submission_labels(session, target, sorted(label_keys, key=lambda k: k or ""), sorted(target_ids))
+        for (submission_id, label_key), label in found.items():
+            labels[(target, label_key, submission_id)] = label
+
+    def expanded(value: Any, field: dict) -> Any:
+        normalized = normalize_reference_value(value)
+        if normalized is None:
+            return value
+        target, label_key = _target(field), relation_label_key(field)
+
+        def item(submission_id: str) -> Dict[str, Any]:
+            return {"id": submission_id, "label": labels.get((target, label_key, _uuid(submission_id)))}
+
+        return [item(i) for i in normalized] if isinstance(normalized, list) else item(normalized)
+
+    result = []
+    for record in records:
+        record = dict(record)
+        for key, field in relations.items():
+            if key in record:
+                record[key] = expanded(record[key], field)
+        result.append(record)
+    return result
@@ -0,0 +1,197 @@
+"""Per-request metrics and the `GET /metrics` endpoint.
+
+`install_metrics(app)` (called from main.py when METRICS_ENABLED is on; it is off by
+default) adds:
+
+- `MetricsMiddleware`, a pure ASGI middleware that records, for every route of the
+  app, request latency, request/response payload sizes (as sent on the wire, i.e.
+  after compression) and the SQL queries each request ran, labelled by method and
+  route template (`/api/forms/{form_id}/submissions`, never the raw path), plus
+  in-flight requests by method. Paths that match no route share one `<unmatched>`
+  label so scanners cannot blow up the series count.
+- SQLAlchemy cursor hooks counting queries and their time. They are registered on
+  the Engine class, so they cover `database.engine` and the async engine's sync
+  facade alike; queries outside a request (background tasks, index builds) only feed
+  the global counters.
+- A collector publishing connection pool occupancy at scrape time.
+- `GET /metrics` in the Prometheus text format.
+
+Without METRICS_ENABLED none of this is installed: no middleware, no event hooks, and
+no endpoint, so requests pay nothing for it.
+
+`/metrics` and `/health/pool` expose route names, traffic and pool sizing, so both
+depend on `require_metrics_token`: scrapers send `Authorization: Bearer <METRICS_TOKEN>`,
+and while METRICS_TOKEN is unset the endpoints answer 404.
+"""
+
+import hmac
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+import sqlalchemy as sa
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.engine import Engine
+
+import metrics
+from database import current_async_engine, engine
+from db_pool import pool_stats
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+EXPOSITION_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED_ROUTE = "<unmatched>"
+
+_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+_QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+request_duration = metrics.histogram("http_request_duration_seconds", "Request latency by method, route template and status")
+requests_in_flight = metrics.gauge("http_requests_in_flight", "Requests being handled by method")
+request_size = metrics.histogram("http_request_size_bytes", "Request body size (Content-Length) by method and route", _SIZE_BUCKETS)
+response_size = metrics.histogram("http_response_size_bytes", "Response body bytes sent by method and route", _SIZE_BUCKETS)
+request_queries = metrics.histogram("http_request_sql_queries", "SQL statements executed per request by route", _QUERY_COUNT_BUCKETS)
+request_query_seconds = metrics.histogram("http_request_sql_seconds", "Time spent in SQL per request by route")
+queries_counter = metrics.counter("db_queries_total", "SQL statements executed")
+query_seconds_counter = metrics.counter("db_query_seconds_total", "Time spent executing SQL statements")
+pool_connections = metrics.gauge("db_pool_connections", "Pooled connections by pool and state (checked_out/checked_in/overflow)")
+pool_capacity = metrics.gauge("db_pool_capacity", "Configured pool_size and max_overflow by pool")
+
+
+class _SqlUsage:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Set per request; threadpool workers and greenlets run handlers in a copy of the
+# request's context, so they add to the same object.
+_sql_usage: ContextVar[Optional[_SqlUsage]] = ContextVar("request_sql_usage", default=None)
+
+_QUERY_STARTED = "metrics.query_started"
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    conn.info[_QUERY_STARTED] = time.perf_counter()
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    started = conn.info.pop(_QUERY_STARTED, None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    queries_counter.inc()
+    query_seconds_counter.inc(elapsed)
+    usage = _sql_usage.get()
+    if usage is not None:
+        usage.queries += 1
+        usage.seconds += elapsed
+
+
+def _collect_pools() -> None:
+    engines = {"sync": engine}
+    async_engine = current_async_engine()
+    if async_engine is not None:
+        engines["async"] = async_engine.sync_engine
+    for name, pool_engine in engines.items():
+        stats = pool_stats(pool_engine)
+        for state in ("checked_out", "checked_in", "overflow"):
+            if state in stats:
+                pool_connections.set(stats[state], pool=name, state=state)
+        pool_capacity.set(stats["pool_size"], pool=name, setting="pool_size")
+        pool_capacity.set(stats["max_overflow"], pool=name, setting="max_overflow")
+
+
+def _route_template(scope: dict) -> str:
+    route = scope.get("route")
+    template = getattr(route, "path_format", None)
+    if not template:
+        return UNMATCHED_ROUTE
+    # Newer FastAPI versions leave routes of included routers unprefixed (`/forms/{form_id}`
+    # for `/api/forms/...`); their regex then matches only the tail of the path, and the
+    # part before it is the include prefix. The prefixes in main.py are all static.
+    path = scope.get("path", "")
+    regex = getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(path):
+        for index in range(1, len(path)):
+            if path[index] == "/" and regex.match(path[index:]):
+                return path[:index] + template
+    return template
+
+
+def _content_length(scope: dict) -> int:
+    for key, value in scope["headers"]:
+        if key == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+class MetricsMiddleware:
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        sent = 0
+
+        async def send_wrapped(message: dict) -> None:
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        usage = _SqlUsage()
+        token = _sql_usage.set(usage)
+        requests_in_flight.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapped)
+        finally:
+            elapsed = time.perf_counter() - started
+            requests_in_flight.dec(method=method)
+            _sql_usage.reset(token)
+            route = _route_template(scope)
+            request_duration.observe(elapsed, method=method, route=route, status=str(status))
+            request_size.observe(_content_length(scope), method=method, route=route)
+            response_size.observe(sent, method=method, route=route)
+            request_queries.observe(usage.queries, route=route)
+            request_query_seconds.observe(usage.seconds, route=route)
+
+
+def require_metrics_token(authorization: Optional[str] = Header(None)) -> None:
+    """Let only callers presenting METRICS_TOKEN through; 404 while no token is configured."""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+
+
+def read_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.exposition(), media_type=EXPOSITION_MEDIA_TYPE)
+
+
+def install_metrics(app: FastAPI) -> None:
+    """Instrument `app` and serve `GET /metrics`; add it after the other middleware so it is outermost."""
+    if not sa.event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        sa.event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        sa.event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    metrics.register_collector(_collect_pools)
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route(
+        "/metrics", read_metrics, methods=["GET"], dependencies=[Depends(require_metrics_token)], include_in_schema=False
+    )
@@ -0,0 +1,296 @@
+"""Response compression negotiated from Accept-Encoding (zstd, brotli or gzip).
+
+`CompressionMiddleware` is a pure ASGI middleware: it compresses each body chunk as
+the app sends it, so streaming responses (exports) are never buffered whole; only
+the first `COMPRESSION_MIN_SIZE` bytes are held back to decide whether a response
+is worth compressing. It leaves alone responses that are small, already encoded,
+marked `Cache-Control: no-transform`, or not text/JSON.
+
+zstd and brotli are used when their packages are installed (`compression.zstd` on
+Python 3.14+ or `zstandard`; `brotli` or `brotlicffi`); gzip is always available.
+The encoding is chosen by the client's q-values, ties going to the server's order in
+COMPRESSION_ENCODINGS. Levels default to COMPRESSION_<ENCODING>_LEVEL and can be set
+per route with the `compression_levels` dependency. Chunks of at least
+COMPRESSION_THREAD_MIN_SIZE bytes are compressed in a worker thread so a large body
+does not stall the event loop.
+
+Compressed responses get `Vary: Accept-Encoding` and a weak ETag (the bytes differ per
+encoding); view_cache.etag_matches accepts weak validators.
+"""
+
+import os
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import anyio
+from fastapi import Request
+
+import metrics
+
+try:
+    from compression import zstd as _zstd_stdlib  # Python 3.14+
+except ImportError:
+    _zstd_stdlib = None
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+try:
+    import brotli as _brotli
+except ImportError:
+    try:
+        import brotlicffi as _brotli
+    except ImportError:
+        _brotli = None
+
+Compress = Callable[[bytes], bytes]
+Compressor = Tuple[Compress, Callable[[], bytes]]
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_THREAD_MIN_SIZE = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", str(256 * 1024)))
+
+# Browsers cap the zstd window at 8 MiB; levels above 19 would exceed it.
+_LEVEL_RANGES = {"zstd": (1, 19), "br": (0, 11), "gzip": (1, 9)}
+_DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript", "application/xml")
+_COMPRESSIBLE_SUFFIXES = ("+json", "+xml")
+
+LEVELS_SCOPE_KEY = "compression.levels"
+
+responses_counter = metrics.counter("compression_responses_total", "Compressed responses by encoding")
+skipped_counter = metrics.counter("compression_skipped_total", "Responses sent uncompressed by reason")
+input_bytes_counter = metrics.counter("compression_input_bytes_total", "Bytes before compression by encoding")
+output_bytes_counter = metrics.counter("compression_output_bytes_total", "Bytes after compression by encoding")
+cpu_seconds_counter = metrics.counter("compression_cpu_seconds_total", "CPU time spent compressing by encoding")
+
+
+def _gzip(level: int) -> Compressor:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def _brotli_compressor(level: int) -> Compressor:
+    compressor = _brotli.Compressor(quality=level)
+    return compressor.process, compressor.finish
+
+
+def _zstd(level: int) -> Compressor:
+    if _zstd_stdlib is not None:
+        compressor = _zstd_stdlib.ZstdCompressor(level=level)
+    else:
+        compressor = _zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, compressor.flush
+
+
+_CODECS: Dict[str, Callable[[int], Compressor]] = {"gzip": _gzip}
+if _brotli is not None:
+    _CODECS["br"] = _brotli_compressor
+if _zstd_stdlib is not None or _zstandard is not None:
+    _CODECS["zstd"] = _zstd
+
+AVAILABLE_ENCODINGS: List[str] = [
+    name.strip()
+    for name in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+    if name.strip() in _CODECS
+]
+
+
+def _clamp(encoding: str, level: int) -> int:
+    low, high = _LEVEL_RANGES[encoding]
+    return max(low, min(high, level))
+
+
+def _env_levels(prefix: str, defaults: Dict[str, int]) -> Dict[str, int]:
+    levels = {}
+    for encoding, default in defaults.items():
+        value = os.getenv(f"{prefix}_{encoding.upper()}_LEVEL")
+        levels[encoding] = _clamp(encoding, int(value) if value else default)
+    return levels
+
+
+DEFAULT_LEVELS = _env_levels("COMPRESSION", _DEFAULT_LEVELS)
+
+
+def compression_levels(name: str, **defaults: int) -> Callable[..., Awaitable[None]]:
+    """Route dependency setting the levels its response is compressed with.
+
+    Use as `dependencies=[Depends(compression_levels("EXPORT", gzip=4, br=2, zstd=1))]`;
+    COMPRESSION_<NAME>_<ENCODING>_LEVEL overrides each default, and encodings not given
+    keep the global level.
+    """
+    levels = _env_levels(f"COMPRESSION_{name}", {**DEFAULT_LEVELS, **defaults})
+
+    async def dependency(request: Request) -> None:
+        request.scope[LEVELS_SCOPE_KEY] = levels
+
+    return dependency
+
+
+def negotiate(accept_encoding: str, available: List[str] = AVAILABLE_ENCODINGS) -> Optional[str]:
+    """The encoding of `available` the client prefers most (None if it accepts none of them)."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    best, best_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _compressible(content_type: Optional[bytes]) -> bool:
+    media_type = (content_type or b"").split(b";")[0].strip().lower().decode("latin-1")
+    return media_type.startswith(_COMPRESSIBLE_TYPES) or media_type.endswith(_COMPRESSIBLE_SUFFIXES)
+
+
+def _skip_reason(status: int, headers: List[Tuple[bytes, bytes]]) -> Optional[str]:
+    if status in (204, 304):
+        return "no_body"
+    if _header(headers, b"content-encoding") is not None:
+        return "encoded"
+    if b"no-transform" in (_header(headers, b"cache-control") or b"").lower():
+        return "no_transform"
+    if not _compressible(_header(headers, b"content-type")):
+        return "content_type"
+    return None
+
+
+def _with_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    if b"accept-encoding" in vary.lower() or vary.strip() == b"*":
+        return headers
+    return [(k, v + b", Accept-Encoding" if k.lower() == b"vary" else v) for k, v in headers]
+
+
+class _Stream:
+    """One response's compressor, with byte and CPU accounting."""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        self._compress, self._finish = _CODECS[encoding](level)
+
+    def _run(self, chunk: bytes, last: bool) -> bytes:
+        started = time.thread_time()
+        out = self._compress(chunk) if chunk else b""
+        if last:
+            out += self._finish()
+        cpu_seconds_counter.inc(time.thread_time() - started, encoding=self.encoding)
+        input_bytes_counter.inc(len(chunk), encoding=self.encoding)
+        output_bytes_counter.inc(len(out), encoding=self.encoding)
+        return out
+
+    async def chunk(self, chunk: bytes, last: bool) -> bytes:
+        if len(chunk) >= COMPRESSION_THREAD_MIN_SIZE:
+            return await anyio.to_thread.run_sync(self._run, chunk, last)
+        return self._run(chunk, last)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: Any, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = _header(scope["headers"], b"accept-encoding")
+        encoding = negotiate(accept_encoding.decode("latin-1")) if accept_encoding else None
+        await _Responder(self.app, scope, encoding, self.minimum_size)(receive, send)
+
+
+class _Responder:
+    def __init__(self, app: Any, scope: dict, encoding: Optional[str], minimum_size: int):
+        self.app = app
+        self.scope = scope
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[dict] = None
+        self.buffer = b""
+        self.stream: Optional[_Stream] = None
+        self.passthrough = False
+
+    async def __call__(self, receive: Callable, send: Callable) -> None:
+        self.send = send
+        await self.app(self.scope, receive, self.send_wrapped)
+
+    async def send_wrapped(self, message: dict) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._flush_start_uncompressed()
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is not None:
+            out = await self.stream.chunk(body, last=not more_body)
+            if out or not more_body:
+                await self.send({"type": "http.response.body", "body": out, "more_body": more_body})
+            return
+
+        # Undecided: hold chunks back until there is enough to judge the response by.
+        self.buffer += body
+        if more_body and len(self.buffer) < self.minimum_size:
+            return
+        body, self.buffer = self.buffer, b""
+        headers = list(self.start.get("headers", []))
+        reason = _skip_reason(self.start["status"], headers)
+        if reason is None and self.encoding is None:
+            reason = "not_accepted"
+        elif reason is None and len(body) < self.minimum_size:
+            reason = "too_small"
+        if reason is not None:
+            skipped_counter.inc(reason=reason)
+            if reason in ("not_accepted", "too_small"):
+                self.start["headers"] = _with_vary(headers)
+            await self._flush_start_uncompressed()
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        levels = self.scope.get(LEVELS_SCOPE_KEY) or DEFAULT_LEVELS
+        self.stream = _Stream(self.encoding, levels[self.encoding])
+        responses_counter.inc(encoding=self.encoding)
+        out = await self.stream.chunk(body, last=not more_body)
+
+        headers = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"content-encoding")]
+        headers = [(k, b"W/" + v if k.lower() == b"etag" and not v.startswith(b"W/") else v) for k, v in headers]
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        if not more_body:
+            headers.append((b"content-length", str(len(out)).encode("latin-1")))
+        self.start["headers"] = _with_vary(headers)
+        await self.send(self.start)
+        self.start = None
+        await self.send({"type": "http.response.body", "body": out, "more_body": more_body})
+
+    async def _flush_start_uncompressed(self) -> None:
+        self.passthrough = True
+        if self.start is not None:
+            start, self.start = self.start, None
+            await self.send(start)
@@ -1,12 +1,14 @@
 from datetime import datetime, timedelta
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from typing import Optional, Tuple
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Response
 import os
 from pydantic import BaseModel
 from sqlmodel import Session, select
 from database import get_session
 from models import User
-from auth_utils import get_password_hash, verify_password, ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, get_current_user
+from async_db import AsyncDBRoute, run_db
+from auth_utils import ACCESS_TOKEN_EXPIRE_MINUTES, CurrentUser, create_access_token, get_current_user, rehash_password
+from password_hashing import check_password, hash_password, needs_rehash
 
 
 class CreateUser(BaseModel):
@@ -28,42 +30,58 @@ class UserRead(BaseModel):
 router = APIRouter(
     prefix="/auth",
     tags=["auth"],
+    route_class=AsyncDBRoute,
 )
 
-@router.post("/signup", response_model=UserRead)
-def signup(user: CreateUser, session: Session = Depends(get_session)):
-    statement = select(User).where(User.email == user.email)
-    existing_user = session.exec(statement).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
+# Password hashing runs in password_hashing's process pool. The handlers are async so
+# a sign-in waiting for it holds neither a threadpool slot nor a database connection:
+# the session is closed (returning its connection) before the hash is computed.
 
-    hashed = get_password_hash(user.password)
-    db_user = User(email=user.email, name=user.name, hashed_password=hashed)
+
+def _credentials(session: Session, email: str) -> Optional[Tuple[str, str]]:
+    row = session.exec(select(User.email, User.hashed_password).where(User.email == email)).first()
+    session.close()
+    return (row[0], row[1]) if row else None
+
+
+def _create_user(session: Session, db_user: User) -> User:
     session.add(db_user)
     session.commit()
     session.refresh(db_user)
     return db_user
 
+
+@router.post("/signup", response_model=UserRead)
+async def signup(user: CreateUser, session: Session = Depends(get_session)):
+    if await run_db(_credentials, session, user.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+
+    hashed = await hash_password(user.password)
+    db_user = User(email=user.email, name=user.name, hashed_password=hashed)
+    return await run_db(_create_user, session, db_user)
+
 class LoginRequest(BaseModel):
     username: str
     password: str
 
 
 @router.post("/login")
-def login(login: LoginRequest, response: Response, session: Session = Depends(get_session)):
-    statement = select(User).where(User.email == login.username)
-    user = session.exec(statement).first()
+async def login(login: LoginRequest, response: Response, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+    credentials = await run_db(_credentials, session, login.username)
 
-    if not user or not verify_password(login.password, user.hashed_password):
+    if not credentials or not await check_password(login.password, credentials[1]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    email, hashed_password = credentials
+    if needs_rehash(hashed_password):
+        background_tasks.add_task(rehash_password, email, login.password, hashed_password)
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": email}, expires_delta=access_token_expires
     )
 
     # set HttpOnly cookie for secure server-side access
@@ -108,5 +126,5 @@ def logout(response: Response):
 
 
 @router.get("/me", response_model=UserRead)
-def me(current_user: User = Depends(get_current_user)):
+def me(current_user: CurrentUser = Depends(get_current_user)):
     return current_user
@@ -1,121 +1,57 @@
-from typing import List, Optional
-from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session, select
-from database import get_session
-from models import Project, Form, Submission, User
-from auth_utils import get_current_user
-
-
-def _normalize_reference_value(raw):
-    """Normalize reference field values.
-
-    Accepts legacy object shapes like {id: "..."} and returns either:
-    - a single ID string
-    - a list of ID strings
-    - None
-    """
-    if raw is None:
-        return None
-
-    if isinstance(raw, list):
-        ids: List[str] = []
-        for v in raw:
-            if isinstance(v, dict) and v.get("id") is not None:
-                s = str(v.get("id")).strip()
-            else:
-                s = str(v).strip() if v is not None else ""
-            if s:
-                ids.append(s)
-        return ids or None
-
-    if isinstance(raw, dict):
-        if raw.get("id") is None:
-            return None
-        s = str(raw.get("id")).strip()
-        return s or None
-
-    s = str(raw).strip()
-    return s or None
-
-
-def _is_relation_field(field: dict) -> bool:
-    if field.get("type") == "reference":
-        return True
-    data_source = field.get("dataSource") or {}
-    return isinstance(data_source, dict) and data_source.get("type") == "form_lookup"
-
-
-def _relation_target_form_id(field: dict) -> Optional[str]:
-    if field.get("type") == "reference":
-        return field.get("targetFormId")
-    data_source = field.get("dataSource") or {}
-    if isinstance(data_source, dict):
-        return data_source.get("formId")
-    return None
-
-
-def _field_key_to_canonical_key(field: dict) -> Optional[str]:
-    """Return the canonical storage key for a field.
-
-    For relation fields (reference + form_lookup) we store under field.id.
-    Everything else remains under field.key.
-    """
-    if _is_relation_field(field) and field.get("id"):
-        return str(field.get("id"))
-    if field.get("key"):
-        return str(field.get("key"))
-    return None
-
-
-def _normalize_relation_fields_in_data(data: dict, schema: list, session: Session) -> dict:
-    """Move relation field values to `data[field.id]` and validate targets exist.
-
-    Relation fields include:
-    - type == "reference" (submission -> submission)
-    - dataSource.type == "form_lookup" (submission id(s) pointing to another form)
-    """
-    out = dict(data or {})
-
-    errors = {}
-
-    for field in schema or []:
-        if not _is_relation_field(field):
-            continue
-
-        field_id = field.get("id")
-        field_key = field.get("key")
-        target_form_id = _relation_target_form_id(field)
-
-        if not field_id:
-            # No stable id to store under; keep legacy behavior.
-            continue
-
-        canonical_key = str(field_id)
-        raw = out.get(canonical_key)
-        if raw is None and field_key:
-            raw = out.get(str(field_key))
-
-        normalized = _normalize_reference_value(raw)
-
-        # Remove legacy key (we will store canonically).
-        if field_key and str(field_key) in out:
-            del out[str(field_key)]
-
-        if normalized is None:
-            if canonical_key in out:
-                del out[canonical_key]
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID, uuid4
+import sqlalchemy as sa
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, select, col
+from database import get_session, statement_timeout
+from async_db import AsyncDBRoute, run_db
+from models import Form, Submission
+from auth_utils import CurrentUser
+from aggregation import AggregateRequest, aggregate_form
+from authz import require_form_owner, require_project_owner, require_submission_owner
+from form_schema import canonical_storage_key, column_storage_keys, is_relation_field
+from form_validator import CompiledForm, compile_visibility, condition_key_map, get_compiled_form, invalidate_form
+from jsonb_filters import data_predicate, decode_cursor, encode_cursor, json_value, parse_filters
+from view_cache import bump_form_version
+from field_values import distinct_values, submission_options, typeahead_options
+from form_indexes import ensure_lookup_label_indexes, form_index_status, indexed_range_condition, managed_indexes, sync_form_indexes
+from form_refresh import schedule_form_refresh
+from formulas import calculated_fields
+from projections import project_submissions, projected_fields
+from relation_index import index_submissions, relation_signature
+from relation_labels import expand_labels, parse_expand
+from json_responses import ModelJSON, json_response
+from response_compression import compression_levels
+from exports import check_export_format, export_filename, export_response, iter_csv, iter_ndjson, stream_rows
+
+MAX_PAGE_SIZE = 5000
+DEFAULT_PAGE_SIZE = 500
+
+FORM_JSON = ModelJSON(Form)
+SUBMISSION_JSON = ModelJSON(Submission)
+
+
+def _lookup_submission_forms(ids: Iterable[str], session: Session) -> Dict[str, str]:
+    """Map submission id -> form id for those of `ids` that exist, in a single IN (...) query."""
+    uuids = set()
+    for s in ids:
+        try:
+            uuids.add(UUID(str(s)))
+        except ValueError:
             continue
+    if not uuids:
+        return {}
+    rows = session.exec(select(Submission.id, Submission.form_id).where(col(Submission.id).in_(uuids))).all()
+    return {str(sub_id): str(form_id) for sub_id, form_id in rows}
 
-        # Validate referenced submission(s)
-        ids_to_check = normalized if isinstance(normalized, list) else [normalized]
-        parsed_target_form: Optional[UUID] = None
-        if target_form_id:
-            try:
-                parsed_target_form = UUID(str(target_form_id))
-            except ValueError:
-                parsed_target_form = None
 
+def _reference_errors(references: List[Tuple[str, List[str], Optional[str]]], found: Dict[str, str]) -> Dict[str, str]:
+    """Validate referenced submission(s) against the result of `_lookup_submission_forms`."""
+    errors: Dict[str, str] = {}
+    for canonical_key, ids_to_check, target_form_id in references:
         for s in ids_to_check:
             try:
                 ref_uuid = UUID(str(s))
@@ -123,138 +59,46 @@ def _normalize_relation_fields_in_data(data: dict, schema: list, session: Sessio
                 errors[canonical_key] = "Invalid reference ID"
                 break
 
-            ref_sub = session.get(Submission, ref_uuid)
-            if ref_sub is None:
+            ref_form_id = found.get(str(ref_uuid))
+            if ref_form_id is None:
                 errors[canonical_key] = "Referenced submission not found"
                 break
-            if parsed_target_form and str(ref_sub.form_id) != str(parsed_target_form):
+            if target_form_id and ref_form_id != target_form_id:
                 errors[canonical_key] = "Referenced submission belongs to a different form"
                 break
+    return errors
 
-        if canonical_key not in errors:
-            out[canonical_key] = normalized
 
+def _normalize_relation_fields_in_data(data: dict, compiled: CompiledForm, session: Session) -> dict:
+    """Move relation field values to `data[field.id]` and validate targets exist."""
+    out, references = compiled.normalize_relations(data)
+    found = _lookup_submission_forms((s for _, ids, _ in references for s in ids), session)
+    errors = _reference_errors(references, found)
     if errors:
         raise HTTPException(status_code=400, detail={"validation_errors": errors})
 
     return out
 
+
 router = APIRouter(
     prefix="/projects",
     tags=["forms"],
+    route_class=AsyncDBRoute,
 )
 
 
-def _resolve_condition_field_value(data: dict, schema: list, field_key: str):
-    """Resolve a condition lookup for `fieldKey`.
-
-    Conditions currently store keys using `field.key`. If the referenced field is a
-    reference field that is stored under `field.id`, fall back to that canonical key.
-    """
-    if field_key in data:
-        return data.get(field_key)
-
-    for f in schema or []:
-        if f.get("key") == field_key and _is_relation_field(f) and f.get("id"):
-            return data.get(str(f.get("id")))
-
-    return data.get(field_key)
-
-
 def is_field_visible(data: dict, field: dict, schema: Optional[list] = None) -> bool:
-    def is_empty_value(val) -> bool:
-        if val is None:
-            return True
-        if isinstance(val, str):
-            return val.strip() == ''
-        if isinstance(val, list):
-            return len(val) == 0
-        if isinstance(val, dict):
-            # Common object-shaped field values
-            if 'amount' in val:
-                return is_empty_value(val.get('amount'))
-            if 'id' in val:
-                return is_empty_value(val.get('id'))
-            return len(val) == 0
-        return False
-
-    def coerce_numeric(val) -> float:
-        # Support currency-like objects: { amount, currency }
-        raw = val
-        if isinstance(raw, dict) and 'amount' in raw:
-            raw = raw.get('amount')
-        # If it's still a dict (unexpected), treat as empty/0 for comparisons
-        if isinstance(raw, dict):
-            raw = None
-        return float(raw or 0)
-
-    conditions = field.get('conditions', [])
-    if not conditions:
-        return True
-    
-    for cond in conditions:
-        field_key = cond['fieldKey']
-        operator = cond['operator']
-        value = cond.get('value')
-        action = cond['action']
-        
-        field_value = _resolve_condition_field_value(data, schema or [], field_key)
-        condition_met = False
-        
-        if operator == 'equals':
-            condition_met = str(field_value) == str(value)
-        elif operator == 'not_equals':
-            condition_met = str(field_value) != str(value)
-        elif operator == 'contains':
-            condition_met = str(field_value or '').lower().find(str(value or '').lower()) != -1
-        elif operator == 'greater_than':
-            try:
-                condition_met = coerce_numeric(field_value) > coerce_numeric(value)
-            except ValueError:
-                condition_met = False
-        elif operator == 'less_than':
-            try:
-                condition_met = coerce_numeric(field_value) < coerce_numeric(value)
-            except ValueError:
-                condition_met = False
-        elif operator == 'is_empty':
-            condition_met = is_empty_value(field_value)
-        elif operator == 'is_not_empty':
-            condition_met = not is_empty_value(field_value)
-        
-        if action == 'show':
-            if not condition_met:
-                return False
-        elif action == 'hide':
-            if condition_met:
-                return False
-    
-    return True
+    return compile_visibility(field, condition_key_map(schema))(data)
 
 
 @router.get("/{project_id}/forms", response_model=List[Form])
-def list_forms(project_id: UUID, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    # Check project ownership
-    project = session.get(Project, project_id)
-    if project is None:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    stmt = select(Form).where(Form.project_id == project_id)
-    forms = session.exec(stmt).all()
-    return forms
+def list_forms(project_id: UUID, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_project_owner)):
+    stmt = FORM_JSON.select().where(Form.project_id == project_id)
+    return json_response(FORM_JSON.body(session.exec(stmt)))
 
 
 @router.post("/{project_id}/forms", response_model=Form)
-def create_form(project_id: UUID, form: Form, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    # ensure project exists
-    proj = session.get(Project, project_id)
-    if proj is None:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if proj.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-
+def create_form(project_id: UUID, form: Form, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_project_owner)):
     form.project_id = project_id
     # Sanitize/validate description if provided
     if getattr(form, "description", None) is not None:
@@ -267,6 +111,9 @@ def create_form(project_id: UUID, form: Form, session: Session = Depends(get_ses
         form.description = desc
     session.add(form)
     session.commit()
+    ensure_lookup_label_indexes(form.schema_)
+    if form.settings and form.settings.get("indexedFields"):
+        sync_form_indexes(form.id, form.schema_, form.settings)
     session.refresh(form)
     return form
 
@@ -277,6 +124,7 @@ from fastapi import APIRouter as _APIRouter
 forms_router = _APIRouter(
     prefix="/forms",
     tags=["forms"],
+    route_class=AsyncDBRoute,
 )
 
 
@@ -289,18 +137,15 @@ def get_form(form_id: UUID, session: Session = Depends(get_session)):
 
 
 @forms_router.put("/{form_id}", response_model=Form)
-def update_form(form_id: UUID, data: Form, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
+def update_form(form_id: UUID, data: Form, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_form_owner)):
     form = session.get(Form, form_id)
     if form is None:
         raise HTTPException(status_code=404, detail="Form not found")
-    
-    # Check project ownership
-    project = session.get(Project, form.project_id)
-    if project is None:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
+
+    relations_changed = relation_signature(form.schema_) != relation_signature(data.schema_)
+    indexes_changed = managed_indexes(form.schema_, form.settings) != managed_indexes(data.schema_, data.settings)
+    formulas_changed = calculated_fields(form.schema_) != calculated_fields(data.schema_)
+    projection_changed = formulas_changed or projected_fields(form.schema_, form.settings) != projected_fields(data.schema_, data.settings)
     form.title = data.title
     form.slug = data.slug
     form.description = data.description
@@ -309,287 +154,428 @@ def update_form(form_id: UUID, data: Form, session: Session = Depends(get_sessio
     
     session.add(form)
     session.commit()
+    invalidate_form(form.id)
+    bump_form_version(form.id)
+    if relations_changed or projection_changed:
+        # Stored submissions follow in the background (see form_refresh.py).
+        schedule_form_refresh(form.id, recompute=formulas_changed)
+    ensure_lookup_label_indexes(form.schema_)
+    if indexes_changed:
+        sync_form_indexes(form.id, form.schema_, form.settings)
     session.refresh(form)
     return form
 
 
-@forms_router.post("/{form_id}/submissions", response_model=Submission)
-def create_submission(form_id: UUID, submission: Submission, session: Session = Depends(get_session)):
+@forms_router.get("/{form_id}/indexes")
+def get_form_indexes(form_id: UUID, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_form_owner)):
+    """Build status of the indexes requested by `settings.indexedFields`."""
     form = session.get(Form, form_id)
     if form is None:
         raise HTTPException(status_code=404, detail="Form not found")
+    return form_index_status(session.connection(), form.id, form.schema_, form.settings)
 
-    def is_empty_value(val) -> bool:
-        if val is None:
-            return True
-        if isinstance(val, str):
-            return val.strip() == ''
-        if isinstance(val, list):
-            return len(val) == 0
-        if isinstance(val, dict):
-            # currency: { amount, currency }
-            if 'amount' in val:
-                return is_empty_value(val.get('amount'))
-            # reference/lookup: { id, ... }
-            if 'id' in val:
-                return is_empty_value(val.get('id'))
-            return len(val) == 0
-        return False
-
-    errors = {}
-
-    data = _normalize_relation_fields_in_data(submission.data or {}, form.schema_ or [], session)
-    for field in form.schema_:
-        storage_key = _field_key_to_canonical_key(field)
-        required = field.get('required')
-        if not storage_key:
-            continue
-
-        if not is_field_visible(data, field, schema=form.schema_):
-            continue
-
-        val = data.get(storage_key)
-        # Back-compat: if relation field and caller still sent under field.key
-        if val is None and _is_relation_field(field) and field.get('key'):
-            val = data.get(str(field.get('key')))
 
-        if required and is_empty_value(val):
-            errors[storage_key] = 'This field is required'
-            continue
+@forms_router.post("/{form_id}/submissions", response_model=Submission)
+def create_submission(form_id: UUID, submission: Submission, session: Session = Depends(get_session)):
+    form = session.get(Form, form_id)
+    if form is None:
+        raise HTTPException(status_code=404, detail="Form not found")
 
+    compiled = get_compiled_form(form)
+    data = compiled.calculate(_normalize_relation_fields_in_data(submission.data or {}, compiled, session))
+    errors = compiled.required_errors(data)
     if errors:
         raise HTTPException(status_code=400, detail={"validation_errors": errors})
 
     submission.form_id = form_id
     submission.data = data
     session.add(submission)
+    session.flush()
+    index_submissions(session.connection(), [submission.id], replace=False)
+    project_submissions(session.connection(), form_id, projected_fields(form.schema_, form.settings), [submission.id], replace=False)
     session.commit()
+    bump_form_version(form_id)
     session.refresh(submission)
     return submission
 
 
-@forms_router.get("/{form_id}/submissions", response_model=List[Submission])
+def _filter_conditions(schema: Optional[list], filters: list, settings: Optional[dict] = None) -> list:
+    """SQL conditions on submission.data for parsed (field_key, operator, value) filters.
+
+    Filters address fields by field.key; relation fields are stored under field.id.
+    Range filters on fields indexed through `settings["indexedFields"]` also get a
+    condition their expression index can answer.
+    """
+    conditions = []
+    for key, operator, value in filters:
+        conditions.append(data_predicate(col(Submission.data), column_storage_keys(schema, key), operator, value))
+        indexed = indexed_range_condition(col(Submission.data), settings, schema, key, operator, value)
+        if indexed is not None:
+            conditions.append(indexed)
+    return conditions
+
+
+# Rows validated, reference-checked and inserted per transaction by the bulk endpoint.
+BULK_BATCH_SIZE = 1000
+
+_INVALID_JSON_LINE = object()
+
+
+async def _iter_bulk_items(request: Request) -> AsyncIterator[Any]:
+    """Yield submission objects from a JSON array body or an NDJSON stream."""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_ndjson_line(line)
+        if buffer.strip():
+            yield _parse_ndjson_line(buffer)
+        return
+
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of submissions")
+    for item in body:
+        yield item
+
+
+def _parse_ndjson_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return _INVALID_JSON_LINE
+
+
+def _ingest_batch(form: Form, batch: List[Tuple[int, Any]], session: Session) -> Tuple[int, List[dict]]:
+    """Validate one batch with the single-submission rules and insert the valid rows.
+
+    All referenced ids in the batch are resolved with one IN (...) query and the valid
+    rows go in with a single executemany INSERT. Returns (created, per-row errors).
+    """
+    compiled = get_compiled_form(form)
+    errors: List[dict] = []
+    prepared = []
+    for index, item in batch:
+        if item is _INVALID_JSON_LINE:
+            errors.append({"index": index, "validation_errors": {"_row": "Invalid JSON"}})
+            continue
+        if not isinstance(item, dict) or not isinstance(item.get("data") or {}, dict):
+            errors.append({"index": index, "validation_errors": {"_row": "Expected an object with a 'data' object"}})
+            continue
+        data, references = compiled.normalize_relations(item.get("data") or {})
+        prepared.append((index, compiled.calculate(data), references))
+
+    found = _lookup_submission_forms((s for _, _, refs in prepared for _, ids, _ in refs for s in ids), session)
+
+    indexes: List[int] = []
+    rows: List[dict] = []
+    for index, data, references in prepared:
+        row_errors = _reference_errors(references, found) or compiled.required_errors(data)
+        if row_errors:
+            errors.append({"index": index, "validation_errors": row_errors})
+            continue
+        indexes.append(index)
+        rows.append({"id": uuid4(), "form_id": form.id, "data": data, "created_at": datetime.now(timezone.utc)})
+
+    created = 0
+    if rows:
+        try:
+            session.connection().execute(sa.insert(Submission.__table__), rows)
+            index_submissions(session.connection(), [row["id"] for row in rows], replace=False)
+            project_submissions(session.connection(), form.id, projected_fields(form.schema_, form.settings), [row["id"] for row in rows], replace=False)
+            session.commit()
+            bump_form_version(form.id)
+            created = len(rows)
+        except SQLAlchemyError:
+            session.rollback()
+            errors.extend({"index": index, "validation_errors": {"_row": "Failed to store submission"}} for index in indexes)
+    errors.sort(key=lambda e: e["index"])
+    return created, errors
+
+
+@forms_router.post("/{form_id}/submissions/bulk")
+async def bulk_create_submissions(
+    form_id: UUID,
+    request: Request,
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(require_form_owner)
+):
+    """Create many submissions from a JSON array or an NDJSON body (`Content-Type: application/x-ndjson`).
+
+    Each item has the same shape as the body of POST /submissions (`{"data": {...}}`).
+    Invalid rows are reported by their 0-based index and do not stop the import;
+    valid rows are committed batch by batch.
+    """
+    form = await run_db(session.get, Form, form_id)
+    if form is None:
+        raise HTTPException(status_code=404, detail="Form not found")
+
+    created = 0
+    errors: List[dict] = []
+    batch: List[Tuple[int, Any]] = []
+    index = 0
+    async for item in _iter_bulk_items(request):
+        batch.append((index, item))
+        index += 1
+        if len(batch) >= BULK_BATCH_SIZE:
+            batch_created, batch_errors = await run_db(_ingest_batch, form, batch, session)
+            created += batch_created
+            errors.extend(batch_errors)
+            batch = []
+    if batch:
+        batch_created, batch_errors = await run_db(_ingest_batch, form, batch, session)
+        created += batch_created
+        errors.extend(batch_errors)
+
+    return {"created": created, "failed": len(errors), "errors": errors}
+
+
+@forms_router.get(
+    "/{form_id}/submissions",
+    response_model=List[Submission],
+    dependencies=[Depends(statement_timeout("SUBMISSIONS", 30000)), Depends(compression_levels("SUBMISSIONS"))],
+)
 def list_submissions(
     form_id: UUID, 
+    response: Response,
     filter_key: Optional[str] = Query(None, description="Key in the JSON data to filter by"),
     filter_value: Optional[str] = Query(None, description="Value to match for the filter key"),
+    filter_: Optional[List[str]] = Query(None, alias="filter", description="Filter as field_key:operator[:value]; repeatable"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; enables keyset pagination"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    expand: Optional[str] = Query(None, description="'labels' to return relation values as {id, label}"),
     session: Session = Depends(get_session)
 ):
-    stmt = select(Submission).where(Submission.form_id == form_id)
-    subs = session.exec(stmt).all()
-
-    # If filtering by a field.key that is now stored under field.id (relation fields), map it.
-    if filter_key:
-        form = session.get(Form, form_id)
-        if form and form.schema_:
-            for f in form.schema_:
-                if f.get("key") == filter_key and _is_relation_field(f) and f.get("id"):
-                    filter_key = str(f.get("id"))
-                    break
-    
+    """Submissions of a form, oldest first.
+
+    Filters run in Postgres against `submission.data`. With `limit` or `cursor` the
+    result is one keyset page over (created_at, id) and the `X-Next-Cursor` response
+    header carries the cursor for the next page. With `expand=labels` reference and
+    form_lookup values come back as `{id, label}` (see relation_labels.py).
+
+    Without `expand` the body is rendered straight from the selected rows (see
+    json_responses.py) rather than validated through the response model.
+    """
+    filters = parse_filters(filter_)
     if filter_key and filter_value:
-        # Filter in memory for MVP (SQLite JSON support varies)
-        # In production Postgres, use JSON operators in the query
-        filtered = []
-        for sub in subs:
-            val = sub.data.get(filter_key)
-            # Handle simple equality (string/number match)
-            if str(val) == filter_value:
-                filtered.append(sub)
-        return filtered
-        
-    return subs
+        filters.append((filter_key, "equals", filter_value))
+    with_labels = parse_expand(expand)
+
+    stmt = select(Submission) if with_labels else SUBMISSION_JSON.select()
+    stmt = stmt.where(Submission.form_id == form_id)
+
+    form = session.get(Form, form_id) if filters or with_labels else None
+    if filters:
+        stmt = stmt.where(*_filter_conditions(form.schema_ if form else None, filters, form.settings if form else None))
+
+    stmt = stmt.order_by(col(Submission.created_at), col(Submission.id))
+    if limit is None and cursor is None:
+        subs = session.exec(stmt).all()
+        return _with_labels(subs, form, session) if with_labels else json_response(SUBMISSION_JSON.body(subs))
+
+    if cursor:
+        created_at, sub_id = decode_cursor(cursor, 2)
+        try:
+            after = (datetime.fromisoformat(str(created_at)), UUID(str(sub_id)))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(sa.tuple_(col(Submission.created_at), col(Submission.id)) > sa.tuple_(*after))
+
+    page_size = limit or DEFAULT_PAGE_SIZE
+    subs = session.exec(stmt.limit(page_size + 1)).all()
+    headers = {}
+    if len(subs) > page_size:
+        subs = subs[:page_size]
+        headers["X-Next-Cursor"] = encode_cursor([subs[-1].created_at.isoformat(), str(subs[-1].id)])
+    if with_labels:
+        response.headers.update(headers)
+        return _with_labels(subs, form, session)
+    return json_response(SUBMISSION_JSON.body(subs), headers=headers)
+
+
+def _with_labels(subs: List[Submission], form: Optional[Form], session: Session) -> List[dict]:
+    """Submissions as dicts whose relation values (canonical or legacy key) are expanded to {id, label}."""
+    fields: Dict[str, dict] = {}
+    for f in (form.schema_ if form else None) or []:
+        if isinstance(f, dict) and is_relation_field(f):
+            for key in (canonical_storage_key(f), f.get("key")):
+                if key:
+                    fields.setdefault(str(key), f)
+    datas = expand_labels(session, [dict(sub.data or {}) for sub in subs], fields)
+    return [{**sub.model_dump(), "data": data} for sub, data in zip(subs, datas)]
+
+
+# Exports stream large bodies; favour compression speed over ratio.
+@forms_router.get("/{form_id}/submissions/export", dependencies=[Depends(compression_levels("EXPORT", gzip=4, br=2, zstd=1))])
+def export_submissions(
+    form_id: UUID,
+    export_format: str = Query("csv", alias="format", description="csv or ndjson"),
+    filter_: Optional[List[str]] = Query(None, alias="filter", description="Filter as field_key:operator[:value]; repeatable"),
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(require_form_owner)
+):
+    """Stream every (matching) submission of a form as CSV or NDJSON."""
+    check_export_format(export_format)
+    form = session.get(Form, form_id)
+    if form is None:
+        raise HTTPException(status_code=404, detail="Form not found")
+
+    schema = form.schema_ or []
+    table = Submission.__table__
+    conditions = [table.c.form_id == form_id, *_filter_conditions(schema, parse_filters(filter_), form.settings)]
+    order = (table.c.created_at, table.c.id)
+    filename = export_filename(form.title, "submissions", export_format)
+
+    if export_format == "ndjson":
+        stmt = sa.select(table.c.id, table.c.form_id, table.c.data, table.c.created_at).where(*conditions).order_by(*order)
+        rows = stream_rows(stmt, lambda r: {
+            "id": str(r["id"]),
+            "form_id": str(r["form_id"]),
+            "data": r["data"],
+            "created_at": r["created_at"].isoformat(),
+        })
+        return export_response(iter_ndjson(rows), export_format, filename)
+
+    fields = [f for f in schema if canonical_storage_key(f)]
+    header = ["Submission ID", "Submitted At", *[str(f.get("label") or f.get("key") or f.get("id")) for f in fields]]
+    values = []
+    for f in fields:
+        keys = [canonical_storage_key(f)]
+        if f.get("key") and str(f.get("key")) not in keys:
+            keys.append(str(f.get("key")))
+        values.append(json_value(table.c.data, keys))
+    stmt = sa.select(table.c.id, table.c.created_at, *(v.label(f"f{i}") for i, v in enumerate(values)))
+    stmt = stmt.where(*conditions).order_by(*order)
+    rows = stream_rows(stmt, lambda r: [str(r["id"]), r["created_at"].isoformat(), *(r[f"f{i}"] for i in range(len(values)))])
+    return export_response(iter_csv(header, rows), export_format, filename)
+
+
+@forms_router.post("/{form_id}/aggregate", dependencies=[Depends(statement_timeout("AGGREGATE", 30000))])
+def aggregate_submissions(
+    form_id: UUID,
+    request: AggregateRequest,
+    session: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(require_form_owner)
+):
+    """Grouped counts, sums, averages, minimums and maximums over the form's (matching) submissions.
+
+    Group-by fields and metric fields are field keys; see aggregation.py for the request and result shapes.
+    """
+    form = session.get(Form, form_id)
+    if form is None:
+        raise HTTPException(status_code=404, detail="Form not found")
+
+    conditions = _filter_conditions(form.schema_, parse_filters(request.filter), form.settings)
+    return aggregate_form(session, form, request, conditions)
 
 
 @forms_router.get("/{form_id}/fields/{field_key}/values", response_model=List[str])
-def get_field_values(form_id: UUID, field_key: str, session: Session = Depends(get_session)):
-    # Check form exists
+def get_field_values(
+    form_id: UUID,
+    field_key: str,
+    q: Optional[str] = Query(None, description="Case-insensitive prefix the values must start with"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of values"),
+    session: Session = Depends(get_session),
+):
+    """Sorted distinct values of one field across the form's submissions (list items counted one by one)."""
     form = session.get(Form, form_id)
     if form is None:
         raise HTTPException(status_code=404, detail="Form not found")
-    
-    # Fetch all submissions for this form
-    stmt = select(Submission).where(Submission.form_id == form_id)
-    submissions = session.exec(stmt).all()
-    
+
     # If the requested field_key is a relation field stored under field.id, map it.
     effective_key = field_key
     if form.schema_:
         for f in form.schema_:
-            if f.get("key") == field_key and _is_relation_field(f) and f.get("id"):
+            if f.get("key") == field_key and is_relation_field(f) and f.get("id"):
                 effective_key = str(f.get("id"))
                 break
 
-    # Extract unique values for the given field key
-    values = set()
-    for sub in submissions:
-        val = sub.data.get(effective_key)
-        if val is not None:
-            # Handle lists (e.g. checkbox) by adding individual items
-            if isinstance(val, list):
-                for item in val:
-                    values.add(str(item))
-            elif isinstance(val, dict):
-                # Common object formats
-                if 'amount' in val:
-                    amt = val.get('amount')
-                    cur = val.get('currency')
-                    if cur is not None and amt is not None:
-                        values.add(f"{cur} {amt}")
-                    elif amt is not None:
-                        values.add(str(amt))
-                elif 'id' in val:
-                    values.add(str(val.get('id')))
-                else:
-                    values.add(str(val))
-            else:
-                values.add(str(val))
-            
-    return sorted(list(values))
-
-
-@forms_router.get("/{form_id}/fields/{field_key}/submission-options")
-def get_field_submission_options(form_id: UUID, field_key: str, session: Session = Depends(get_session)):
+    return distinct_values(session, form_id, effective_key, q=q, limit=limit)
+
+
+@forms_router.get("/{form_id}/fields/{field_key}/submission-options", dependencies=[Depends(compression_levels("OPTIONS"))])
+def get_field_submission_options(
+    form_id: UUID,
+    field_key: str,
+    q: Optional[str] = Query(None, description="Case-insensitive prefix the labels must start with"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of options"),
+    typeahead: bool = Query(False, description="Rank matches for a search box and return the best `limit` (default 20)"),
+    session: Session = Depends(get_session),
+):
     """Return options for picking a submission by ID, with a human label from `data[field_key]`.
 
     This powers form_lookup fields that store submission IDs so that label changes
-    in the source form reflect everywhere.
+    in the source form reflect everywhere. With `typeahead`, `q` also matches labels
+    containing a word that starts with or resembles it (when pg_trgm is installed).
     """
 
     form = session.get(Form, form_id)
     if form is None:
         raise HTTPException(status_code=404, detail="Form not found")
 
-    stmt = select(Submission).where(Submission.form_id == form_id)
-    submissions = session.exec(stmt).all()
-
-    options: List[dict] = []
-    for sub in submissions:
-        if not sub.data:
-            continue
-        if field_key not in sub.data:
-            continue
-
-        raw = sub.data.get(field_key)
-        if raw is None:
-            continue
-        if isinstance(raw, list):
-            label = ", ".join([str(x) for x in raw if x is not None])
-        else:
-            label = str(raw)
-
-        label = label.strip()
-        if not label:
-            continue
-
-        options.append({"id": str(sub.id), "label": label})
-
-    # Stable sort by label, case-insensitive
-    options.sort(key=lambda o: o["label"].lower())
-    return options
-
+    if typeahead:
+        return typeahead_options(session, form_id, field_key, q, limit=limit)
+    return submission_options(session, form_id, field_key, q=q, limit=limit)
 
 
 @forms_router.put("/{form_id}/submissions/{submission_id}", response_model=Submission)
-def update_submission(form_id: UUID, submission_id: UUID, submission: Submission, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
+def update_submission(form_id: UUID, submission_id: UUID, submission: Submission, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_submission_owner)):
     existing = session.get(Submission, submission_id)
     if existing is None:
         raise HTTPException(status_code=404, detail="Submission not found")
-
-    if str(existing.form_id) != str(form_id):
-        raise HTTPException(status_code=400, detail="Submission does not belong to the specified form")
-
-    # Check ownership via form -> project
     form = session.get(Form, form_id)
     if form is None:
         raise HTTPException(status_code=404, detail="Form not found")
-    project = session.get(Project, form.project_id)
-    if project is None:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
 
     # Validate against form schema similar to create
-    def is_empty_value(val) -> bool:
-        if val is None:
-            return True
-        if isinstance(val, str):
-            return val.strip() == ''
-        if isinstance(val, list):
-            return len(val) == 0
-        if isinstance(val, dict):
-            if 'amount' in val:
-                return is_empty_value(val.get('amount'))
-            if 'id' in val:
-                return is_empty_value(val.get('id'))
-            return len(val) == 0
-        return False
-
-    errors = {}
-    data = _normalize_relation_fields_in_data(submission.data or {}, form.schema_ or [], session)
-    for field in form.schema_:
-        storage_key = _field_key_to_canonical_key(field)
-        required = field.get('required')
-        if not storage_key:
-            continue
-
-        if not is_field_visible(data, field, schema=form.schema_):
-            continue
-
-        val = data.get(storage_key)
-        if val is None and _is_relation_field(field) and field.get('key'):
-            val = data.get(str(field.get('key')))
-
-        if required and is_empty_value(val):
-            errors[storage_key] = 'This field is required'
-
+    compiled = get_compiled_form(form)
+    data = compiled.calculate(_normalize_relation_fields_in_data(submission.data or {}, compiled, session))
+    errors = compiled.required_errors(data)
     if errors:
         raise HTTPException(status_code=400, detail={"validation_errors": errors})
 
     existing.data = data
     session.add(existing)
+    session.flush()
+    index_submissions(session.connection(), [existing.id])
+    project_submissions(session.connection(), form_id, projected_fields(form.schema_, form.settings), [existing.id])
     session.commit()
+    bump_form_version(form_id)
     session.refresh(existing)
     return existing
 
 
 @forms_router.delete("/{form_id}/submissions/{submission_id}", status_code=204)
-def delete_submission(form_id: UUID, submission_id: UUID, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
+def delete_submission(form_id: UUID, submission_id: UUID, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_submission_owner)):
     existing = session.get(Submission, submission_id)
     if existing is None:
         raise HTTPException(status_code=404, detail="Submission not found")
 
-    if str(existing.form_id) != str(form_id):
-        raise HTTPException(status_code=400, detail="Submission does not belong to the specified form")
-
-    # Check ownership via form -> project
-    form = session.get(Form, form_id)
-    if form is None:
-        raise HTTPException(status_code=404, detail="Form not found")
-    project = session.get(Project, form.project_id)
-    if project is None:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-
     session.delete(existing)
     session.commit()
+    bump_form_version(form_id)
     return None
 
 
 @forms_router.delete("/{form_id}", status_code=204)
-def delete_form(form_id: UUID, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
+def delete_form(form_id: UUID, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_form_owner)):
     form = session.get(Form, form_id)
     if form is None:
         raise HTTPException(status_code=404, detail="Form not found")
-    
-    # Check project ownership
-    project = session.get(Project, form.project_id)
-    if project is None:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
+
+    # Also drops indexes of kinds that are no longer created.
+    indexed = bool((form.settings or {}).get("indexedFields"))
     session.delete(form)
     session.commit()
+    invalidate_form(form_id)
+    bump_form_version(form_id)
+    if indexed:
+        sync_form_indexes(form_id, None, None)
     return None
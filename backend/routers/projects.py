@@ -4,23 +4,26 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlmodel import Session, select
 from database import get_session
 from models import Project
-from auth_utils import get_current_user
+from async_db import AsyncDBRoute
+from auth_utils import CurrentUser, get_current_user
+from authz import require_project_owner
 
 router = APIRouter(
     prefix="/projects",
     tags=["projects"],
+    route_class=AsyncDBRoute,
 )
 
 
 @router.get("/", response_model=List[Project])
-def list_projects(user=Depends(get_current_user), session: Session = Depends(get_session)):
+def list_projects(user: CurrentUser = Depends(get_current_user), session: Session = Depends(get_session)):
     stmt = select(Project).where(Project.owner_id == user.id)
     projects = session.exec(stmt).all()
     return projects
 
 
 @router.post("/", response_model=Project, status_code=status.HTTP_201_CREATED)
-def create_project(project: Project, user=Depends(get_current_user), session: Session = Depends(get_session)):
+def create_project(project: Project, user: CurrentUser = Depends(get_current_user), session: Session = Depends(get_session)):
     project.owner_id = user.id
     session.add(project)
     session.commit()
@@ -29,12 +32,10 @@ def create_project(project: Project, user=Depends(get_current_user), session: Se
 
 
 @router.put("/{project_id}", response_model=Project)
-def update_project(project_id: UUID, data: Project, user=Depends(get_current_user), session: Session = Depends(get_session)):
+def update_project(project_id: UUID, data: Project, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_project_owner)):
     proj = session.get(Project, project_id)
     if not proj:
         raise HTTPException(status_code=404, detail="Project not found")
-    if proj.owner_id != user.id:
-        raise HTTPException(status_code=403, detail="Forbidden")
 
     proj.title = data.title
     proj.description = data.description
@@ -46,12 +47,10 @@ def update_project(project_id: UUID, data: Project, user=Depends(get_current_use
 
 
 @router.delete("/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_project(project_id: UUID, user=Depends(get_current_user), session: Session = Depends(get_session)):
+def delete_project(project_id: UUID, session: Session = Depends(get_session), current_user: CurrentUser = Depends(require_project_owner)):
     proj = session.get(Project, project_id)
     if not proj:
         raise HTTPException(status_code=404, detail="Project not found")
-    if proj.owner_id != user.id:
-        raise HTTPException(status_code=403, detail="Forbidden")
     session.delete(proj)
     session.commit()
     return None
@@ -8,24 +8,30 @@ Run from repo root (recommended):
 
 Or run from the backend directory:
     cd backend
-    uv run python scripts/backfill_reference_field_ids.py
+    uv run python scripts/backfill_reference_field_ids.py [--sql] [--workers 4] [--checkpoint backfill.json]
 
 This script:
 - iterates all forms
 - for each submission, moves reference field values from data[field.key] to data[field.id]
 - normalizes legacy object shapes {id: ...} into string ids
 
-It is idempotent.
+Submissions are processed in batches with a commit per batch (see
+migration_runner.py for --batch-size, --workers, --checkpoint,
+--max-rows-per-second and --dry-run). With --sql each batch is one set-based
+UPDATE per reference field instead of a Python loop over the rows, which is much
+faster on large forms; --sql --dry-run counts the rows to update in SQL. It is
+idempotent.
 """
 
 from __future__ import annotations
 
+import argparse
 import sys
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 try:
-    from sqlmodel import Session, select
+    import sqlmodel  # noqa: F401
 except ModuleNotFoundError as exc:  # pragma: no cover
     raise SystemExit(
         "Missing dependency 'sqlmodel'. Run with the backend uv project:\n"
@@ -51,91 +57,88 @@ except Exception:
 sys.path.insert(0, str(_repo_root))
 sys.path.insert(0, str(_backend_dir))
 
-try:
-    # Prefer package-style imports when possible.
-    from backend.database import engine
-    from backend.models import Form, Submission
-except ModuleNotFoundError:
-    from database import engine
-    from models import Form, Submission
-
-
-def normalize_reference_value(raw: Any):
-    if raw is None:
-        return None
-    if isinstance(raw, list):
-        ids: List[str] = []
-        for v in raw:
-            if isinstance(v, dict) and v.get("id") is not None:
-                s = str(v.get("id")).strip()
-            else:
-                s = str(v).strip() if v is not None else ""
-            if s:
-                ids.append(s)
-        return ids or None
-    if isinstance(raw, dict):
-        if raw.get("id") is None:
-            return None
-        s = str(raw.get("id")).strip()
-        return s or None
-    s = str(raw).strip()
-    return s or None
+# migration_runner imports the backend modules flat (like the app does), so the
+# models must come from the same module path or their tables get defined twice.
+from form_schema import normalize_reference_value
+from migration_runner import SqlUpdate, add_runner_arguments, normalized_reference_sql, run_from_args
+from models import Form
+
+
+def migrate(form: Form, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    changed = False
+
+    for field in form.schema_ or []:
+        if field.get("type") != "reference":
+            continue
+        field_id = field.get("id")
+        field_key = field.get("key")
+        if not field_id or not field_key:
+            continue
+
+        canonical_key = str(field_id)
+        legacy_key = str(field_key)
+
+        if canonical_key in data and data.get(canonical_key) is not None:
+            continue
+
+        if legacy_key not in data:
+            continue
+
+        normalized = normalize_reference_value(data.get(legacy_key))
+        if normalized is None:
+            # Remove empty legacy
+            del data[legacy_key]
+            changed = True
+            continue
+
+        data[canonical_key] = normalized
+        del data[legacy_key]
+        changed = True
+
+    return data if changed else None
+
+
+def migrate_sql(form: Form) -> List[SqlUpdate]:
+    updates: List[SqlUpdate] = []
+
+    for field in form.schema_ or []:
+        if field.get("type") != "reference":
+            continue
+        field_id = field.get("id")
+        field_key = field.get("key")
+        if not field_id or not field_key:
+            continue
+
+        n = len(updates)
+        canonical_key = f"CAST(:canonical{n} AS text)"
+        legacy_key = f"CAST(:legacy{n} AS text)"
+        normalized = normalized_reference_sql(f"data -> {legacy_key}")
+
+        updates.append(
+            SqlUpdate(
+                set_sql=(
+                    f"CASE WHEN {normalized} IS NULL THEN data - {legacy_key} "
+                    f"ELSE jsonb_set(data - {legacy_key}, ARRAY[{canonical_key}], {normalized}) END"
+                ),
+                where_sql=f"data ? {legacy_key} AND coalesce(jsonb_typeof(data -> {canonical_key}), 'null') = 'null'",
+                params={f"canonical{n}": str(field_id), f"legacy{n}": str(field_key)},
+                # Relation edges and projections already read the legacy key and {id} objects.
+                reindex=False,
+            )
+        )
+
+    return updates
 
 
 def main() -> None:
-    updated = 0
-    scanned = 0
-
-    with Session(engine) as session:
-        forms = session.exec(select(Form)).all()
-        for form in forms:
-            schema = form.schema_ or []
-            if not schema:
-                continue
-
-            submissions = session.exec(select(Submission).where(Submission.form_id == form.id)).all()
-            for sub in submissions:
-                scanned += 1
-                data: Dict[str, Any] = dict(sub.data or {})
-                changed = False
-
-                for field in schema:
-                    if field.get("type") != "reference":
-                        continue
-                    field_id = field.get("id")
-                    field_key = field.get("key")
-                    if not field_id or not field_key:
-                        continue
-
-                    canonical_key = str(field_id)
-                    legacy_key = str(field_key)
-
-                    if canonical_key in data and data.get(canonical_key) is not None:
-                        continue
-
-                    if legacy_key not in data:
-                        continue
-
-                    normalized = normalize_reference_value(data.get(legacy_key))
-                    if normalized is None:
-                        # Remove empty legacy
-                        del data[legacy_key]
-                        changed = True
-                        continue
-
-                    data[canonical_key] = normalized
-                    del data[legacy_key]
-                    changed = True
-
-                if changed:
-                    sub.data = data
-                    session.add(sub)
-                    updated += 1
-
-        session.commit()
-
-    print(f"Scanned submissions: {scanned}")
-    print(f"Updated submissions: {updated}")
+    parser = argparse.ArgumentParser()
+    add_runner_arguments(parser, sql=True)
+    args = parser.parse_args()
+
+    stats = run_from_args("backfill_reference_field_ids", migrate, args, sql_transform=migrate_sql)
+
+    print(f"Scanned submissions: {stats.scanned}")
+    print(f"Updated submissions: {stats.updated}{' (dry-run)' if args.dry_run else ''}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""Rebuild the submission relation edge index (`submissionrelation`).
+
+This repo uses `uv`, and the Python dependencies (including `sqlmodel`) live in
+the backend project at `backend/pyproject.toml`.
+
+Run from repo root (recommended):
+    uv run --project backend python backend/scripts/backfill_submission_relations.py
+
+Or run from the backend directory:
+    cd backend
+    uv run python scripts/backfill_submission_relations.py [FORM_ID ...]
+
+This script:
+- iterates all forms (or only the given form ids)
+- for each form, drops the edges of its submissions and re-derives them from
+  submission data and the form's relation fields, one transaction per form
+
+Run it after writing submission data or form schemas outside the API (e.g. with
+backfill_reference_field_ids.py or direct SQL). It is idempotent.
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from uuid import UUID
+
+try:
+    from sqlmodel import Session, select
+except ModuleNotFoundError as exc:  # pragma: no cover
+    raise SystemExit(
+        "Missing dependency 'sqlmodel'. Run with the backend uv project:\n"
+        "  uv run --project backend python backend/scripts/backfill_submission_relations.py\n"
+        "or:\n"
+        "  cd backend && uv run python scripts/backfill_submission_relations.py"
+    ) from exc
+
+_this_file = Path(__file__).resolve()
+_backend_dir = _this_file.parents[1]
+_repo_root = _backend_dir.parent
+
+# Load env vars (DATABASE_URL, etc.) if present.
+try:  # pragma: no cover
+    from dotenv import load_dotenv
+
+    load_dotenv(_backend_dir / ".env")
+    load_dotenv(_repo_root / ".env")
+except Exception:
+    pass
+
+# Allow imports whether invoked from repo root, backend/, or backend/scripts.
+sys.path.insert(0, str(_repo_root))
+sys.path.insert(0, str(_backend_dir))
+
+try:
+    # Prefer package-style imports when possible.
+    from backend.database import engine
+    from backend.models import Form
+    from backend.relation_index import reindex_form
+except ModuleNotFoundError:
+    from database import engine
+    from models import Form
+    from relation_index import reindex_form
+
+
+def main() -> None:
+    only = [UUID(arg) for arg in sys.argv[1:]]
+    forms = 0
+    edges = 0
+
+    with Session(engine) as session:
+        statement = select(Form.id)
+        if only:
+            statement = statement.where(Form.id.in_(only))  # type: ignore[union-attr]
+        form_ids = session.exec(statement).all()
+
+        for form_id in form_ids:
+            edges += reindex_form(session.connection(), form_id)
+            session.commit()
+            forms += 1
+
+    print(f"Reindexed forms: {forms}")
+    print(f"Relation edges: {edges}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Benchmark the fast JSON response path against FastAPI's response_model serialization.
+
+This repo uses `uv`, and the Python dependencies (including `sqlmodel`) live in
+the backend project at `backend/pyproject.toml`.
+
+Run from repo root (recommended):
+    uv run --project backend python backend/scripts/benchmark_json_responses.py
+
+Or run from the backend directory:
+    cd backend
+    uv run python scripts/benchmark_json_responses.py [--rows 50000] [--repeat 5]
+
+This script:
+- creates a user, project, form with `--rows` submissions and a view over it, inside
+  one transaction that is rolled back at the end (nothing is left behind)
+- times the list_submissions body both ways: ORM rows validated and serialized
+  through the response model (what FastAPI does for `response_model=List[Submission]`)
+  and `ModelJSON` (see json_responses.py)
+- times the view data body both ways: `jsonable_encoder` + JSONResponse and `json_body`
+- checks that both ways decode to the same JSON and prints best-of-`--repeat` timings
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+try:
+    from sqlmodel import Session, select
+except ModuleNotFoundError as exc:  # pragma: no cover
+    raise SystemExit(
+        "Missing dependency 'sqlmodel'. Run with the backend uv project:\n"
+        "  uv run --project backend python backend/scripts/benchmark_json_responses.py\n"
+        "or:\n"
+        "  cd backend && uv run python scripts/benchmark_json_responses.py"
+    ) from exc
+
+_this_file = Path(__file__).resolve()
+_backend_dir = _this_file.parents[1]
+_repo_root = _backend_dir.parent
+
+# Load env vars (DATABASE_URL, etc.) if present.
+try:  # pragma: no cover
+    from dotenv import load_dotenv
+
+    load_dotenv(_backend_dir / ".env")
+    load_dotenv(_repo_root / ".env")
+except Exception:
+    pass
+
+# Allow imports whether invoked from repo root, backend/, or backend/scripts.
+sys.path.insert(0, str(_repo_root))
+sys.path.insert(0, str(_backend_dir))
+
+import sqlalchemy as sa  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+# json_responses / view_engine import the backend modules flat, so the models must too.
+from database import engine  # noqa: E402
+from json_responses import ModelJSON, json_body  # noqa: E402
+from models import Form, Project, Submission, User, View  # noqa: E402
+from view_engine import compile_view  # noqa: E402
+
+_SEED = """
+INSERT INTO submission (id, form_id, data, created_at)
+SELECT gen_random_uuid(), :form_id, jsonb_build_object(
+    'name', 'Customer ' || g,
+    'email', 'customer' || g || '@example.com',
+    'age', 18 + g % 60,
+    'score', round((g % 1000) / 7.0, 3),
+    'active', g % 2 = 0,
+    'tags', jsonb_build_array('tag' || g % 5, 'tag' || g % 7),
+    'amount', jsonb_build_object('amount', g % 500, 'currency', 'USD'),
+    'notes', 'Ünïcode "quoted" text ' || g
+), now() - make_interval(secs => :rows - g)
+FROM generate_series(1, :rows) AS g
+"""
+
+_FIELDS = ["name", "email", "age", "score", "active", "tags", "amount", "notes"]
+
+
+def _best(repeat: int, run: Callable[[], bytes]) -> Tuple[float, bytes]:
+    best, body = float("inf"), b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = run()
+        best = min(best, time.perf_counter() - started)
+    return best, body
+
+
+def _report(name: str, legacy: Tuple[float, bytes], fast: Tuple[float, bytes]) -> None:
+    same = json.loads(legacy[1]) == json.loads(fast[1])
+    print(
+        f"{name:<18} legacy {legacy[0] * 1000:8.1f} ms   fast {fast[0] * 1000:8.1f} ms   "
+        f"speedup {legacy[0] / fast[0]:5.1f}x   {len(fast[1]) / 1e6:6.1f} MB   same JSON: {same}"
+    )
+
+
+def _sorted(body: bytes) -> bytes:
+    # Row order is the same both ways; only compare decoded values.
+    return json.dumps(json.loads(body), sort_keys=True).encode()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000, help="Submissions to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    submission_json = ModelJSON(Submission)
+    response_field = create_model_field(name="Response", type_=List[Submission], mode="serialization")
+
+    with Session(engine) as session:
+        user = User(email=f"benchmark-{time.time_ns()}@example.com", hashed_password="-")
+        session.add(user)
+        session.flush()
+        project = Project(title="JSON benchmark", owner_id=user.id)
+        session.add(project)
+        session.flush()
+        schema = [{"id": f"f_{key}", "key": key, "type": "text", "label": key} for key in _FIELDS]
+        form = Form(project_id=project.id, title="Benchmark", slug="benchmark", schema_=schema)
+        session.add(form)
+        session.flush()
+        config = {"baseFormId": str(form.id), "columns": [{"id": key, "formId": str(form.id), "fieldKey": key} for key in _FIELDS]}
+        session.add(View(project_id=project.id, title="Benchmark", config=config))
+        session.execute(sa.text(_SEED), {"form_id": form.id, "rows": args.rows})
+        session.flush()
+
+        order = (Submission.created_at, Submission.id)
+
+        def legacy_submissions() -> bytes:
+            session.expunge_all()
+            subs = session.exec(select(Submission).where(Submission.form_id == form.id).order_by(*order)).all()
+            return asyncio.run(serialize_response(field=response_field, response_content=subs, dump_json=True))
+
+        def fast_submissions() -> bytes:
+            stmt = submission_json.select().where(Submission.form_id == form.id).order_by(*order)
+            return submission_json.body(session.exec(stmt))
+
+        compiled = compile_view({**config, "maxRows": args.rows}, {str(form.id): form})
+        rows: List[Any] = compiled.rows(session)
+
+        def legacy_view() -> bytes:
+            return JSONResponse(jsonable_encoder(rows)).body
+
+        def fast_view() -> bytes:
+            return json_body(rows)
+
+        print(f"{args.rows} submissions, best of {args.repeat}")
+        legacy, fast = _best(args.repeat, legacy_submissions), _best(args.repeat, fast_submissions)
+        _report("list_submissions", (legacy[0], _sorted(legacy[1])), (fast[0], _sorted(fast[1])))
+        _report("view data encode", _best(args.repeat, legacy_view), _best(args.repeat, fast_view))
+
+        session.rollback()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -10,11 +10,15 @@ Run from repo root:
   uv run --project backend python backend/scripts/migrate_field_key_rename_to_id.py \
     --form-id <FORM_UUID> --old-key actors --new-key actor
 
-Use --dry-run to preview.
+Use --dry-run to preview, and --sql to run the move as set-based UPDATE statements
+(one per batch) rather than a Python loop over the rows, which is much faster on
+large forms.
 
 Notes
 - This script is idempotent.
 - It normalizes legacy object-shaped values like {"id": "..."}.
+- Submissions are processed in batches with a commit per batch; see
+  migration_runner.py for --batch-size, --checkpoint and --max-rows-per-second.
 """
 
 from __future__ import annotations
@@ -42,41 +46,19 @@ except Exception:
     pass
 
 try:
-    from sqlmodel import Session, select
+    from sqlmodel import Session
 except ModuleNotFoundError as exc:  # pragma: no cover
     raise SystemExit(
         "Missing dependency 'sqlmodel'. Run with the backend uv project:\n"
         "  uv run --project backend python backend/scripts/migrate_field_key_rename_to_id.py ..."
     ) from exc
 
-try:
-    from backend.database import engine
-    from backend.models import Form, Submission
-except ModuleNotFoundError:
-    from database import engine
-    from models import Form, Submission
-
-
-def _normalize_relation_value(raw: Any):
-    if raw is None:
-        return None
-    if isinstance(raw, list):
-        ids: List[str] = []
-        for v in raw:
-            if isinstance(v, dict) and v.get("id") is not None:
-                s = str(v.get("id")).strip()
-            else:
-                s = str(v).strip() if v is not None else ""
-            if s:
-                ids.append(s)
-        return ids or None
-    if isinstance(raw, dict):
-        if raw.get("id") is None:
-            return None
-        s = str(raw.get("id")).strip()
-        return s or None
-    s = str(raw).strip()
-    return s or None
+# migration_runner imports the backend modules flat (like the app does), so the
+# models must come from the same module path or their tables get defined twice.
+from database import engine
+from form_schema import normalize_reference_value
+from migration_runner import SqlUpdate, add_runner_arguments, normalized_reference_sql, run_from_args
+from models import Form
 
 
 def main() -> int:
@@ -84,7 +66,7 @@ def main() -> int:
     parser.add_argument("--form-id", required=True, help="Form UUID")
     parser.add_argument("--old-key", required=True, help="Old field.key in submission.data")
     parser.add_argument("--new-key", required=True, help="New field.key in the form schema")
-    parser.add_argument("--dry-run", action="store_true", help="Print counts without writing")
+    add_runner_arguments(parser, sql=True)
     args = parser.parse_args()
 
     try:
@@ -115,48 +97,45 @@ def main() -> int:
 
         canonical_key = str(field_id)
 
-        subs = session.exec(select(Submission).where(Submission.form_id == form_id)).all()
-        scanned = 0
-        updated = 0
-        skipped = 0
-
-        for sub in subs:
-            scanned += 1
-            data: Dict[str, Any] = dict(sub.data or {})
-
-            if canonical_key in data and data.get(canonical_key) is not None:
-                skipped += 1
-                # Optional cleanup: if old key still exists, delete it
-                if old_key in data:
-                    del data[old_key]
-                    if not args.dry_run:
-                        sub.data = data
-                        session.add(sub)
-                        updated += 1
-                continue
-
-            if old_key not in data:
-                skipped += 1
-                continue
-
-            normalized = _normalize_relation_value(data.get(old_key))
-            del data[old_key]
-            if normalized is not None:
-                data[canonical_key] = normalized
-
-            if not args.dry_run:
-                sub.data = data
-                session.add(sub)
-            updated += 1
-
-        if not args.dry_run:
-            session.commit()
+    def migrate(form: Form, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if canonical_key in data and data.get(canonical_key) is not None:
+            # Optional cleanup: if old key still exists, delete it
+            if old_key in data:
+                del data[old_key]
+                return data
+            return None
+
+        if old_key not in data:
+            return None
+
+        normalized = normalize_reference_value(data.get(old_key))
+        del data[old_key]
+        if normalized is not None:
+            data[canonical_key] = normalized
+        return data
+
+    def migrate_sql(form: Form) -> List[SqlUpdate]:
+        normalized = normalized_reference_sql("data -> CAST(:old_key AS text)")
+        return [
+            SqlUpdate(
+                set_sql=(
+                    "CASE WHEN coalesce(jsonb_typeof(data -> CAST(:canonical_key AS text)), 'null') <> 'null' "
+                    "OR " + normalized + " IS NULL THEN data - CAST(:old_key AS text) "
+                    "ELSE jsonb_set(data - CAST(:old_key AS text), ARRAY[CAST(:canonical_key AS text)], " + normalized + ") END"
+                ),
+                where_sql="data ? CAST(:old_key AS text)",
+                params={"old_key": old_key, "canonical_key": canonical_key},
+            )
+        ]
+
+    job = f"migrate_field_key_rename_to_id:{form_id}:{old_key}:{new_key}"
+    stats = run_from_args(job, migrate, args, [form_id], sql_transform=migrate_sql)
 
     print(f"Form: {form_id}")
     print(f"Moved: data['{old_key}'] -> data['{canonical_key}'] (field key now '{new_key}')")
-    print(f"Scanned submissions: {scanned}")
-    print(f"Updated submissions: {updated}{' (dry-run)' if args.dry_run else ''}")
-    print(f"Skipped submissions: {skipped}")
+    print(f"Scanned submissions: {stats.scanned}")
+    print(f"Updated submissions: {stats.updated}{' (dry-run)' if args.dry_run else ''}")
+    print(f"Skipped submissions: {stats.scanned - stats.updated}")
     return 0
 
 
@@ -0,0 +1,88 @@
+"""Rebuild the typed field projection (`submissionprojection`).
+
+This repo uses `uv`, and the Python dependencies (including `sqlmodel`) live in
+the backend project at `backend/pyproject.toml`.
+
+Run from repo root (recommended):
+    uv run --project backend python backend/scripts/rebuild_submission_projections.py
+
+Or run from the backend directory:
+    cd backend
+    uv run python scripts/rebuild_submission_projections.py [FORM_ID ...]
+
+This script:
+- iterates all forms (or only the given form ids)
+- for each form, drops the projection rows of its submissions and re-derives them
+  from submission data and the fields listed in `settings.projectedFields`, one
+  transaction per form (forms without projected fields end up with no rows)
+
+Run it after writing submission data, form schemas or settings outside the API
+(e.g. with backfill_reference_field_ids.py or direct SQL). It is idempotent.
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from uuid import UUID
+
+try:
+    from sqlmodel import Session, select
+except ModuleNotFoundError as exc:  # pragma: no cover
+    raise SystemExit(
+        "Missing dependency 'sqlmodel'. Run with the backend uv project:\n"
+        "  uv run --project backend python backend/scripts/rebuild_submission_projections.py\n"
+        "or:\n"
+        "  cd backend && uv run python scripts/rebuild_submission_projections.py"
+    ) from exc
+
+_this_file = Path(__file__).resolve()
+_backend_dir = _this_file.parents[1]
+_repo_root = _backend_dir.parent
+
+# Load env vars (DATABASE_URL, etc.) if present.
+try:  # pragma: no cover
+    from dotenv import load_dotenv
+
+    load_dotenv(_backend_dir / ".env")
+    load_dotenv(_repo_root / ".env")
+except Exception:
+    pass
+
+# Allow imports whether invoked from repo root, backend/, or backend/scripts.
+sys.path.insert(0, str(_repo_root))
+sys.path.insert(0, str(_backend_dir))
+
+try:
+    # Prefer package-style imports when possible.
+    from backend.database import engine
+    from backend.models import Form
+    from backend.projections import projected_fields, rebuild_form
+except ModuleNotFoundError:
+    from database import engine
+    from models import Form
+    from projections import projected_fields, rebuild_form
+
+
+def main() -> None:
+    only = [UUID(arg) for arg in sys.argv[1:]]
+    forms = 0
+    rows = 0
+
+    with Session(engine) as session:
+        statement = select(Form)
+        if only:
+            statement = statement.where(Form.id.in_(only))  # type: ignore[union-attr]
+        form_list = session.exec(statement).all()
+
+        for form in form_list:
+            rows += rebuild_form(session.connection(), form.id, projected_fields(form.schema_, form.settings))
+            session.commit()
+            forms += 1
+
+    print(f"Rebuilt forms: {forms}")
+    print(f"Projection rows: {rows}")
+
+
+if __name__ == "__main__":
+    main()
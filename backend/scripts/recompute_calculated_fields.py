@@ -0,0 +1,100 @@
+"""Recompute calculated fields (`type: "calculated"`) of stored submissions.
+
+This repo uses `uv`, and the Python dependencies (including `sqlmodel`) live in
+the backend project at `backend/pyproject.toml`.
+
+Run from repo root (recommended):
+    uv run --project backend python backend/scripts/recompute_calculated_fields.py
+
+Or run from the backend directory:
+    cd backend
+    uv run python scripts/recompute_calculated_fields.py [FORM_ID ...] [--workers 4] [--checkpoint recompute.json]
+
+This script:
+- iterates all forms with calculated fields (or only the given form ids)
+- re-evaluates their formulas for each submission with `CompiledForm.calculate`,
+  the same path the API uses on writes and form_refresh.py uses after a formula change
+- refreshes the relation index and typed projection of the rows it changes
+
+Submissions are processed in batches with a commit per batch (see
+migration_runner.py for --batch-size, --workers, --checkpoint,
+--max-rows-per-second and --dry-run).
+
+Formulas using AGE, YEARS_SINCE, MONTHS_SINCE or DAYS_SINCE depend on today's date;
+run this daily (e.g. from cron) to keep those values current, or after changing
+submission data outside the API. It is idempotent.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+try:
+    from sqlmodel import Session, select
+except ModuleNotFoundError as exc:  # pragma: no cover
+    raise SystemExit(
+        "Missing dependency 'sqlmodel'. Run with the backend uv project:\n"
+        "  uv run --project backend python backend/scripts/recompute_calculated_fields.py\n"
+        "or:\n"
+        "  cd backend && uv run python scripts/recompute_calculated_fields.py"
+    ) from exc
+
+_this_file = Path(__file__).resolve()
+_backend_dir = _this_file.parents[1]
+_repo_root = _backend_dir.parent
+
+# Load env vars (DATABASE_URL, etc.) if present.
+try:  # pragma: no cover
+    from dotenv import load_dotenv
+
+    load_dotenv(_backend_dir / ".env")
+    load_dotenv(_repo_root / ".env")
+except Exception:
+    pass
+
+# Allow imports whether invoked from repo root, backend/, or backend/scripts.
+sys.path.insert(0, str(_repo_root))
+sys.path.insert(0, str(_backend_dir))
+
+# migration_runner imports the backend modules flat (like the app does), so the
+# models must come from the same module path or their tables get defined twice.
+from database import engine
+from form_validator import get_compiled_form
+from formulas import calculated_fields
+from migration_runner import add_runner_arguments, run_from_args
+from models import Form
+
+TODAY = date.today()
+
+
+def migrate(form: Form, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return get_compiled_form(form).calculate(data, TODAY)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("form_ids", nargs="*", type=UUID, help="Only these forms (default: every form with calculated fields)")
+    add_runner_arguments(parser)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        statement = select(Form)
+        if args.form_ids:
+            statement = statement.where(Form.id.in_(args.form_ids))  # type: ignore[union-attr]
+        form_ids = [form.id for form in session.exec(statement).all() if calculated_fields(form.schema_)]
+
+    # Dated, so a checkpoint from an earlier day does not skip today's run.
+    stats = run_from_args(f"recompute_calculated_fields-{TODAY.isoformat()}", migrate, args, form_ids)
+
+    print(f"Recomputed forms: {len(form_ids)}")
+    print(f"Scanned submissions: {stats.scanned}")
+    print(f"Updated submissions: {stats.updated}{' (dry-run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    main()
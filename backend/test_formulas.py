@@ -0,0 +1,141 @@
+"""Calculated-field formulas against what the form renderer (useCalculatedValues.ts) shows.
+
+Run from the backend directory:
+    uv run --with pytest pytest test_formulas.py
+"""
+
+from datetime import date
+
+import pytest
+
+from form_validator import CompiledForm
+from formulas import FormulaError, compile_formula, parse_formula
+
+TODAY = date(2026, 10, 18)
+
+
+def calc(formula, data=None):
+    return compile_formula(formula)(data or {}, TODAY)
+
+
+@pytest.mark.parametrize(
+    "formula, expected",
+    [
+        ("1 + 2 * 3", 7),
+        ("(1 + 2) * 3", 9),
+        ("10 - 4 - 3", 3),
+        ("24 / 4 / 2", 3),
+        ("2 * 3 + 4 * 5", 26),
+        ("7 / 2", 3.5),
+        ("1.5 * 2", 3),
+        (".5 + .25", 0.75),
+    ],
+)
+def test_precedence_and_associativity(formula, expected):
+    assert calc(formula) == expected
+
+
+@pytest.mark.parametrize(
+    "formula, expected",
+    [
+        ("-3", -3),
+        ("--3", 3),
+        ("-(1 + 2) / 4", -0.75),
+        ("2 * -3", -6),
+        ("+4 - -1", 5),
+        ("-{a} * 2", -10),
+    ],
+)
+def test_unary_minus_and_plus(formula, expected):
+    assert calc(formula, {"a": 5}) == expected
+
+
+@pytest.mark.parametrize("formula", ["1 / 0", "{a} / {b}", "{a} / ({b} - {b})"])
+def test_division_by_zero_stores_null(formula):
+    assert calc(formula, {"a": 1, "b": 0}) is None
+
+
+def test_non_finite_results_store_null():
+    assert calc("{a} * {a}", {"a": 1e300}) is None
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (3, 6),
+        (2.5, 5),
+        ("7x", 14),  # parseFloat reads the leading number
+        (" .5", 1),
+        ("1e3", 2000),
+        ("abc", 0),
+        ("", 0),
+        (None, 0),
+        (True, 0),  # parseFloat(true) is NaN, so 0
+        ({"amount": 4}, 0),
+        ([1, 2], 0),
+    ],
+)
+def test_references_read_numbers_like_the_renderer(value, expected):
+    assert calc("{a} * 2", {"a": value}) == expected
+
+
+def test_unknown_reference_reads_zero():
+    assert calc("{missing} + 1", {"a": 5}) == 1
+
+
+@pytest.mark.parametrize(
+    "formula, birth, expected",
+    [
+        ("AGE({d})", "2000-10-18", 26),
+        ("AGE({d})", "2000-10-19", 25),
+        ("YEARS_SINCE({d})", "2000-02-29", 26),
+        ("MONTHS_SINCE({d})", "2026-08-18", 2),
+        ("MONTHS_SINCE({d})", "2026-08-19", 1),
+        ("DAYS_SINCE({d})", "2026-10-01", 17),
+        ("YEAR({d})", "1990-12-31T10:00:00Z", 1990),
+        ("MONTH({d})", "1990-12-31", 12),
+        ("DAY({d})", "1990-12-31", 31),
+        ("age({d}) + 1", "2000-10-18", 27),  # function names are case-insensitive
+        ("AGE({d})", "", 0),
+        ("AGE({d})", "not a date", 0),
+        ("AGE({d})", None, 0),
+        ("AGE({missing})", "2000-10-18", 0),
+    ],
+)
+def test_date_functions(formula, birth, expected):
+    assert calc(formula, {"d": birth}) == expected
+
+
+@pytest.mark.parametrize("formula", ["(1", "1 2", "", "{a} % 2", "FOO({a})", "AGE(3)", "1 +", "* 2", "1 $ 2"])
+def test_malformed_formulas_do_not_parse(formula):
+    with pytest.raises(FormulaError):
+        parse_formula(formula)
+
+
+@pytest.mark.parametrize("formula", ["(1", "1 2", "", "{a} % 2", "FOO({a})", None])
+def test_malformed_formulas_store_null(formula):
+    assert calc(formula, {"a": 1}) is None
+
+
+def test_whole_numbers_are_stored_as_integers():
+    assert isinstance(calc("6 / 2"), int)
+    assert isinstance(calc("7 / 2"), float)
+
+
+def test_compiled_form_evaluates_every_formula_against_the_submitted_data():
+    form = CompiledForm(
+        [
+            {"id": "a", "key": "a", "type": "number"},
+            {"id": "x", "key": "x", "type": "calculated", "formula": "{a} * 2"},
+            {"id": "y", "key": "y", "type": "calculated", "formula": "{x} + 1"},
+            {"id": "z", "key": "z", "type": "calculated", "formula": "{a} /"},
+        ]
+    )
+    # As in the renderer, {x} reads the submitted value, not the x computed alongside it.
+    assert form.calculate({"a": 3}, TODAY) == {"a": 3, "x": 6, "y": 1, "z": None}
+    assert form.calculate({"a": 3, "x": 10}, TODAY) == {"a": 3, "x": 6, "y": 11, "z": None}
+
+
+def test_compiled_form_without_calculated_fields_returns_data_unchanged():
+    data = {"a": 1}
+    assert CompiledForm([{"id": "a", "key": "a", "type": "number"}]).calculate(data, TODAY) is data
@@ -0,0 +1,106 @@
+"""Result cache for `GET /views/{view_id}/data`.
+
+Every form has a write version that `forms_router` bumps whenever one of its
+submissions is created, updated or deleted, or the form itself changes. A cached
+result is keyed by the view id, a hash of its config and query parameters, and the
+current versions of the forms the view reads, so a write to any involved form makes
+the old entry unreachable instead of having to find and delete it. Each stored result
+gets its own ETag, so a client revalidating a result that is still cached can be
+answered with 304 Not Modified without running the join.
+
+Versions live in this process: writes made by other processes (or directly in SQL)
+are only picked up when entries expire after VIEW_CACHE_TTL_SECONDS.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from cache import CacheBackend, TTLCache
+
+VIEW_CACHE_TTL_SECONDS = float(os.getenv("VIEW_CACHE_TTL_SECONDS", "300"))
+VIEW_CACHE_MAX_SIZE = int(os.getenv("VIEW_CACHE_MAX_SIZE", "256"))
+
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+_results: CacheBackend = TTLCache(max_size=VIEW_CACHE_MAX_SIZE)
+
+requests_counter = metrics.counter("view_cache_requests_total", "View data requests by cache result (hit/miss/not_modified)")
+
+
+def _form_key(form_id: Any) -> str:
+    try:
+        return str(uuid.UUID(str(form_id)))
+    except ValueError:
+        return str(form_id)
+
+
+def bump_form_version(form_id: Any) -> None:
+    """Record a write to `form_id`; cached results of views reading it become stale."""
+    key = _form_key(form_id)
+    with _versions_lock:
+        _versions[key] = _versions.get(key, 0) + 1
+
+
+def form_version(form_id: Any) -> int:
+    """Write version of `form_id` in this process (0 until its first write)."""
+    with _versions_lock:
+        return _versions.get(_form_key(form_id), 0)
+
+
+def involved_form_ids(config: dict) -> List[str]:
+    """Forms whose submissions a view reads: its base form and every column's form."""
+    ids = {_form_key(c.get("formId")) for c in config.get("columns", []) if c.get("formId")}
+    if config.get("baseFormId"):
+        ids.add(_form_key(config["baseFormId"]))
+    return sorted(ids)
+
+
+def result_key(view_id: Any, config: dict, params: Dict[str, Any], extra_form_ids: Iterable[Any] = ()) -> str:
+    """Cache key for one view query at the current form versions.
+
+    `extra_form_ids` are other forms the result reads (e.g. where relation labels come from).
+    """
+    form_ids = sorted(set(involved_form_ids(config)) | {_form_key(form_id) for form_id in extra_form_ids})
+    with _versions_lock:
+        versions = [_versions.get(form_id, 0) for form_id in form_ids]
+    payload = json.dumps(
+        [str(view_id), config, params, form_ids, versions],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def get_result(key: str) -> Optional[Tuple[str, bytes, Optional[str]]]:
+    """(etag, JSON body, next cursor) of a cached result."""
+    cached = _results.get(key)
+    if cached is None:
+        return None
+    etag, body, next_cursor = cached
+    return etag, body, next_cursor
+
+
+def store_result(key: str, body: bytes, next_cursor: Optional[str]) -> str:
+    """Cache a freshly computed (encoded) result and return its ETag."""
+    etag = uuid.uuid4().hex
+    _results.set(key, (etag, body, next_cursor), VIEW_CACHE_TTL_SECONDS)
+    return etag
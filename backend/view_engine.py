@@ -0,0 +1,336 @@
+"""Compile a View's config into a single SQL query over submission JSONB.
+
+A view is anchored on its base form: every base submission yields one row per
+combination of child submissions, where a child is a submission of another form in
+the view that references the base submission through a relation field. Children are
+found through the `SubmissionRelation` edge index (see relation_index.py) rather than
+by unpacking every child's relation values on each query. Joins, projection and the
+`maxRows` guardrail all run inside Postgres so only the projected columns of the
+returned rows ever reach Python.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import sqlalchemy as sa
+from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Session
+from sqlmodel.sql.sqltypes import UTCDateTime
+
+from form_schema import column_storage_keys, is_relation_field, relation_target_form_id, schema_field
+from jsonb_filters import decode_cursor, encode_cursor, json_value, value_predicate
+from models import Form, Submission, SubmissionRelation
+
+submission_table = Submission.__table__
+relation_table = SubmissionRelation.__table__
+
+DEFAULT_MAX_ROWS = 2000
+
+# Stands in for "no child picked" in row keys so keyset comparisons never see NULL.
+NIL_UUID = UUID(int=0)
+
+
+def _parse_uuid(value: Any) -> Optional[UUID]:
+    if not value:
+        return None
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return None
+
+
+def relation_edges(child_form_id: UUID, relation_fields: List[dict], parent_id: Any, name: str) -> Any:
+    """Lateral subquery of the distinct children of `parent_id` in one child form.
+
+    Reads the `SubmissionRelation` edge index, restricted to the given relation fields.
+    """
+    field_ids = [str(field.get("id") or field["key"]) for field in relation_fields]
+    return (
+        sa.select(relation_table.c.child_id)
+        .where(
+            relation_table.c.parent_id == parent_id,
+            relation_table.c.child_form_id == child_form_id,
+            relation_table.c.field_id.in_(field_ids),
+        )
+        .distinct()
+        .lateral(name)
+    )
+
+
+class CompiledView:
+    """A view config compiled to one SELECT.
+
+    `rows()` returns the view the way it has always been served (join order, capped at
+    `maxRows`); `page()` returns one keyset page ordered by (sort value, row key).
+    """
+
+    def __init__(
+        self,
+        selected: List[Any],
+        from_clause: Any,
+        where: List[Any],
+        order_by: List[Any],
+        columns: List[Tuple[str, str]],
+        column_exprs: Dict[str, Any],
+        created_at: Any,
+        key_parts: List[Any],
+        max_rows: Optional[int],
+        column_fields: Optional[Dict[str, Optional[dict]]] = None,
+    ):
+        self.selected = selected
+        self.from_clause = from_clause
+        self.where = where
+        self.order_by = order_by
+        self.columns = columns
+        self.column_exprs = column_exprs
+        self.created_at = created_at
+        self.key_parts = key_parts
+        self.max_rows = max_rows
+        # Schema field behind each column id (None when the form or field is gone).
+        self.column_fields = column_fields or {}
+
+    def conditions(self, filters: Sequence[Tuple[str, str, Optional[str]]] = ()) -> List[Any]:
+        """WHERE clauses of the view plus one predicate per (column id, operator, value) filter."""
+        conditions = list(self.where)
+        for col_id, operator, operand in filters:
+            if col_id not in self.column_exprs:
+                raise HTTPException(status_code=400, detail=f"Unknown view column '{col_id}'")
+            conditions.append(value_predicate(self.column_exprs[col_id], operator, operand))
+        return conditions
+
+    def _select(self, filters: Sequence[Tuple[str, str, Optional[str]]]) -> Any:
+        return sa.select(*self.selected).select_from(self.from_clause).where(*self.conditions(filters))
+
+    def statement(self, filters: Sequence[Tuple[str, str, Optional[str]]] = (), capped: bool = True) -> Any:
+        """SELECT in join order; `capped=False` drops the maxRows limit (streaming exports)."""
+        statement = self._select(filters).order_by(*self.order_by)
+        if capped and self.max_rows is not None:
+            statement = statement.limit(self.max_rows)
+        return statement
+
+    def to_row(self, record: Any) -> Dict[str, Any]:
+        row: Dict[str, Any] = {
+            "id": record["row_id"],
+            "created_at": record["created_at"].isoformat(),
+            "form_id": str(record["form_id"]),
+        }
+        for col_id, label in self.columns:
+            row[col_id] = record[label]
+        return row
+
+    def rows(self, session: Session, filters: Sequence[Tuple[str, str, Optional[str]]] = ()) -> List[Dict[str, Any]]:
+        return [self.to_row(record) for record in session.exec(self.statement(filters)).mappings()]
+
+    def page(
+        self,
+        session: Session,
+        *,
+        sort: Optional[str] = None,
+        filters: Sequence[Tuple[str, str, Optional[str]]] = (),
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return (rows, next_cursor) for one page.
+
+        `sort` is a view column id or `created_at`, prefixed with `-` for descending.
+        Ties are broken by the base and child submission ids, so every row has a unique
+        key and a cursor resumes exactly after the last row it was taken from.
+        """
+        sort = sort or "created_at"
+        descending = sort.startswith("-")
+        sort_key = sort[1:] if descending else sort
+        if sort_key == "created_at":
+            sort_expr = self.created_at
+        elif sort_key in self.column_exprs:
+            sort_expr = sa.func.coalesce(self.column_exprs[sort_key], sa.cast(sa.literal("null"), JSONB))
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown sort column '{sort_key}'")
+
+        keys = [sort_expr, *self.key_parts]
+        statement = self._select(filters).add_columns(*(k.label(f"_key{i}") for i, k in enumerate(keys)))
+
+        if cursor:
+            values = decode_cursor(cursor, len(keys) + 1)
+            if values[0] != sort:
+                raise HTTPException(status_code=400, detail="Cursor was issued for a different sort")
+            after = [_bind_key(k, v) for k, v in zip(keys, values[1:])]
+            if descending:
+                statement = statement.where(sa.tuple_(*keys) < sa.tuple_(*after))
+            else:
+                statement = statement.where(sa.tuple_(*keys) > sa.tuple_(*after))
+
+        page_size = limit or self.max_rows or DEFAULT_MAX_ROWS
+        statement = statement.order_by(*(k.desc() if descending else k.asc() for k in keys)).limit(page_size + 1)
+
+        records = list(session.exec(statement).mappings())
+        next_cursor = None
+        if len(records) > page_size:
+            records = records[:page_size]
+            last = records[-1]
+            next_cursor = encode_cursor([sort, *(last[f"_key{i}"] for i in range(len(keys)))])
+        return [self.to_row(record) for record in records], next_cursor
+
+
+def _bind_key(expr: Any, value: Any) -> Any:
+    """Bind a cursor value back with the SQL type of the key it came from."""
+    if isinstance(expr.type, JSONB):
+        return sa.literal(value, JSONB)
+    if isinstance(expr.type, (sa.DateTime, UTCDateTime)):
+        try:
+            return sa.literal(datetime.fromisoformat(str(value)), expr.type)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    parsed = _parse_uuid(value)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sa.literal(parsed, expr.type)
+
+
+def _compile_flat(columns: List[dict], form_ids: List[UUID], form_map: Dict[str, Form]) -> CompiledView:
+    """No anchor form: one row per submission of any involved form."""
+    s = submission_table.alias("s")
+    selected = [
+        sa.cast(s.c.id, sa.Text).label("row_id"),
+        s.c.created_at.label("created_at"),
+        s.c.form_id.label("form_id"),
+    ]
+    projected: List[Tuple[str, str]] = []
+    column_exprs: Dict[str, Any] = {}
+    column_fields: Dict[str, Optional[dict]] = {}
+    for i, column in enumerate(columns):
+        col_id = column.get("id")
+        target = _parse_uuid(column.get("formId"))
+        if not col_id:
+            continue
+        label = f"col_{i}"
+        form = form_map.get(str(target)) if target is not None else None
+        if target is None:
+            expr = sa.cast(sa.null(), JSONB)
+        else:
+            keys = column_storage_keys(form.schema_ if form else None, column.get("fieldKey"))
+            expr = sa.case((s.c.form_id == target, json_value(s.c.data, keys)), else_=sa.null())
+        selected.append(expr.label(label))
+        column_exprs[col_id] = expr
+        column_fields[col_id] = schema_field(form.schema_ if form else None, column.get("fieldKey"))
+        projected.append((col_id, label))
+
+    return CompiledView(
+        selected=selected,
+        from_clause=s,
+        where=[s.c.form_id.in_(form_ids)],
+        order_by=[s.c.created_at, s.c.id],
+        columns=projected,
+        column_exprs=column_exprs,
+        created_at=s.c.created_at,
+        key_parts=[s.c.id],
+        max_rows=None,
+        column_fields=column_fields,
+    )
+
+
+def compile_view(config: Dict[str, Any], form_map: Dict[str, Form]) -> Optional[CompiledView]:
+    """Compile `view.config` into a CompiledView, or None when no column names a form.
+
+    `form_map` maps form id strings to the forms referenced by the view's columns.
+    """
+    columns = [c for c in config.get("columns", []) if isinstance(c, dict)]
+
+    form_ids: List[UUID] = []
+    for column in columns:
+        fid = _parse_uuid(column.get("formId"))
+        if fid is not None and fid not in form_ids:
+            form_ids.append(fid)
+    if not form_ids:
+        return None
+
+    base_form_id_str = config.get("baseFormId")
+    if not base_form_id_str:
+        # Default to the first column's form as the anchor.
+        base_form_id_str = columns[0].get("formId") if columns else None
+    base_form_id = _parse_uuid(base_form_id_str)
+
+    if base_form_id is None:
+        return _compile_flat(columns, form_ids, form_map)
+
+    base_key = str(base_form_id)
+    base = submission_table.alias("b")
+
+    # Child forms in column order; each joins in through its relation fields that target the base form.
+    child_form_keys: List[str] = []
+    for column in columns:
+        fid = column.get("formId")
+        if fid and fid != base_key and fid not in child_form_keys:
+            child_form_keys.append(fid)
+
+    joined = base
+    order_by = [base.c.created_at, base.c.id]
+    child_aliases: Dict[str, Any] = {}
+    for i, fid in enumerate(child_form_keys):
+        child_form = form_map.get(fid)
+        relation_fields = [
+            f
+            for f in (child_form.schema_ if child_form else None) or []
+            if is_relation_field(f)
+            and (f.get("id") or f.get("key"))
+            and str(relation_target_form_id(f)) == base_key
+        ]
+        if not relation_fields:
+            continue
+        edges = relation_edges(child_form.id, relation_fields, base.c.id, f"e{i}")
+        child = submission_table.alias(f"c{i}")
+        joined = joined.outerjoin(edges, sa.true())
+        joined = joined.outerjoin(child, child.c.id == edges.c.child_id)
+        order_by.extend([child.c.created_at, child.c.id])
+        child_aliases[fid] = child
+
+    # Row id: base id followed by the picked child per child form (sorted by form id), "-" when none.
+    id_parts = [sa.cast(base.c.id, sa.Text)]
+    key_parts = [base.c.id]
+    for fid in sorted(child_form_keys):
+        child = child_aliases.get(fid)
+        if child is None:
+            id_parts.append(sa.literal("-"))
+            continue
+        id_parts.append(sa.func.coalesce(sa.cast(child.c.id, sa.Text), "-"))
+        key_parts.append(sa.func.coalesce(child.c.id, sa.literal(NIL_UUID, child.c.id.type), type_=child.c.id.type))
+    row_id = sa.func.concat_ws(":", *id_parts) if len(id_parts) > 1 else id_parts[0]
+
+    selected = [row_id.label("row_id"), base.c.created_at.label("created_at"), base.c.form_id.label("form_id")]
+    projected: List[Tuple[str, str]] = []
+    column_exprs: Dict[str, Any] = {}
+    column_fields: Dict[str, Optional[dict]] = {}
+    for i, column in enumerate(columns):
+        col_id = column.get("id")
+        if not col_id:
+            continue
+        fid = column.get("formId")
+        source = base if fid == base_key else child_aliases.get(fid)
+        label = f"col_{i}"
+        form = form_map.get(fid)
+        if source is None:
+            expr = sa.cast(sa.null(), JSONB)
+        else:
+            keys = column_storage_keys(form.schema_ if form else None, column.get("fieldKey"))
+            expr = json_value(source.c.data, keys)
+        selected.append(expr.label(label))
+        column_exprs[col_id] = expr
+        column_fields[col_id] = schema_field(form.schema_ if form else None, column.get("fieldKey"))
+        projected.append((col_id, label))
+
+    # Guardrail to prevent runaway cartesian explosions.
+    max_rows = int(config.get("maxRows") or DEFAULT_MAX_ROWS)
+
+    return CompiledView(
+        selected=selected,
+        from_clause=joined,
+        where=[base.c.form_id == base_form_id],
+        order_by=order_by,
+        columns=projected,
+        column_exprs=column_exprs,
+        created_at=base.c.created_at,
+        key_parts=key_parts,
+        max_rows=max_rows,
+        column_fields=column_fields,
+    )